@@ -0,0 +1,90 @@
+"""
+Микробенчмарк CPU на одно выполнение блоков с клавиатурами и карточки товара.
+
+"до" - клавиатура/текст собираются при каждом выполнении (как раньше),
+"после" - execute отправляет payload, подготовленный при загрузке сценария.
+Сеть не используется: бот-заглушка ничего не отправляет, но сериализует
+reply_markup так же, как telebot перед запросом.
+
+    python benchmark_blocks.py [итераций]
+"""
+import logging
+import sys
+import time
+
+from telebot import types
+
+from blocks.button_block import ButtonBlock
+from blocks.inline_button_block import InlineButtonBlock
+from blocks.product_block import ProductBlock
+
+logging.disable(logging.CRITICAL)
+
+
+class NullBot:
+    """Бот-заглушка: повторяет преобразование reply_markup из telebot (_convert_markup)"""
+
+    def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        if isinstance(reply_markup, types.JsonSerializable):
+            reply_markup = reply_markup.to_json()
+        return reply_markup
+
+
+def buttons(count):
+    return [{'id': f'b{i}', 'label': f'Вариант ответа {i}'} for i in range(count)]
+
+
+def node(block_type, **data):
+    return {'id': f'{block_type}-1', 'type': block_type, 'data': data}
+
+
+def render_each_time(block, bot, chat_id):
+    """Поведение до изменения: сборка payload внутри каждого выполнения"""
+    text, markup = block._render()
+    if text is not None:
+        bot.send_message(chat_id, text, reply_markup=markup)
+
+
+def product_each_time(block, bot, chat_id):
+    bot.send_message(chat_id=chat_id, text=block._format_product_message(), parse_mode='Markdown')
+
+
+def measure(execute, block, iterations):
+    bot = NullBot()
+    started = time.process_time()
+    for chat_id in range(iterations):
+        execute(block, bot, chat_id)
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    cases = [
+        ("button, 12 кнопок в столбик", ButtonBlock,
+         node('button', label='Выберите вариант', buttons=buttons(12))),
+        ("button, 24 кнопки по 3 в ряд", ButtonBlock,
+         node('button', label='Выберите вариант', buttons=buttons(24), buttonLayout='row', buttonsPerRow=3)),
+        ("inline_button, 12 кнопок", InlineButtonBlock,
+         node('inline_button', label='Выберите вариант', buttons=buttons(12))),
+        ("inline_button, 24 кнопки по 4 в ряд", InlineButtonBlock,
+         node('inline_button', label='Выберите вариант', buttons=buttons(24), buttonLayout='row', buttonsPerRow=4)),
+    ]
+
+    print(f"{'блок':<40}{'до, мкс':>10}{'после, мкс':>12}{'ускорение':>11}")
+    for name, block_class, node_data in cases:
+        block = block_class(node_data)
+        before = measure(render_each_time, block, iterations)
+        after = measure(lambda b, bot, chat_id: b.execute(bot, chat_id), block, iterations)
+        print(f"{name:<40}{before:>10.1f}{after:>12.1f}{before / after:>10.1f}x")
+
+    product = ProductBlock(node(
+        'product_card', title='Кофемашина', description='Автоматическая, 15 бар', price='24 990 ₽',
+        features=[{'key': f'Параметр {i}', 'value': f'Значение {i}'} for i in range(10)]
+    ))
+    before = measure(product_each_time, product, iterations)
+    after = measure(lambda b, bot, chat_id: b.execute(bot, chat_id), product, iterations)
+    print(f"{'product_card, 10 характеристик':<40}{before:>10.1f}{after:>12.1f}{before / after:>10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
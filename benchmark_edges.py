@@ -0,0 +1,80 @@
+"""
+Микробенчмарк CPU на один переход по связям сценария при росте числа связей.
+
+"до" - следующий узел ищется линейным обходом списка связей (как раньше),
+"после" - EdgeIndex и план исполнения, построенные при загрузке сценария.
+Узлы для переходов выбираются равномерно по всему сценарию, поэтому
+время "до" растет с числом связей, а время "после" должно оставаться ровным.
+
+    python benchmark_edges.py [переходов]
+"""
+import logging
+import random
+import sys
+import time
+
+from core.edge_index import EdgeIndex
+from core.scenario_runner import ScenarioRunner
+
+logging.disable(logging.CRITICAL)
+
+EDGE_COUNTS = (100, 1000, 10000, 25000, 50000)
+
+
+def scenario(edge_count):
+    """Цепочка вопросов с кнопками 'далее' и 'назад': две связи на узел"""
+    node_count = edge_count // 2 + 1
+    buttons = [{'id': 'next', 'label': 'Далее'}, {'id': 'back', 'label': 'Назад'}]
+    nodes = [{'id': 'n0', 'type': 'start', 'data': {}}]
+    nodes += [{'id': f'n{i}', 'type': 'button', 'data': {'label': f'Шаг {i}', 'buttons': buttons}}
+              for i in range(1, node_count)]
+    edges = []
+    for i in range(node_count - 1):
+        edges.append({'source': f'n{i}', 'target': f'n{i + 1}', 'sourceHandle': 'next'})
+        edges.append({'source': f'n{i}', 'target': f'n{max(i - 1, 0)}', 'sourceHandle': 'back'})
+    return {'nodes': nodes, 'edges': edges}
+
+
+def linear_next_node_id(edges, current_node_id, handle_id=None):
+    """Поведение до изменения: обход всех связей при каждом переходе"""
+    for edge in edges:
+        if edge.get('source') == current_node_id:
+            if handle_id is None or edge.get('sourceHandle') == handle_id:
+                return edge.get('target')
+    return None
+
+
+def measure(lookup, transitions):
+    started = time.process_time()
+    for node_id, handle_id in transitions:
+        lookup(node_id, handle_id)
+    return (time.process_time() - started) / len(transitions) * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(1)
+
+    print(f"{'связей':>8}{'до, мкс':>12}{'EdgeIndex, мкс':>16}{'план, мкс':>12}{'ускорение':>12}")
+    for edge_count in EDGE_COUNTS:
+        data = scenario(edge_count)
+        edges = data['edges']
+        node_count = len(data['nodes'])
+        transitions = [(f'n{rng.randrange(node_count - 1)}', rng.choice(('next', 'back', None)))
+                       for _ in range(iterations)]
+
+        index = EdgeIndex(edges)
+        runner = ScenarioRunner(data)
+        # Индексы дают те же переходы, что и линейный обход
+        for node_id, handle_id in transitions:
+            assert runner.get_next_node_id(node_id, handle_id) == linear_next_node_id(edges, node_id, handle_id)
+
+        before = measure(lambda node_id, handle_id: linear_next_node_id(edges, node_id, handle_id), transitions)
+        indexed = measure(index.next_node_id, transitions)
+        planned = measure(runner.get_next_node_id, transitions)
+        print(f"{len(edges):>8}{before:>12.2f}{indexed:>16.3f}{planned:>12.3f}{before / planned:>11.0f}x")
+        runner.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Микробенчмарк CPU на проверку одного сообщения блоками keyword_processor при росте числа ключевых слов.
+
+"до" - каждый блок по очереди ищет каждое свое слово через re.search(r'\\b...\\b') (как раньше),
+"regex" - то же с шаблонами, скомпилированными заранее (без учета кеша модуля re),
+"после" - KeywordMatcher: все слова всех блоков в одном автомате Ахо-Корасик, один проход по сообщению.
+Слова распределены по блокам по 50 штук, точное совпадение, без учета регистра.
+
+    python benchmark_keywords.py [сообщений]
+"""
+import logging
+import random
+import re
+import sys
+import time
+
+from core.keyword_matcher import KeywordMatcher
+
+logging.disable(logging.CRITICAL)
+
+KEYWORD_COUNTS = (100, 1000, 5000, 20000)
+KEYWORDS_PER_BLOCK = 50
+SYLLABLES = ['ка', 'ро', 'ми', 'ла', 'ту', 'не', 'зо', 'пи', 'да', 'ше', 'вы', 'со', 'гу', 'ре', 'ба', 'ли']
+# Слоги остальных слов сообщения: они не совпадают с ключевыми словами
+NOISE_SYLLABLES = ['мо', 'ве', 'ку', 'ти', 'ра', 'жа', 'фо', 'хи']
+
+
+def words(count, rng, syllables=SYLLABLES):
+    """Уникальные псевдослова из 2-4 слогов"""
+    result = set()
+    while len(result) < count:
+        result.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(result)
+
+
+def blocks(keywords):
+    return [keywords[i:i + KEYWORDS_PER_BLOCK] for i in range(0, len(keywords), KEYWORDS_PER_BLOCK)]
+
+
+def messages(keywords, count, rng):
+    """Сообщения по 10 слов; в трети из них есть одно ключевое слово"""
+    noise = words(200, random.Random(0), NOISE_SYLLABLES)
+    result = []
+    for i in range(count):
+        text = [rng.choice(noise).capitalize() if j == 0 else rng.choice(noise) for j in range(10)]
+        if i % 3 == 0:
+            text[rng.randrange(10)] = rng.choice(keywords).upper()
+        result.append(' '.join(text) + '!')
+    return result
+
+
+def search_each_time(keyword_blocks, message):
+    """Поведение до изменения: шаблон собирается и ищется для каждого слова каждого блока"""
+    search_message = message.lower()
+    for order, keywords in enumerate(keyword_blocks):
+        for keyword in keywords:
+            if re.search(r'\b' + re.escape(keyword.lower()) + r'\b', search_message):
+                return order, keyword
+    return None
+
+
+def compile_patterns(keyword_blocks):
+    return [[(keyword, re.compile(r'\b' + re.escape(keyword.lower()) + r'\b')) for keyword in keywords]
+            for keywords in keyword_blocks]
+
+
+def search_compiled(compiled_blocks, message):
+    search_message = message.lower()
+    for order, patterns in enumerate(compiled_blocks):
+        for keyword, pattern in patterns:
+            if pattern.search(search_message):
+                return order, keyword
+    return None
+
+
+def measure(match, texts):
+    started = time.process_time()
+    results = [match(text) for text in texts]
+    return (time.process_time() - started) / len(texts) * 1e6, results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    rng = random.Random(1)
+
+    print(f"{'слов':>7}{'блоков':>8}{'до, мкс':>11}{'regex, мкс':>12}{'после, мкс':>12}{'ускорение':>11}")
+    for keyword_count in KEYWORD_COUNTS:
+        keyword_blocks = blocks(words(keyword_count, rng))
+        texts = messages([keyword for keywords in keyword_blocks for keyword in keywords], count, rng)
+        compiled_blocks = compile_patterns(keyword_blocks)
+        matcher = KeywordMatcher((order, keywords, False, 'exact') for order, keywords in enumerate(keyword_blocks))
+
+        before, expected = measure(lambda text: search_each_time(keyword_blocks, text), texts)
+        compiled, compiled_results = measure(lambda text: search_compiled(compiled_blocks, text), texts)
+        after, results = measure(matcher.match, texts)
+        # Все способы находят один и тот же блок и слово
+        assert expected == compiled_results == results
+        print(f"{keyword_count:>7}{len(keyword_blocks):>8}{before:>11.1f}{compiled:>12.1f}{after:>12.1f}"
+              f"{before / after:>10.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import telebot
 import logging
+from core.edge_index import EdgeIndex
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +28,22 @@ class BaseBlock(ABC):
         """
         pass
 
+    def prepare(self, **context):
+        """
+        Вызывается один раз после загрузки сценария (bot_dir, scenario_data)
+        Блоки могут переопределить метод, чтобы заранее подготовить данные
+        """
+        pass
+
+    def media_sources(self) -> List[Tuple[str, str]]:
+        """Медиа блока для предзагрузки: список (вид - photo/video/audio/document, путь или URL)"""
+        return []
+
     def get_next_node_id(self, edges, handle_id: Optional[str] = None) -> Optional[str]:
-        """Находит следующий узел на основе связей"""
+        """Находит следующий узел на основе связей (EdgeIndex или список edges)"""
+        if isinstance(edges, EdgeIndex):
+            return edges.next_node_id(self.node_data.get('id'), handle_id)
+
         logger.warning(
             "⚠️ Используется устаревший метод get_next_node_id. Используйте ScenarioRunner.get_next_node_id()")
         for edge in edges:
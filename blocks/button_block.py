@@ -1,15 +1,24 @@
 from .base_block import BaseBlock
 import telebot
 from typing import Dict, Any, Optional
+from core.templates import compile_template, user_variables
 
 
 class ButtonBlock(BaseBlock):
 
+    def __init__(self, node_data: Dict[str, Any]):
+        super().__init__(node_data)
+        # Текст и клавиатура не зависят от пользователя - собираем один раз при загрузке сценария
+        self.message_text, self.reply_markup = self._render()
+        # {{переменные}} в тексте подставляются при отправке, сам шаблон разбирается здесь
+        self.template = compile_template(self.message_text) if self.message_text is not None else None
+
     @staticmethod
     def get_block_type() -> str:
         return "button"
 
-    def execute(self, bot: telebot.TeleBot, chat_id: int, **kwargs) -> Optional[str]:
+    def _render(self):
+        """Возвращает (текст, JSON клавиатуры или None); текст None, если кнопок нет"""
         buttons = self.node_data.get('data', {}).get('buttons', [])
         hide_keyboard = self.node_data.get('data', {}).get('hideKeyboard', False)
         layout = self.node_data.get('data', {}).get('buttonLayout', 'column')  # 'row' или 'column'
@@ -17,7 +26,7 @@ class ButtonBlock(BaseBlock):
         message_text = self.node_data.get('data', {}).get('label', '')  # Текст сообщения с кнопками
         
         if not buttons:
-            return None
+            return None, None
 
         # Создаем клавиатуру
         if hide_keyboard:
@@ -25,37 +34,45 @@ class ButtonBlock(BaseBlock):
             button_text = "Варианты ответа:\n"
             for i, button in enumerate(buttons):
                 button_text += f"{i+1}. {button.get('label', '')}\n"
-            bot.send_message(chat_id, button_text)
-        else:
-            # Обычная клавиатура
-            markup = telebot.types.ReplyKeyboardMarkup(
-                one_time_keyboard=True,
-                resize_keyboard=True
-            )
-
-            if layout == 'row':
-                # Ограничиваем количество кнопок в ряду от 1 до 8
-                buttons_per_row = max(1, min(8, buttons_per_row))
-                
-                # Размещаем кнопки в ряды по указанному количеству
-                current_row = []
-                for i, button in enumerate(buttons):
-                    current_row.append(telebot.types.KeyboardButton(button.get('label', '')))
-                    
-                    # Добавляем ряд если набралось нужное количество кнопок или это последняя кнопка
-                    if len(current_row) == buttons_per_row or i == len(buttons) - 1:
-                        markup.row(*current_row)  # Используем row() для горизонтального размещения
-                        current_row = []
-            else:
-                # Размещаем кнопки в столбик (по умолчанию)
-                for button in buttons:
-                    markup.add(telebot.types.KeyboardButton(button.get('label', '')))
-
-            # Отправляем клавиатуру с настраиваемым текстом или невидимым символом
-            if not message_text or not message_text.strip():
-                message_text = "\u200B"  # Невидимый символ вместо текста
+            return button_text, None
+
+        # Обычная клавиатура
+        markup = telebot.types.ReplyKeyboardMarkup(
+            one_time_keyboard=True,
+            resize_keyboard=True
+        )
+
+        if layout == 'row':
+            # Ограничиваем количество кнопок в ряду от 1 до 8
+            buttons_per_row = max(1, min(8, buttons_per_row or 8))
             
-            bot.send_message(chat_id, message_text, reply_markup=markup)
+            # Размещаем кнопки в ряды по указанному количеству
+            current_row = []
+            for i, button in enumerate(buttons):
+                current_row.append(telebot.types.KeyboardButton(button.get('label', '')))
+                
+                # Добавляем ряд если набралось нужное количество кнопок или это последняя кнопка
+                if len(current_row) == buttons_per_row or i == len(buttons) - 1:
+                    markup.row(*current_row)  # Используем row() для горизонтального размещения
+                    current_row = []
+        else:
+            # Размещаем кнопки в столбик (по умолчанию)
+            for button in buttons:
+                markup.add(telebot.types.KeyboardButton(button.get('label', '')))
+
+        # Отправляем клавиатуру с настраиваемым текстом или невидимым символом
+        if not message_text or not message_text.strip():
+            message_text = "\u200B"  # Невидимый символ вместо текста
+
+        # telebot передает строку reply_markup как есть - сериализуем один раз
+        return message_text, markup.to_json()
+
+    def execute(self, bot: telebot.TeleBot, chat_id: int, **kwargs) -> Optional[str]:
+        if self.template is None:
+            return None
+
+        message_text = self.template.render(user_variables(kwargs.get('user_context')), chat_id=chat_id)
+        bot.send_message(chat_id, message_text, reply_markup=self.reply_markup)
 
         # Для кнопок следующий узел определяется при нажатии
-        return None
\ No newline at end of file
+        return None
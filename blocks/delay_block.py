@@ -2,6 +2,7 @@ from .base_block import BaseBlock
 import telebot
 from typing import Dict, Any, Optional
 import time
+from core.execution_plan import SUSPEND_CHAIN
 
 
 class DelayBlock(BaseBlock):
@@ -10,12 +11,14 @@ class DelayBlock(BaseBlock):
     def get_block_type() -> str:
         return "delay"
 
+    def get_delay_parts(self):
+        """Returns (hours, minutes, seconds) from node data"""
+        data = self.node_data.get('data', {})
+        return data.get('hours', 0) or 0, data.get('minutes', 0) or 0, data.get('seconds', 0) or 0
+
     def execute(self, bot: telebot.TeleBot, chat_id: int, **kwargs) -> Optional[str]:
         # Get delay values from node data
-        data = self.node_data.get('data', {})
-        hours = data.get('hours', 0)
-        minutes = data.get('minutes', 0)
-        seconds = data.get('seconds', 0)
+        hours, minutes, seconds = self.get_delay_parts()
         
         # Calculate total delay in seconds
         total_delay = hours * 3600 + minutes * 60 + seconds
@@ -29,7 +32,13 @@ class DelayBlock(BaseBlock):
                 # If we can't send the message, we still continue with the delay
                 pass
             
-            # Execute the delay
+            # Schedule the continuation instead of blocking the handler thread
+            scheduler = kwargs.get('timer_scheduler')
+            if scheduler is not None:
+                scheduler.schedule(chat_id, self.node_data.get('id'), total_delay)
+                return SUSPEND_CHAIN
+
+            # Execute the delay (no scheduler, e.g. runner without a bot attached)
             time.sleep(total_delay)
         
         # Return None to let ScenarioRunner find the next node
@@ -1,18 +1,44 @@
 from .base_block import BaseBlock
 import telebot
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+from core.media_cache import MediaCache, get_media_cache, group_media
 import logging
 import os
 
 logger = logging.getLogger(__name__)
 
 
+# Расширение файла -> вид медиа (остальные файлы отправляются документом)
+MEDIA_KINDS = {
+    **dict.fromkeys(['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'], 'photo'),
+    **dict.fromkeys(['.mp4', '.avi', '.mkv', '.mov', '.webm'], 'video'),
+    **dict.fromkeys(['.mp3', '.wav', '.ogg', '.m4a', '.flac'], 'audio'),
+}
+MEDIA_ICONS = {'photo': '📷', 'video': '🎥', 'audio': '🎵', 'document': '📄'}
+
+
 class FileBlock(BaseBlock):
 
+    def __init__(self, node_data: Dict[str, Any]):
+        super().__init__(node_data)
+        self.media_cache: MediaCache = get_media_cache(None)
+
     @staticmethod
     def get_block_type() -> str:
         return "file"
 
+    def prepare(self, **context):
+        # Общий кеш file_id бота: файл загружается в Telegram один раз
+        self.media_cache = get_media_cache(context.get('bot_dir'))
+
+    def media_sources(self) -> List[Tuple[str, str]]:
+        sources = []
+        for file_info in self.node_data.get('data', {}).get('files', []) or []:
+            file_path = (file_info.get('path') or '').strip()
+            if file_path and os.path.exists(file_path):
+                sources.append((MEDIA_KINDS.get(os.path.splitext(file_path)[1].lower(), 'document'), file_path))
+        return sources
+
     def execute(self, bot: telebot.TeleBot, chat_id: int, **kwargs) -> Optional[str]:
         files = self.node_data.get('data', {}).get('files', [])
         caption = self.node_data.get('data', {}).get('caption', '')
@@ -24,6 +50,8 @@ class FileBlock(BaseBlock):
             return None
 
         try:
+            items = []
+            names = {}
             for file_info in files:
                 file_path = file_info.get('path', '').strip()
                 file_name = file_info.get('name', '').strip()
@@ -40,47 +68,37 @@ class FileBlock(BaseBlock):
                 
                 # Определяем тип файла по расширению
                 file_extension = os.path.splitext(file_path)[1].lower()
-                
+                kind = MEDIA_KINDS.get(file_extension, 'document')
+                icon = MEDIA_ICONS[kind]
+                file_caption = caption if len(files) == 1 else f"{caption}\n{icon} {file_name}" if caption else f"{icon} {file_name}"
+                items.append((kind, file_path, file_caption))
+                names[file_path] = file_name or file_path
+
+            # Совместимые файлы уходят альбомами до 10 штук: один запрос вместо запроса на файл.
+            # Файл загружается один раз, дальше отправляется по file_id из кеша бота
+            for group in group_media(items):
                 try:
-                    with open(file_path, 'rb') as file:
-                        if file_extension in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']:
-                            # Отправляем как фото
-                            bot.send_photo(
-                                chat_id, 
-                                file, 
-                                caption=caption if len(files) == 1 else f"{caption}\n📷 {file_name}" if caption else f"📷 {file_name}"
-                            )
-                        elif file_extension in ['.mp4', '.avi', '.mkv', '.mov', '.webm']:
-                            # Отправляем как видео
-                            bot.send_video(
-                                chat_id, 
-                                file, 
-                                caption=caption if len(files) == 1 else f"{caption}\n🎥 {file_name}" if caption else f"🎥 {file_name}"
-                            )
-                        elif file_extension in ['.mp3', '.wav', '.ogg', '.m4a', '.flac']:
-                            # Отправляем как аудио
-                            bot.send_audio(
-                                chat_id, 
-                                file, 
-                                caption=caption if len(files) == 1 else f"{caption}\n🎵 {file_name}" if caption else f"🎵 {file_name}"
-                            )
-                        else:
-                            # Отправляем как документ
-                            bot.send_document(
-                                chat_id, 
-                                file, 
-                                caption=caption if len(files) == 1 else f"{caption}\n📄 {file_name}" if caption else f"📄 {file_name}"
-                            )
-                        
-                        logger.info(f"✅ Файл отправлен: {file_name or file_path}")
-                        
-                except Exception as file_error:
-                    logger.error(f"❌ Ошибка отправки файла {file_path}: {file_error}")
-                    bot.send_message(chat_id, f"❌ Ошибка отправки файла: {file_name or file_path}")
+                    self.media_cache.send_group(bot, chat_id, group)
+                    logger.info(f"✅ Отправлено файлов: {len(group)}")
+                except Exception as group_error:
+                    if len(group) == 1:
+                        self._report_error(bot, chat_id, group[0][1], names, group_error)
+                        continue
+                    logger.warning(f"⚠️ Альбом не отправлен ({group_error}), отправляем файлы по одному")
+                    for kind, file_path, file_caption in group:
+                        try:
+                            self.media_cache.send(bot, kind, chat_id, file_path, caption=file_caption)
+                        except Exception as file_error:
+                            self._report_error(bot, chat_id, file_path, names, file_error)
 
         except Exception as e:
             logger.error(f"❌ Ошибка выполнения файлового блока: {e}")
             bot.send_message(chat_id, "❌ Ошибка отправки файлов")
 
         # Возвращаем None, чтобы ScenarioRunner сам нашел следующий узел
-        return None
\ No newline at end of file
+        return None
+
+    @staticmethod
+    def _report_error(bot: telebot.TeleBot, chat_id: int, file_path: str, names: Dict[str, str], error: Exception):
+        logger.error(f"❌ Ошибка отправки файла {file_path}: {error}")
+        bot.send_message(chat_id, f"❌ Ошибка отправки файла: {names[file_path]}")
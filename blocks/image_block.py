@@ -1,25 +1,58 @@
 from .base_block import BaseBlock
 import telebot
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+from core.media_cache import MediaCache, get_media_cache, group_media
 
 
 class ImageBlock(BaseBlock):
 
+    def __init__(self, node_data: Dict[str, Any]):
+        super().__init__(node_data)
+        self.media_cache: MediaCache = get_media_cache(None)
+
     @staticmethod
     def get_block_type() -> str:
         return "image"
 
+    def prepare(self, **context):
+        self.media_cache = get_media_cache(context.get('bot_dir'))
+
+    def _image_urls(self) -> List[str]:
+        """Ссылки блока: основная url и дополнительные images без повторов"""
+        data = self.node_data.get('data', {})
+        urls = [data.get('url') or ''] + list(data.get('images') or [])
+        return list(dict.fromkeys(url.strip() for url in urls if url and url.strip()))
+
+    def media_sources(self) -> List[Tuple[str, str]]:
+        return [('photo', image_url) for image_url in self._image_urls()]
+
     def execute(self, bot: telebot.TeleBot, chat_id: int, **kwargs) -> Optional[str]:
-        image_url = self.node_data.get('data', {}).get('url', '')
-        if not image_url:
+        image_urls = self._image_urls()
+        if not image_urls:
             return None
 
-        # Пытаемся отправить изображение
-        try:
-            bot.send_photo(chat_id, image_url)
-        except Exception as e:
-            # Если не удалось, отправляем ссылку
+        # Ссылки, которые Telegram недавно не смог загрузить, сразу отправляем текстом
+        failed = [image_url for image_url in image_urls if self.media_cache.has_failed_source(image_url)]
+        available = [image_url for image_url in image_urls if image_url not in failed]
+
+        # Несколько изображений уходят альбомами до 10 штук (по file_id, если Telegram их уже загружал)
+        for group in group_media([('photo', image_url, None) for image_url in available]):
+            try:
+                self.media_cache.send_group(bot, chat_id, group)
+            except Exception:
+                if len(group) == 1:
+                    failed.append(group[0][1])
+                    continue
+                # Альбом не принят целиком (например, из-за одной ссылки) - отправляем по одной
+                for _, image_url, _ in group:
+                    try:
+                        self.media_cache.send(bot, 'photo', chat_id, image_url)
+                    except Exception:
+                        failed.append(image_url)
+
+        # Если не удалось, отправляем ссылку
+        for image_url in failed:
             bot.send_message(chat_id, f"🖼️ Изображение: {image_url}")
 
         # Возвращаем None, чтобы ScenarioRunner сам нашел следующий узел
-        return None
\ No newline at end of file
+        return None
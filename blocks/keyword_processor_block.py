@@ -1,7 +1,7 @@
 from blocks.base_block import BaseBlock
 from typing import Dict, List, Any, Optional
 import logging
-import re
+from core.keyword_matcher import KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +25,9 @@ class KeywordProcessorBlock(BaseBlock):
         
         # Получаем режим сопоставления (точное совпадение или частичное)
         self.match_mode = self.data.get('matchMode', 'exact')  # 'exact' или 'partial'
+
+        # Компилируем ключевые слова один раз, а не на каждое сообщение
+        self.matcher = KeywordMatcher([(self.node_data.get('id'), self.keywords, self.case_sensitive, self.match_mode)])
         
         logger.info(f"Создан блок обработки ключевых слов: {self.keywords}")
 
@@ -133,30 +136,8 @@ class KeywordProcessorBlock(BaseBlock):
         Returns:
             Optional[str]: Найденное ключевое слово или None
         """
-        # Подготавливаем сообщение в зависимости от чувствительности к регистру
-        search_message = message if self.case_sensitive else message.lower()
-        
-        # Проверяем каждое ключевое слово
-        for keyword in self.keywords:
-            if not keyword:  # Пропускаем пустые ключевые слова
-                continue
-                
-            # Подготавливаем ключевое слово в зависимости от чувствительности к регистру
-            search_keyword = keyword if self.case_sensitive else keyword.lower()
-            
-            # Проверяем в зависимости от режима сопоставления
-            if self.match_mode == 'exact':
-                # Точное совпадение - ключевое слово должно быть отдельным словом
-                # Используем регулярное выражение для поиска отдельных слов
-                pattern = r'\b' + re.escape(search_keyword) + r'\b'
-                if re.search(pattern, search_message):
-                    return keyword
-            else:
-                # Частичное совпадение - ключевое слово может быть частью другого слова
-                if search_keyword in search_message:
-                    return keyword
-                    
-        return None
+        match = self.matcher.match(message)
+        return match[1] if match else None
 
     def to_dict(self) -> Dict[str, Any]:
         """Преобразует блок в словарь для сохранения"""
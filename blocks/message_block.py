@@ -1,18 +1,24 @@
 from .base_block import BaseBlock
 import telebot
 from typing import Dict, Any, Optional
+from core.templates import compile_template, user_variables
 
 
 class MessageBlock(BaseBlock):
 
+    def __init__(self, node_data: Dict[str, Any]):
+        super().__init__(node_data)
+        # Текст с {{переменными}} компилируется один раз при загрузке сценария
+        self.template = compile_template(self.node_data.get('data', {}).get('label', ''))
+
     @staticmethod
     def get_block_type() -> str:
         return "message"
 
     def execute(self, bot: telebot.TeleBot, chat_id: int, **kwargs) -> Optional[str]:
-        message_text = self.node_data.get('data', {}).get('label', '')
+        message_text = self.template.render(user_variables(kwargs.get('user_context')), chat_id=chat_id)
         if message_text:
             bot.send_message(chat_id, message_text)
 
         # Возвращаем None, чтобы ScenarioRunner сам нашел следующий узел
-        return None
\ No newline at end of file
+        return None
@@ -4,6 +4,7 @@ from typing import Dict, Any, Optional
 import logging
 import json
 import re
+from core.intent_classifier import IntentClassifier, load_bot_intents
 
 logger = logging.getLogger(__name__)
 
@@ -32,10 +33,54 @@ class NLPResponseBlock(BaseBlock):
         "default": "Спасибо за ваше сообщение! Я постараюсь помочь вам с этим вопросом. Можете уточнить, что именно вам нужно?"
     }
     
+    # Классификатор встроенной базы знаний общий для всех блоков без своих интентов
+    _default_classifier: Optional[IntentClassifier] = None
+
+    def __init__(self, node_data: Dict[str, Any]):
+        super().__init__(node_data)
+        self.classifier: Optional[IntentClassifier] = None
+        self.confidence_threshold = 0.0
+
     @staticmethod
     def get_block_type() -> str:
         return "nlp_response"
 
+    @classmethod
+    def get_default_classifier(cls) -> IntentClassifier:
+        """Возвращает классификатор, построенный по встроенной базе знаний"""
+        if cls._default_classifier is None:
+            intents = [
+                {"name": category, "examples": keywords, "response": cls.RESPONSES.get(category)}
+                for category, keywords in cls.KNOWLEDGE_BASE.items()
+            ]
+            cls._default_classifier = IntentClassifier(intents, default_response=cls.RESPONSES["default"])
+        return cls._default_classifier
+
+    def prepare(self, **context):
+        """Собирает классификатор: интенты узла, затем intents.json бота, затем встроенная база"""
+        data = self.node_data.get('data', {})
+        inline_intents = data.get('intents')
+        if inline_intents:
+            self.classifier = IntentClassifier(inline_intents, default_response=self.RESPONSES["default"])
+        else:
+            self.classifier = load_bot_intents(context.get('bot_dir')) or self.get_default_classifier()
+
+        # Порог уверенности: из узла, затем из набора интентов; 0 - блок отвечает на любое сообщение
+        threshold = data.get('confidenceThreshold')
+        if threshold is None:
+            threshold = self.classifier.threshold
+        self.confidence_threshold = float(threshold or 0.0)
+
+    def classify(self, user_message: str):
+        """Возвращает (интент, уверенность) для сообщения пользователя"""
+        if self.classifier is None:
+            self.prepare()
+        return self.classifier.classify(user_message)
+
+    def accepts(self, confidence: float) -> bool:
+        """Проверяет, достаточно ли уверенности, чтобы блок ответил, а не передал сообщение дальше"""
+        return self.confidence_threshold <= 0.0 or confidence >= self.confidence_threshold
+
     def execute(self, bot: telebot.TeleBot, chat_id: int, **kwargs) -> Optional[str]:
         """Выполняет обработку сообщения пользователя и формирует ответ"""
         try:
@@ -46,8 +91,9 @@ class NLPResponseBlock(BaseBlock):
                 bot.send_message(chat_id, "Пожалуйста, отправьте текстовое сообщение.")
                 return None
             
-            # Анализируем сообщение и формируем ответ
-            response = self.generate_response(user_message.lower())
+            # Используем уже посчитанный интент, если сообщение пришло через маршрутизацию
+            intent, confidence = kwargs.get('nlp_intent') or self.classify(user_message)
+            response = self.generate_response(user_message, intent=intent)
             
             # Отправляем ответ пользователю
             bot.send_message(chat_id, response)
@@ -59,16 +105,11 @@ class NLPResponseBlock(BaseBlock):
         # Возвращаем None, чтобы ScenarioRunner сам нашел следующий узел
         return None
 
-    def generate_response(self, user_message: str) -> str:
+    def generate_response(self, user_message: str, intent: Optional[str] = None) -> str:
         """Генерирует ответ на основе сообщения пользователя"""
-        # Проверяем совпадения с ключевыми словами
-        for category, keywords in self.KNOWLEDGE_BASE.items():
-            for keyword in keywords:
-                if keyword in user_message:
-                    return self.RESPONSES.get(category, self.RESPONSES["default"])
-        
-        # Если нет точных совпадений, используем ответ по умолчанию
-        return self.RESPONSES["default"]
+        if intent is None:
+            intent, _ = self.classify(user_message)
+        return self.classifier.get_response(intent) or self.RESPONSES["default"]
         
     def extract_entities(self, message: str) -> Dict[str, Any]:
         """Извлекает сущности из сообщения (для расширения функциональности)"""
@@ -1,4 +1,6 @@
 from blocks.base_block import BaseBlock
+from core.media_cache import get_media_cache
+from core.templates import compile_template, user_variables
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,25 +17,36 @@ class ProductBlock(BaseBlock):
         self.description = self.data.get('description', '')
         self.price = self.data.get('price', '')
         self.features = self.data.get('features', [])
+        self.media_cache = get_media_cache(None)
+        # Карточка форматируется один раз при загрузке сценария; значения {{переменных}}
+        # подставляются при отправке с экранированием Markdown
+        self.template = compile_template(self._format_product_message(), 'Markdown')
         
     @staticmethod
     def get_block_type() -> str:
         return "product_card"
+
+    def prepare(self, **context):
+        self.media_cache = get_media_cache(context.get('bot_dir'))
+
+    def media_sources(self):
+        return [('photo', self.photo_url)] if self.photo_url else []
         
     def execute(self, bot, chat_id, **kwargs):
         """Отправляет карточку товара пользователю"""
         try:
             logger.info(f"Executing ProductBlock for chat {chat_id}")
             
-            # Формируем сообщение с информацией о товаре
-            message_text = self._format_product_message()
+            message_text = self.template.render(user_variables(kwargs.get('user_context')), chat_id=chat_id)
             
             # Отправляем фото, если есть
             if self.photo_url:
                 try:
-                    bot.send_photo(
-                        chat_id=chat_id,
-                        photo=self.photo_url,
+                    self.media_cache.send(
+                        bot,
+                        'photo',
+                        chat_id,
+                        self.photo_url,
                         caption=message_text,
                         parse_mode='Markdown'
                     )
@@ -1,19 +1,110 @@
 from .base_block import BaseBlock
 import telebot
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+from core.booking_store import build_slots, format_minutes, get_booking_store, parse_minutes
+from core.bot_identity import get_bot_identity
+from core.callback_router import build_slot_callback_data
+from core.crm_client import get_crm_client
+from core.execution_plan import INTERACTION_COMPLETE
+from core.templates import compile_template, set_variable, user_variables
 import datetime
-import requests
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Default booking confirmation; {{date}} and {{time}} are the chosen date and time
+DEFAULT_CONFIRMATION = "Вы записаны на {{date}} в {{time}}"
+
+# Time buttons per row of the free slots keyboard
+SLOTS_PER_ROW = 4
+
+# How many built free slots keyboards a block keeps
+KEYBOARD_CACHE_SIZE = 256
+
 
 class ScheduleBlock(BaseBlock):
 
+    def __init__(self, node_data: Dict[str, Any]):
+        super().__init__(node_data)
+        data = self.node_data.get('data', {})
+        self.confirmation_template = compile_template(data.get('confirmationMessage') or DEFAULT_CONFIRMATION)
+        # Slots of a working day from workStartTime/workEndTime/timeInterval: (start, end) in minutes
+        self.slots: List[Tuple[int, int]] = build_slots(
+            data.get('workStartTime', '09:00'), data.get('workEndTime', '18:00'), data.get('timeInterval', 30)
+        )
+        self._slot_ends: Dict[int, int] = dict(self.slots)
+        self.booking_store = get_booking_store(None)
+        # (date, free slot starts) -> serialized inline keyboard
+        self._keyboards: Dict[Tuple[str, Tuple[int, ...]], str] = {}
+
     @staticmethod
     def get_block_type() -> str:
         return "schedule"
 
+    def prepare(self, **context):
+        # Bookings are shared by all schedule blocks of the bot and survive restarts
+        self.booking_store = get_booking_store(context.get('bot_dir'))
+
+    def free_slots(self, date_str: str, crm_endpoint: Optional[str] = None) -> List[Tuple[int, int]]:
+        """Free slots of the date: not booked, not in the past and, if the CRM sent day slots, free there"""
+        not_before = None
+        now = datetime.datetime.now()
+        if date_str == now.strftime('%Y-%m-%d'):
+            not_before = now.hour * 60 + now.minute
+        free = self.booking_store.free_slots(self.node_data.get('id'), date_str, self.slots, not_before)
+        if crm_endpoint and free:
+            day = get_crm_client().day(crm_endpoint, date_str)
+            if day is not None and day.slots is not None:
+                free = [slot for slot in free if day.time_available(format_minutes(slot[0]))]
+        return free
+
+    def _slot_keyboard(self, date_str: str, starts: Tuple[int, ...]) -> str:
+        """Inline keyboard of free slots; built once per set of free slots"""
+        key = (date_str, starts)
+        keyboard = self._keyboards.get(key)
+        if keyboard is None:
+            markup = telebot.types.InlineKeyboardMarkup(row_width=SLOTS_PER_ROW)
+            markup.add(*[
+                telebot.types.InlineKeyboardButton(
+                    text=format_minutes(start),
+                    callback_data=build_slot_callback_data(self.node_data.get('id'), date_str, format_minutes(start))
+                )
+                for start in starts
+            ])
+            keyboard = markup.to_json()
+            if len(self._keyboards) >= KEYBOARD_CACHE_SIZE:
+                self._keyboards.clear()
+            self._keyboards[key] = keyboard
+        return keyboard
+
+    def _crm_endpoint(self, config: Dict[str, Any]) -> Optional[str]:
+        return config.get('crm_endpoint') if config.get('crm_integration') else None
+
+    def _ask_time(self, bot: telebot.TeleBot, chat_id: int, user_context: Dict[str, Any],
+                  free: Optional[List[Tuple[int, int]]] = None) -> bool:
+        """
+        Asks for time with the free slots of the selected date as an inline keyboard
+        Returns: False if the date has no free slots left (the user is asked for another date)
+        """
+        config = user_context.get('schedule_config', {})
+        time_question = config.get('time_question', 'На какое время вы хотите записаться?')
+        selected_date = user_context.get('selected_date')
+        if not self.slots or not selected_date:
+            bot.send_message(chat_id, time_question)
+            return True
+
+        if free is None:
+            free = self.free_slots(selected_date, self._crm_endpoint(config))
+        if not free:
+            user_context.pop('selected_date', None)
+            bot.send_message(chat_id, "На эту дату нет свободного времени. Пожалуйста, выберите другую дату.")
+            bot.send_message(chat_id, self.node_data.get('data', {}).get('dateQuestion', 'На какую дату вы хотите записаться?'))
+            return False
+
+        keyboard = self._slot_keyboard(selected_date, tuple(start for start, _ in free))
+        bot.send_message(chat_id, time_question, reply_markup=keyboard)
+        return True
+
     def execute(self, bot: telebot.TeleBot, chat_id: int, **kwargs) -> Optional[str]:
         # Get configuration parameters
         data = self.node_data.get('data', {})
@@ -30,6 +121,8 @@ class ScheduleBlock(BaseBlock):
         
         # Store configuration in user context for later use
         user_context = kwargs.get('user_context', {})
+        # A new booking starts with the date question, even if a previous one was left unfinished
+        user_context.pop('selected_date', None)
         user_context['schedule_config'] = {
             'time_question': time_question,
             'time_interval': time_interval,
@@ -138,10 +231,8 @@ class ScheduleBlock(BaseBlock):
                 except ValueError:
                     pass  # Invalid maxDate format, ignore
             
-            # Store selected date in user context in YYYY-MM-DD format
-            user_context['selected_date'] = selected_date.strftime('%Y-%m-%d')
-            
-            # Check CRM availability if enabled
+            # Check CRM availability if enabled. The same request prefetches the day's slots,
+            # so the time step is answered from the CRM client cache
             crm_integration = data.get('crmIntegration', False)
             if crm_integration:
                 crm_endpoint = data.get('crmEndpoint', '')
@@ -154,10 +245,23 @@ class ScheduleBlock(BaseBlock):
                         bot.send_message(chat_id, date_question)
                         return None
             
-            # Ask for time
-            config = user_context.get('schedule_config', {})
-            time_question = config.get('time_question', 'На какое время вы хотите записаться?')
-            bot.send_message(chat_id, time_question)
+            # A date without free slots is rejected right away
+            free = None
+            if self.slots:
+                free = self.free_slots(selected_date.strftime('%Y-%m-%d'),
+                                       data.get('crmEndpoint') if crm_integration else None)
+                if not free:
+                    bot.send_message(chat_id, "На эту дату нет свободного времени. Пожалуйста, выберите другую дату.")
+                    date_question = data.get('dateQuestion', 'На какую дату вы хотите записаться?')
+                    bot.send_message(chat_id, date_question)
+                    return None
+            
+            # Store selected date in user context in YYYY-MM-DD format (only once it is accepted,
+            # otherwise the next date answer would be taken for a time)
+            user_context['selected_date'] = selected_date.strftime('%Y-%m-%d')
+            
+            # Ask for time, offering the free slots
+            self._ask_time(bot, chat_id, user_context, free)
             
             return None
         except Exception as e:
@@ -216,8 +320,7 @@ class ScheduleBlock(BaseBlock):
             if parsed_time is None:
                 bot.send_message(chat_id, "Неверный формат времени. Пожалуйста, введите время в формате ЧЧ:ММ (например, 14:30) или ЧЧ.ММ (например, 14.30)")
                 # Ask for time again
-                time_question = config.get('time_question', 'На какое время вы хотите записаться?')
-                bot.send_message(chat_id, time_question)
+                self._ask_time(bot, chat_id, user_context)
                 return None
             
             # Format time as HH:MM
@@ -235,10 +338,28 @@ class ScheduleBlock(BaseBlock):
                         unavailable_message = config.get('unavailable_message', 'Извините, это время уже занято. Пожалуйста, выберите другое.')
                         bot.send_message(chat_id, unavailable_message)
                         # Ask for time again
-                        time_question = config.get('time_question', 'На какое время вы хотите записаться?')
-                        bot.send_message(chat_id, time_question)
+                        self._ask_time(bot, chat_id, user_context)
                         return None
             
+            # Reserve the slot in the bot's booking ledger: only working-hours slots are accepted,
+            # and of two users picking the same slot only the first one gets it
+            if self.slots and selected_date:
+                start = parse_minutes(formatted_time)
+                if start not in self._slot_ends:
+                    bot.send_message(chat_id, "Пожалуйста, выберите время из предложенных вариантов.")
+                    self._ask_time(bot, chat_id, user_context)
+                    return None
+                now = datetime.datetime.now()
+                in_past = selected_date == now.strftime('%Y-%m-%d') and start < now.hour * 60 + now.minute
+                booking_id = None if in_past else self.booking_store.reserve(
+                    self.node_data.get('id'), selected_date, start, self._slot_ends[start], chat_id
+                )
+                if booking_id is None:
+                    unavailable_message = config.get('unavailable_message', 'Извините, это время уже занято. Пожалуйста, выберите другое.')
+                    bot.send_message(chat_id, unavailable_message)
+                    self._ask_time(bot, chat_id, user_context)
+                    return None
+            
             # If we reach here, the date and time are valid
             # Send confirmation to user
             if selected_date:
@@ -249,20 +370,30 @@ class ScheduleBlock(BaseBlock):
                 except ValueError:
                     formatted_date = selected_date
                 
-                confirmation = f"Вы записаны на {formatted_date} в {formatted_time}"
+                # The booking is available to the following blocks as the node variable
+                set_variable(user_context, self.node_data.get('data', {}).get('variableName'),
+                             f"{formatted_date} {formatted_time}")
+                confirmation = self.confirmation_template.render(
+                    user_variables(user_context), chat_id=chat_id, date=formatted_date, time=formatted_time
+                )
                 bot.send_message(chat_id, confirmation)
             
             # Send information to bot administrator
             self.send_to_administrator(bot, chat_id, selected_date, formatted_time, user_context, kwargs)
             
-            # Return next node ID (None means we're done with this interaction)
-            return None
+            # The booking is complete: the next schedule answer starts from the date again
+            user_context.pop('selected_date', None)
+            if crm_integration and config.get('crm_endpoint') and selected_date:
+                # Cached slots of this day no longer reflect the CRM
+                get_crm_client().invalidate(config.get('crm_endpoint'), selected_date)
+            
+            # The interaction is over: the runner leaves this node and continues the scenario
+            return INTERACTION_COMPLETE
         except Exception as e:
             logger.error(f"Error processing time response: {e}")
             bot.send_message(chat_id, "Неверный формат времени. Пожалуйста, введите время в формате ЧЧ:ММ (например, 14:30) или ЧЧ.ММ (например, 14.30)")
             # Ask for time again
-            time_question = config.get('time_question', 'На какое время вы хотите записаться?')
-            bot.send_message(chat_id, time_question)
+            self._ask_time(bot, chat_id, user_context)
             return None
 
     def send_to_administrator(self, bot: telebot.TeleBot, user_chat_id: int, date_str: str, time_str: str, user_context: dict, kwargs: dict):
@@ -285,9 +416,8 @@ class ScheduleBlock(BaseBlock):
                 logger.warning("Admin chat ID not configured. Sending notification to user instead.")
                 admin_chat_id = user_chat_id
             
-            # Get bot information to include in the message
-            bot_info = bot.get_me()
-            bot_username = bot_info.username if bot_info.username else "Неизвестный бот"
+            # Bot username comes from the process-wide getMe cache, not a request per booking
+            bot_username = get_bot_identity().bot_username(bot) or "Неизвестный бот"
             
             # Create message for administrator
             admin_message = f"""
@@ -309,25 +439,9 @@ class ScheduleBlock(BaseBlock):
             logger.error(f"Error sending information to administrator: {e}")
 
     def check_crm_date_availability(self, crm_endpoint: str, date_str: str) -> bool:
-        """Check date availability with CRM"""
-        try:
-            response = requests.get(f"{crm_endpoint}?date={date_str}")
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('available', True)
-            return True  # Default to available if CRM is unreachable
-        except Exception as e:
-            logger.error(f"Error checking CRM date availability: {e}")
-            return True  # Default to available if CRM is unreachable
+        """Check date availability with CRM (defaults to available if CRM is unreachable)"""
+        return get_crm_client().date_available(crm_endpoint, date_str)
 
     def check_crm_time_availability(self, crm_endpoint: str, date_str: str, time_str: str) -> bool:
-        """Check time availability with CRM"""
-        try:
-            response = requests.get(f"{crm_endpoint}?date={date_str}&time={time_str}")
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('available', True)
-            return True  # Default to available if CRM is unreachable
-        except Exception as e:
-            logger.error(f"Error checking CRM time availability: {e}")
-            return True  # Default to available if CRM is unreachable
\ No newline at end of file
+        """Check time availability with CRM (defaults to available if CRM is unreachable)"""
+        return get_crm_client().time_available(crm_endpoint, date_str, time_str)
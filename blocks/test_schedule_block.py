@@ -0,0 +1,128 @@
+"""
+Сценарий с блоком расписания целиком: дата -> время -> следующий узел.
+
+    python -m unittest blocks.test_schedule_block
+"""
+import datetime
+import json
+import logging
+import unittest
+from types import SimpleNamespace
+
+from core.scenario_runner import ScenarioRunner
+from core.session_store import MemorySessionStore
+
+logging.disable(logging.CRITICAL)
+
+CHAT_ID = 42
+ADMIN_CHAT_ID = 7
+
+
+class RecordingBot:
+    """Бот-заглушка: запоминает отправленные сообщения"""
+
+    token = None
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self.sent.append((chat_id, text, reply_markup))
+
+    def answer_callback_query(self, *args, **kwargs):
+        pass
+
+    def edit_message_reply_markup(self, *args, **kwargs):
+        pass
+
+    def get_me(self):
+        return SimpleNamespace(username='test_bot')
+
+    def texts(self, chat_id=CHAT_ID):
+        return [text for sent_chat_id, text, _ in self.sent if sent_chat_id == chat_id]
+
+
+def message(text, chat_id=CHAT_ID):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), text=text,
+                           from_user=SimpleNamespace(id=chat_id, username='user'))
+
+
+def scenario():
+    return {
+        'nodes': [
+            {'id': 'start', 'type': 'start', 'data': {}},
+            {'id': 'sch', 'type': 'schedule', 'data': {
+                'workStartTime': '10:00', 'workEndTime': '12:00', 'timeInterval': 30,
+                'adminChatId': ADMIN_CHAT_ID,
+            }},
+            {'id': 'thanks', 'type': 'message', 'data': {'label': 'Спасибо за запись!'}},
+        ],
+        'edges': [
+            {'source': 'start', 'target': 'sch'},
+            {'source': 'sch', 'target': 'thanks'},
+        ],
+    }
+
+
+class ScheduleFlowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = ScenarioRunner(scenario(), session_store=MemorySessionStore())
+        self.bot = RecordingBot()
+        self.date = (datetime.date.today() + datetime.timedelta(days=3)).strftime('%Y-%m-%d')
+        self.runner.run_chain(self.bot, CHAT_ID, self.runner.get_start_node_id())
+
+    def tearDown(self):
+        self.runner.close()
+
+    def test_booking_continues_to_successor(self):
+        self.assertEqual(self.runner.get_active_node(CHAT_ID), 'sch')
+
+        self.assertTrue(self.runner.handle_text_message(self.bot, message(self.date)))
+        keyboard = json.loads(self.bot.sent[-1][2])
+        self.assertEqual([button['text'] for row in keyboard['inline_keyboard'] for button in row],
+                         ['10:00', '10:30', '11:00', '11:30'])
+
+        self.assertTrue(self.runner.handle_text_message(self.bot, message('10:00')))
+
+        texts = self.bot.texts()
+        self.assertIn('Вы записаны на', texts[-2])
+        self.assertEqual(texts[-1], 'Спасибо за запись!')
+        self.assertEqual(len(self.bot.texts(ADMIN_CHAT_ID)), 1)
+        self.assertIsNone(self.runner.get_active_node(CHAT_ID))
+        self.assertNotIn('selected_date', self.runner.get_user_context(CHAT_ID))
+
+        # Чат больше не в блоке расписания: свободный текст не считается датой
+        sent_before = len(self.bot.sent)
+        self.assertFalse(self.runner.handle_text_message(self.bot, message('привет')))
+        self.assertEqual(len(self.bot.sent), sent_before)
+
+    def test_slot_button_books_and_continues(self):
+        self.runner.handle_text_message(self.bot, message(self.date))
+        keyboard = json.loads(self.bot.sent[-1][2])
+        call = SimpleNamespace(id='1', data=keyboard['inline_keyboard'][0][1]['callback_data'],
+                               message=SimpleNamespace(chat=SimpleNamespace(id=CHAT_ID), message_id=1))
+
+        self.assertTrue(self.runner.handle_schedule_slot(self.bot, call))
+
+        self.assertEqual(self.bot.texts()[-1], 'Спасибо за запись!')
+        self.assertIsNone(self.runner.get_active_node(CHAT_ID))
+        booked = self.runner.nodes_map['sch'].booking_store.bookings('sch', self.date)
+        self.assertEqual([booking['start'] for booking in booked], ['10:30'])
+
+    def test_busy_slot_keeps_waiting_for_time(self):
+        other_chat_id = CHAT_ID + 1
+        self.runner.run_chain(self.bot, other_chat_id, 'sch')
+        self.runner.handle_text_message(self.bot, message(self.date, other_chat_id))
+        self.runner.handle_text_message(self.bot, message('10:00', other_chat_id))
+
+        self.runner.handle_text_message(self.bot, message(self.date))
+        self.runner.handle_text_message(self.bot, message('10:00'))
+
+        self.assertEqual(self.runner.get_active_node(CHAT_ID), 'sch')
+        self.assertNotIn('Спасибо за запись!', self.bot.texts())
+        self.assertEqual(self.runner.get_user_context(CHAT_ID).get('selected_date'), self.date)
+
+
+if __name__ == '__main__':
+    unittest.main()
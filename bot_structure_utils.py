@@ -10,6 +10,8 @@ import json
 from typing import Optional, Dict, Any
 from datetime import datetime
 
+from core.bot_storage import get_bot_storage
+
 # Путь к директории с ботами
 BOTS_DIR = "bots"
 
@@ -76,29 +78,30 @@ def create_bot_config(user_id: str, bot_id: str, bot_name: Optional[str] = None)
     """Создает конфигурационный файл для бота"""
     try:
         config_file = get_bot_config_file(user_id, bot_id)
-        
-        # Если файл уже существует, не перезаписываем его
-        if os.path.exists(config_file):
-            return True
-        
-        # Создаем конфигурационные данные
-        config_data = {
-            "bot_id": bot_id,
-            "user_id": user_id,
-            "bot_name": bot_name or f"Бот {bot_id}",
-            "created_at": datetime.now().isoformat(),
-            "last_modified": datetime.now().isoformat(),
-            "version": "1.0",
-            "settings": {
-                "active": True,
-                "notifications": True,
-                "auto_backup": False
+        storage = get_bot_storage()
+        
+        with storage.locked(config_file):
+            # Если файл уже существует, не перезаписываем его
+            if os.path.exists(config_file):
+                return True
+            
+            # Создаем конфигурационные данные
+            config_data = {
+                "bot_id": bot_id,
+                "user_id": user_id,
+                "bot_name": bot_name or f"Бот {bot_id}",
+                "created_at": datetime.now().isoformat(),
+                "last_modified": datetime.now().isoformat(),
+                "version": "1.0",
+                "settings": {
+                    "active": True,
+                    "notifications": True,
+                    "auto_backup": False
+                }
             }
-        }
         
-        # Сохраняем конфигурационный файл
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, ensure_ascii=False, indent=2)
+            # Сохраняем конфигурационный файл
+            storage.write_json(config_file, config_data)
         
         print(f"Конфигурационный файл для бота {bot_id} пользователя {user_id} создан")
         return True
@@ -111,30 +114,32 @@ def update_bot_config(user_id: str, bot_id: str, updates: Dict[str, Any]) -> boo
     """Обновляет конфигурационный файл бота"""
     try:
         config_file = get_bot_config_file(user_id, bot_id)
-        
-        # Если файл не существует, создаем его
-        if not os.path.exists(config_file):
-            create_bot_config(user_id, bot_id)
-        
-        # Загружаем существующие данные
-        with open(config_file, 'r', encoding='utf-8') as f:
-            config_data = json.load(f)
-        
-        # Обновляем данные
-        for key, value in updates.items():
-            if key in config_data:
-                config_data[key] = value
-            elif key in config_data.get("settings", {}):
-                config_data["settings"][key] = value
-            else:
-                config_data[key] = value
-        
-        # Обновляем время последнего изменения
-        config_data["last_modified"] = datetime.now().isoformat()
-        
-        # Сохраняем обновленные данные
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, ensure_ascii=False, indent=2)
+        storage = get_bot_storage()
+        
+        # Чтение и запись под блокировкой бота: параллельные обновления не теряют изменения друг друга
+        with storage.locked(config_file):
+            # Если файл не существует, создаем его
+            if not os.path.exists(config_file):
+                create_bot_config(user_id, bot_id)
+            
+            # Загружаем существующие данные
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config_data = json.load(f)
+            
+            # Обновляем данные
+            for key, value in updates.items():
+                if key in config_data:
+                    config_data[key] = value
+                elif key in config_data.get("settings", {}):
+                    config_data["settings"][key] = value
+                else:
+                    config_data[key] = value
+            
+            # Обновляем время последнего изменения
+            config_data["last_modified"] = datetime.now().isoformat()
+            
+            # Сохраняем обновленные данные
+            storage.write_json(config_file, config_data)
         
         print(f"Конфигурационный файл бота {bot_id} пользователя {user_id} обновлен")
         return True
@@ -159,9 +164,8 @@ def save_bot_scenario(user_id: str, bot_id: str, scenario_data: dict) -> bool:
         else:
             scenario_data["metadata"]["saved_at"] = datetime.now().isoformat()
         
-        # Сохраняем файл
-        with open(scenario_file, 'w', encoding='utf-8') as f:
-            json.dump(scenario_data, f, ensure_ascii=False, indent=2)
+        # Сохраняем файл (атомарно, под блокировкой бота)
+        get_bot_storage().write_json(scenario_file, scenario_data)
         
         print(f"Сценарий бота {bot_id} пользователя {user_id} сохранен в {scenario_file}")
         return True
@@ -176,6 +180,9 @@ def load_bot_scenario(user_id: str, bot_id: str) -> Optional[dict]:
         # Получаем путь к файлу сценария
         scenario_file = get_bot_scenario_file(user_id, bot_id)
         
+        # Отложенное автосохранение должно попасть в файл до чтения
+        get_bot_storage().flush(scenario_file)
+        
         # Проверяем существование файла
         if not os.path.exists(scenario_file):
             print(f"Файл сценария бота {bot_id} пользователя {user_id} не найден")
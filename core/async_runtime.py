@@ -0,0 +1,231 @@
+from typing import Callable, Dict, List, Optional, Tuple, Any
+from .bot_identity import get_bot_identity, is_invalid_token_error
+from .update_dispatcher import UpdateDispatcher, get_update_dispatcher, update_chat_id
+import asyncio
+import inspect
+import logging
+import os
+import threading
+
+try:
+    from telebot import asyncio_helper
+    from telebot.async_telebot import AsyncTeleBot
+except ImportError:  # Асинхронный клиент требует aiohttp
+    asyncio_helper = None
+    AsyncTeleBot = None
+
+logger = logging.getLogger(__name__)
+
+# Лимит соединений общей сессии aiohttp (0 - без лимита). Каждый бот постоянно держит
+# соединение long polling, поэтому лимит telebot по умолчанию (50) заблокировал бы отправку
+CONNECTION_LIMIT = int(os.getenv("ASYNC_CONNECTION_LIMIT", 0))
+
+# Параметры long polling
+POLLING_TIMEOUT = 20
+POLLING_ERROR_DELAY = 3
+
+# Пауза перед повторной постановкой обновления в заполненную очередь диспетчера
+SUBMIT_RETRY_DELAY = 0.05
+
+# Сколько ждать ответа Telegram API при вызове из синхронного кода
+SYNC_CALL_TIMEOUT = 60
+
+# Описание обработчика: (вид - message/callback_query, функция, фильтры register_*_handler)
+HandlerSpec = Tuple[str, Callable[[Any], None], Dict[str, Any]]
+
+
+def is_available() -> bool:
+    """Проверяет, установлен ли асинхронный клиент pyTelegramBotAPI"""
+    return AsyncTeleBot is not None
+
+
+class SyncBotAdapter:
+    """
+    Синхронный фасад над AsyncTeleBot для ScenarioRunner и блоков: вызовы API
+    выполняются в цикле событий среды, вызывающий поток ждет результат
+    """
+
+    def __init__(self, async_bot: 'AsyncTeleBot', loop: asyncio.AbstractEventLoop):
+        self._async_bot = async_bot
+        self._loop = loop
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._async_bot, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            coroutine = attribute(*args, **kwargs)
+            try:
+                running_loop = asyncio.get_running_loop()
+            except RuntimeError:
+                running_loop = None
+            if running_loop is self._loop:
+                coroutine.close()
+                raise RuntimeError(f"Синхронный вызов {name} из цикла событий заблокировал бы все боты")
+            return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(SYNC_CALL_TIMEOUT)
+
+        # Имя метода API нужно очереди отправки, чтобы решить, можно ли повторить вызов
+        call.__name__ = name
+        return call
+
+
+class AsyncBotHandle:
+    """Запущенный бот асинхронной среды; повторяет интерфейс потока (is_alive/join) и бота (stop_polling)"""
+
+    def __init__(self, bot_id: str, runtime: 'AsyncBotRuntime', bot: SyncBotAdapter,
+                 on_stop: Optional[Callable[['AsyncBotHandle'], None]] = None):
+        self.bot_id = bot_id
+        self.name = f"async_bot_{bot_id}"
+        self.bot = bot
+        self._runtime = runtime
+        self._on_stop = on_stop
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    def is_alive(self) -> bool:
+        return not self._stopped.is_set()
+
+    def join(self, timeout: Optional[float] = None):
+        self._stopped.wait(timeout)
+
+    def stop_polling(self):
+        """Останавливает polling бота (не ждет завершения)"""
+        task = self._task
+        if task is not None and not task.done():
+            self._runtime.loop.call_soon_threadsafe(task.cancel)
+
+    def _finish(self):
+        if self._on_stop:
+            try:
+                self._on_stop(self)
+            except Exception as e:
+                logger.error(f"❌ Ошибка завершения бота {self.bot_id}: {e}")
+        self._stopped.set()
+
+
+class AsyncBotRuntime:
+    """
+    Среда, в которой polling всех ботов идет в одном цикле событий asyncio,
+    а синхронные обработчики сценариев выполняет общий диспетчер обновлений
+    """
+
+    def __init__(self, dispatcher: Optional[UpdateDispatcher] = None):
+        if AsyncTeleBot is None:
+            raise RuntimeError("Для асинхронной среды нужен pyTelegramBotAPI с aiohttp")
+        asyncio_helper.REQUEST_LIMIT = CONNECTION_LIMIT
+        self.loop = asyncio.new_event_loop()
+        self.dispatcher = dispatcher or get_update_dispatcher()
+        self.bots: Dict[str, AsyncBotHandle] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run_loop, name="async-bots", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def add_bot(self, bot_id: str, token: str, setup: Callable[[SyncBotAdapter], List[HandlerSpec]],
+                on_stop: Optional[Callable[[AsyncBotHandle], None]] = None) -> AsyncBotHandle:
+        """
+        Подключает бота: setup(bot) получает синхронный фасад и возвращает обработчики,
+        on_stop(handle) вызывается после остановки polling. Завершение выполняется в фоне и может
+        прийти уже после запуска нового экземпляра того же бота - on_stop сверяет handle с текущим
+        """
+        self.stop_bot(bot_id)
+
+        async_bot = AsyncTeleBot(token)
+        bot = SyncBotAdapter(async_bot, self.loop)
+        for kind, callback, filters in setup(bot):
+            register = getattr(async_bot, f"register_{kind}_handler")
+            register(self._wrap_handler(bot_id, callback), **filters)
+
+        handle = AsyncBotHandle(bot_id, self, bot, on_stop)
+        with self._lock:
+            self.bots[bot_id] = handle
+
+        def start():
+            handle._task = self.loop.create_task(self._poll(handle, async_bot))
+
+        self.loop.call_soon_threadsafe(start)
+        logger.info(f"🧵 Бот {bot_id} подключен к асинхронной среде ({len(self.bots)} ботов)")
+        return handle
+
+    def stop_bot(self, bot_id: str, timeout: Optional[float] = None) -> bool:
+        """Останавливает polling бота; возвращает False, если бот не был запущен"""
+        with self._lock:
+            handle = self.bots.pop(bot_id, None)
+        if handle is None:
+            return False
+        handle.stop_polling()
+        if timeout:
+            handle.join(timeout)
+        return True
+
+    def _wrap_handler(self, bot_id: str, callback: Callable[[Any], None]):
+        """Обработчик для AsyncTeleBot: синхронная логика уходит в очередь чата, не блокируя цикл"""
+        async def handler(update):
+            key = (bot_id, update_chat_id(update))
+            while not self.dispatcher.submit(key, callback, update, block=False):
+                await asyncio.sleep(SUBMIT_RETRY_DELAY)
+        return handler
+
+    async def _poll(self, handle: AsyncBotHandle, async_bot: 'AsyncTeleBot'):
+        """
+        Long polling одного бота. Сессия aiohttp общая для всех ботов цикла,
+        поэтому при остановке бота она не закрывается (в отличие от AsyncTeleBot.polling)
+        """
+        try:
+            identity = get_bot_identity()
+            me = identity.peek(async_bot.token)
+            if me is None:
+                me = await async_bot.get_me()
+                identity.remember(async_bot.token, me)
+            logger.info(f"🤖 Бот @{me.username} запущен в асинхронной среде")
+            while True:
+                try:
+                    updates = await async_bot.get_updates(
+                        offset=async_bot.offset, timeout=POLLING_TIMEOUT, request_timeout=POLLING_TIMEOUT + 10
+                    )
+                    if updates:
+                        async_bot.offset = updates[-1].update_id + 1
+                        await async_bot.process_new_updates(updates)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if is_invalid_token_error(e):
+                        get_bot_identity().invalidate(async_bot.token)
+                        logger.error(f"🚫 Неверный токен бота {handle.bot_id}, polling остановлен")
+                        return
+                    logger.error(f"🔥 Ошибка polling бота {handle.bot_id}: {e}")
+                    await asyncio.sleep(POLLING_ERROR_DELAY)
+        except asyncio.CancelledError:
+            logger.info(f"🛑 Polling бота {handle.bot_id} остановлен")
+        except Exception as e:
+            logger.error(f"❌ Ошибка запуска бота {handle.bot_id}: {e}")
+        finally:
+            with self._lock:
+                if self.bots.get(handle.bot_id) is handle:
+                    del self.bots[handle.bot_id]
+            # Завершение (сохранение контекстов и т.п.) может блокировать - выполняем вне цикла
+            self.loop.run_in_executor(None, handle._finish)
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает число ботов и размер пула обработчиков"""
+        return {
+            "bots": len(self.bots),
+            "handler_workers": len(self.dispatcher.shards),
+        }
+
+
+_runtime: Optional[AsyncBotRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_async_runtime() -> AsyncBotRuntime:
+    """Возвращает общую для процесса асинхронную среду ботов"""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = AsyncBotRuntime()
+        return _runtime
@@ -0,0 +1,223 @@
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Файл записей в директории бота
+BOOKINGS_FILE_NAME = "bookings.db"
+
+# Записи за сколько прошедших дней загружать в индекс при открытии
+HISTORY_DAYS = int(os.getenv("BOOKING_HISTORY_DAYS", 1))
+
+
+def parse_minutes(value: str) -> Optional[int]:
+    """ЧЧ:ММ -> минуты от начала дня"""
+    try:
+        parsed = datetime.datetime.strptime(str(value).strip(), '%H:%M')
+    except ValueError:
+        return None
+    return parsed.hour * 60 + parsed.minute
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def build_slots(work_start: str, work_end: str, interval: Any) -> List[Tuple[int, int]]:
+    """Слоты рабочего дня: (начало, конец) в минутах с шагом interval, последний заканчивается не позже work_end"""
+    start = parse_minutes(work_start)
+    end = parse_minutes(work_end)
+    try:
+        step = int(interval)
+    except (TypeError, ValueError):
+        return []
+    if start is None or end is None or step <= 0:
+        return []
+    return [(minute, minute + step) for minute in range(start, end - step + 1, step)]
+
+
+class _DayIndex:
+    """Записи одного ресурса на одну дату, отсортированные по началу: поиск пересечений - бинарный"""
+
+    __slots__ = ('starts', 'bookings', 'max_length')
+
+    def __init__(self):
+        self.starts: List[int] = []
+        # (начало, конец, id записи, chat_id) в том же порядке, что и starts
+        self.bookings: List[Tuple[int, int, int, int]] = []
+        self.max_length = 0
+
+    def overlaps(self, start: int, end: int) -> bool:
+        # Записи, начавшиеся не позже start - max_length, закончились до start
+        position = bisect_right(self.starts, start - self.max_length)
+        while position < len(self.starts) and self.starts[position] < end:
+            if self.bookings[position][1] > start:
+                return True
+            position += 1
+        return False
+
+    def add(self, start: int, end: int, booking_id: int, chat_id: int):
+        position = bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.bookings.insert(position, (start, end, booking_id, chat_id))
+        self.max_length = max(self.max_length, end - start)
+
+    def remove(self, booking_id: int) -> bool:
+        for position, booking in enumerate(self.bookings):
+            if booking[2] == booking_id:
+                del self.starts[position]
+                del self.bookings[position]
+                return True
+        return False
+
+
+class BookingStore:
+    """
+    Журнал записей одного бота: SQLite на диске и индекс интервалов по (ресурс, дата) в памяти.
+    Ресурс - узел расписания, записи одного ресурса не пересекаются по времени.
+    Проверка и запись выполняются под одной блокировкой, поэтому слот нельзя занять дважды
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._index: Dict[Tuple[str, str], _DayIndex] = {}
+        # id записи -> (ресурс, дата) для отмены
+        self._locations: Dict[int, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self.reserved = 0
+        self.conflicts = 0
+
+        self._connection = None
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS bookings ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, resource TEXT NOT NULL, date TEXT NOT NULL, "
+                    "start INTEGER NOT NULL, end INTEGER NOT NULL, chat_id INTEGER NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._connection.execute(
+                    "CREATE INDEX IF NOT EXISTS bookings_resource_date ON bookings (resource, date, start)"
+                )
+                since = (datetime.date.today() - datetime.timedelta(days=HISTORY_DAYS)).isoformat()
+                rows = self._connection.execute(
+                    "SELECT id, resource, date, start, end, chat_id FROM bookings WHERE date >= ?", (since,)
+                )
+                for booking_id, resource, date_str, start, end, chat_id in rows:
+                    self._add(booking_id, resource, date_str, start, end, chat_id)
+
+    def _add(self, booking_id: int, resource: str, date_str: str, start: int, end: int, chat_id: int):
+        day = self._index.get((resource, date_str))
+        if day is None:
+            day = self._index[(resource, date_str)] = _DayIndex()
+        day.add(start, end, booking_id, chat_id)
+        self._locations[booking_id] = (resource, date_str)
+        self._next_id = max(self._next_id, booking_id + 1)
+
+    def is_free(self, resource: str, date_str: str, start: int, end: int) -> bool:
+        with self._lock:
+            day = self._index.get((resource, date_str))
+            return day is None or not day.overlaps(start, end)
+
+    def free_slots(self, resource: str, date_str: str, slots: List[Tuple[int, int]],
+                   not_before: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Слоты, не пересекающиеся с записями (и начинающиеся не раньше not_before минут)"""
+        with self._lock:
+            day = self._index.get((resource, date_str))
+            return [slot for slot in slots
+                    if (not_before is None or slot[0] >= not_before) and (day is None or not day.overlaps(*slot))]
+
+    def reserve(self, resource: str, date_str: str, start: int, end: int, chat_id: int) -> Optional[int]:
+        """Атомарно занимает интервал; возвращает id записи или None, если он пересекается с другой записью"""
+        with self._lock:
+            day = self._index.get((resource, date_str))
+            if day is not None and day.overlaps(start, end):
+                self.conflicts += 1
+                return None
+            if self._connection is not None:
+                with self._connection:
+                    cursor = self._connection.execute(
+                        "INSERT INTO bookings (resource, date, start, end, chat_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (resource, date_str, start, end, chat_id, time.time())
+                    )
+                booking_id = cursor.lastrowid
+            else:
+                booking_id = self._next_id
+            self._add(booking_id, resource, date_str, start, end, chat_id)
+            self.reserved += 1
+            return booking_id
+
+    def cancel(self, booking_id: int) -> bool:
+        """Отменяет запись и освобождает ее интервал"""
+        with self._lock:
+            location = self._locations.pop(booking_id, None)
+            if location is None:
+                return False
+            self._index[location].remove(booking_id)
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("DELETE FROM bookings WHERE id = ?", (booking_id,))
+            return True
+
+    def bookings(self, resource: str, date_str: str) -> List[Dict[str, Any]]:
+        """Записи ресурса на дату по времени начала"""
+        with self._lock:
+            day = self._index.get((resource, date_str))
+            items = list(day.bookings) if day else []
+        return [{"id": booking_id, "start": format_minutes(start), "end": format_minutes(end), "chat_id": chat_id}
+                for start, end, booking_id, chat_id in items]
+
+    def close(self):
+        """Закрывает файл журнала; дальше записи ведутся только в памяти"""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "bookings": len(self._locations),
+                "days": len(self._index),
+                "reserved": self.reserved,
+                "conflicts": self.conflicts,
+            }
+
+
+_stores: Dict[str, BookingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_booking_store(bot_dir: Optional[str]) -> BookingStore:
+    """Журнал записей бота (общий для всех его блоков расписания); без директории бота - только в памяти"""
+    if not bot_dir:
+        return BookingStore()
+    path = os.path.join(bot_dir, BOOKINGS_FILE_NAME)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            try:
+                store = _stores[path] = BookingStore(path)
+            except sqlite3.Error as e:
+                logger.error(f"❌ Не удалось открыть журнал записей {path}: {e}, используется журнал в памяти")
+                store = BookingStore()
+        return store
+
+
+def discard_booking_store(bot_dir: Optional[str]):
+    """Забывает журнал записей бота и закрывает его файл (при удалении и переименовании бота)"""
+    if not bot_dir:
+        return
+    with _stores_lock:
+        store = _stores.pop(os.path.join(bot_dir, BOOKINGS_FILE_NAME), None)
+    if store is not None:
+        store.close()
@@ -0,0 +1,171 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import telebot
+
+logger = logging.getLogger(__name__)
+
+# Сколько помнить данные бота (getMe) для действующего токена (секунды)
+BOT_INFO_TTL = float(os.getenv("BOT_INFO_TTL", 60 * 60))
+
+# Сколько помнить, что токен отклонен Telegram (секунды)
+INVALID_TOKEN_TTL = float(os.getenv("INVALID_TOKEN_TTL", 5 * 60))
+
+# Сколько токенов проверяется одновременно при массовой проверке
+VALIDATE_CONCURRENCY = int(os.getenv("TOKEN_VALIDATE_CONCURRENCY", 8))
+
+# Коды ответа getMe, означающие недействительный токен (а не временную ошибку)
+INVALID_TOKEN_CODES = (401, 404)
+
+
+class InvalidToken(Exception):
+    """Telegram отклонил токен"""
+
+
+def is_invalid_token_error(error: Exception) -> bool:
+    return getattr(error, 'error_code', None) in INVALID_TOKEN_CODES or "Unauthorized" in str(error)
+
+
+class _Entry:
+    __slots__ = ('user', 'error', 'expires_at')
+
+    def __init__(self, user: Optional[telebot.types.User], error: Optional[str], expires_at: float):
+        self.user = user
+        self.error = error
+        self.expires_at = expires_at
+
+
+class BotIdentityCache:
+    """
+    Кеш getMe по токену: данные бота (username, id) и признак недействительного токена.
+    Параллельные запросы одного токена выполняют один вызов API, сетевые ошибки не кешируются
+    """
+
+    def __init__(self, ttl: float = BOT_INFO_TTL, invalid_ttl: float = INVALID_TOKEN_TTL):
+        self.ttl = ttl
+        self.invalid_ttl = invalid_ttl
+        self._entries: Dict[str, _Entry] = {}
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        # Токен не хранится в ключах кеша в открытом виде
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def peek(self, token: str) -> Optional[telebot.types.User]:
+        """Данные бота из кеша без обращения к API (None, если их нет или срок истек)"""
+        with self._lock:
+            entry = self._entries.get(self._key(token))
+        if entry and entry.user is not None and entry.expires_at > time.monotonic():
+            return entry.user
+        return None
+
+    def remember(self, token: str, user: telebot.types.User):
+        """Запоминает результат getMe, полученный в обход кеша (например, асинхронным клиентом)"""
+        with self._lock:
+            self._entries[self._key(token)] = _Entry(user, None, time.monotonic() + self.ttl)
+
+    def invalidate(self, token: Optional[str]):
+        """Забывает токен: при смене, удалении или отказе Telegram"""
+        if not token:
+            return
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+    def get_me(self, token: str, bot=None, refresh: bool = False) -> telebot.types.User:
+        """
+        Возвращает данные бота; bot - уже созданный клиент этого токена (иначе создается временный)
+        Raises: InvalidToken, если Telegram отклонил токен; исключение API при временной ошибке
+        """
+        key = self._key(token)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry and not refresh and entry.expires_at > time.monotonic():
+                self.hits += 1
+                if entry.user is None:
+                    raise InvalidToken(entry.error)
+                return entry.user
+
+            self.misses += 1
+            client = bot if bot is not None else telebot.TeleBot(token)
+            try:
+                user = client.get_me()
+            except Exception as e:
+                if not is_invalid_token_error(e):
+                    raise
+                with self._lock:
+                    self._entries[key] = _Entry(None, str(e), time.monotonic() + self.invalid_ttl)
+                raise InvalidToken(str(e)) from e
+
+            with self._lock:
+                self._entries[key] = _Entry(user, None, time.monotonic() + self.ttl)
+            return user
+
+    def bot_username(self, bot) -> Optional[str]:
+        """username бота по его клиенту (None при ошибке)"""
+        token = getattr(bot, 'token', None)
+        try:
+            user = self.get_me(token, bot) if token else bot.get_me()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось получить данные бота: {e}")
+            return None
+        return user.username
+
+    def is_valid(self, token: str) -> bool:
+        """Проверяет токен через getMe (временная ошибка сети тоже дает False)"""
+        try:
+            self.get_me(token)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Токен не прошел проверку: {e}")
+            return False
+
+    def validate_many(self, tokens: Iterable[str], concurrency: int = VALIDATE_CONCURRENCY
+                      ) -> List[Tuple[bool, Optional[telebot.types.User]]]:
+        """Проверяет токены не более чем concurrency запросами одновременно; результат в порядке tokens"""
+        tokens = list(tokens)
+
+        def check(token: str) -> Tuple[bool, Optional[telebot.types.User]]:
+            try:
+                return True, self.get_me(token)
+            except Exception as e:
+                logger.warning(f"⚠️ Токен не прошел проверку: {e}")
+                return False, None
+
+        if not tokens:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(tokens))),
+                                thread_name_prefix="token-check") as executor:
+            return list(executor.map(check, tokens))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            valid = sum(1 for entry in self._entries.values() if entry.user is not None and entry.expires_at > now)
+            invalid = sum(1 for entry in self._entries.values() if entry.user is None and entry.expires_at > now)
+        return {"valid": valid, "invalid": invalid, "hits": self.hits, "misses": self.misses}
+
+
+_cache: Optional[BotIdentityCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_bot_identity() -> BotIdentityCache:
+    """Возвращает общий для процесса кеш данных ботов"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = BotIdentityCache()
+        return _cache
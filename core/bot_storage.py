@@ -0,0 +1,203 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Окно объединения автосохранений редактора (секунды): сохранения сценария чаще одного раза
+# за окно записываются на диск одной записью последней версии; 0 - каждое сохранение сразу
+SAVE_COALESCE_WINDOW = float(os.getenv("SCENARIO_SAVE_COALESCE", 0.5))
+
+# Права нового файла (у существующего сохраняются прежние)
+NEW_FILE_MODE = 0o644
+
+
+def _fsync_directory(directory: str):
+    """Сохраняет на диск запись каталога о переименовании (где это поддерживается)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_text_atomic(path: str, text: str):
+    """
+    Записывает текст во временный файл рядом с целевым, сбрасывает его на диск и заменяет им целевой:
+    при сбое на любом шаге остается прежняя версия файла целиком
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = NEW_FILE_MODE
+    # Уникальное имя: параллельные записи разных процессов не портят временные файлы друг друга
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+
+
+def write_json_atomic(path: str, data: Any, indent: Optional[int] = None):
+    """Атомарно записывает JSON (см. write_text_atomic)"""
+    write_text_atomic(path, json.dumps(data, ensure_ascii=False, indent=indent))
+
+
+class BotStorage:
+    """
+    Запись файлов ботов (сценарии, конфигурации): атомарная замена файла и блокировка на директорию бота,
+    чтобы параллельные сохранения одного бота не перемешивались. Частые автосохранения объединяются:
+    первое записывается сразу, следующие в пределах окна - одной отложенной записью последней версии
+    """
+
+    def __init__(self, coalesce_window: float = SAVE_COALESCE_WINDOW):
+        self.coalesce_window = coalesce_window
+        self._locks: Dict[str, threading.RLock] = {}
+        self._locks_lock = threading.Lock()
+        # Путь -> текст, ожидающий отложенной записи
+        self._pending: Dict[str, str] = {}
+        self._timers: Dict[str, threading.Timer] = {}
+        self._last_write: Dict[str, float] = {}
+        self.writes = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    def _lock_for(self, path: str) -> threading.RLock:
+        # Файлы бота лежат в его директории: одна блокировка на директорию
+        directory = os.path.dirname(self._key(path))
+        with self._locks_lock:
+            lock = self._locks.get(directory)
+            if lock is None:
+                lock = self._locks[directory] = threading.RLock()
+            return lock
+
+    @contextmanager
+    def locked(self, path: str) -> Iterator[None]:
+        """Блокировка записи бота, которому принадлежит файл (для чтения-изменения-записи)"""
+        with self._lock_for(path):
+            yield
+
+    def write_json(self, path: str, data: Any, indent: Optional[int] = 2):
+        """Сразу записывает JSON; более старая отложенная версия файла отменяется"""
+        self._write(self._key(path), json.dumps(data, ensure_ascii=False, indent=indent))
+
+    def save_json(self, path: str, data: Any, indent: Optional[int] = 2) -> bool:
+        """
+        Сохраняет JSON с объединением частых сохранений. Данные сериализуются сразу,
+        поэтому вызывающий может дальше менять data
+        Returns: True если файл записан сразу, False если запись отложена до конца окна
+        """
+        key = self._key(path)
+        text = json.dumps(data, ensure_ascii=False, indent=indent)
+        if self.coalesce_window <= 0:
+            self._write(key, text)
+            return True
+
+        with self._lock_for(key):
+            if key in self._pending:
+                # Отложенная запись уже запланирована - она возьмет эту версию
+                self._pending[key] = text
+                self.coalesced += 1
+                return False
+
+            last_write = self._last_write.get(key)
+            elapsed = time.monotonic() - last_write if last_write is not None else None
+            if elapsed is None or elapsed >= self.coalesce_window:
+                self._write(key, text)
+                return True
+
+            self._pending[key] = text
+            self.coalesced += 1
+            # Не демон: при штатном завершении процесс дождется записи
+            timer = threading.Timer(self.coalesce_window - elapsed, self._flush_pending, args=(key,))
+            timer.name = "bot_storage_flush"
+            self._timers[key] = timer
+            timer.start()
+            return False
+
+    def _write(self, key: str, text: str):
+        with self._lock_for(key):
+            self._cancel(key)
+            try:
+                write_text_atomic(key, text)
+            except Exception:
+                self.errors += 1
+                raise
+            self._last_write[key] = time.monotonic()
+            self.writes += 1
+
+    def _cancel(self, key: str) -> Optional[str]:
+        """Снимает отложенную запись файла; возвращает ее текст"""
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        return self._pending.pop(key, None)
+
+    def _flush_pending(self, key: str):
+        with self._lock_for(key):
+            text = self._cancel(key)
+            if text is None:
+                return
+            try:
+                self._write(key, text)
+            except Exception as e:
+                logger.error(f"❌ Не удалось записать {key}: {e}")
+
+    def flush(self, path: Optional[str] = None):
+        """Записывает отложенные сохранения файла (или все), например перед его чтением"""
+        if path is not None:
+            key = self._key(path)
+            if key in self._pending:
+                self._flush_pending(key)
+            return
+        for key in list(self._pending):
+            self._flush_pending(key)
+
+    def discard(self, path: str):
+        """Отменяет отложенные записи файла или всех файлов директории (при удалении бота)"""
+        prefix = self._key(path)
+        for key in [key for key in list(self._pending) if key == prefix or key.startswith(prefix + os.sep)]:
+            with self._lock_for(key):
+                self._cancel(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"writes": self.writes, "coalesced": self.coalesced, "pending": len(self._pending),
+                "errors": self.errors}
+
+
+_storage: Optional[BotStorage] = None
+_storage_lock = threading.Lock()
+
+
+def get_bot_storage() -> BotStorage:
+    """Возвращает общее для процесса хранилище файлов ботов"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = BotStorage()
+        return _storage
@@ -0,0 +1,296 @@
+from concurrent.futures import Future, wait
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from .bot_storage import write_json_atomic
+from .outbound_dispatcher import PRIORITY_BULK, RateLimitedBot
+from .session_store import SessionStore
+
+logger = logging.getLogger(__name__)
+
+# Директория рассылок внутри директории бота
+BROADCASTS_DIR_NAME = "broadcasts"
+
+# Сколько chat_id читается из хранилища за раз
+CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", 500))
+
+# Сколько сообщений рассылки одновременно стоит в очереди отправки
+WINDOW_SIZE = int(os.getenv("BROADCAST_WINDOW_SIZE", 1000))
+
+# Как часто прогресс записывается на диск (секунды)
+CHECKPOINT_INTERVAL = float(os.getenv("BROADCAST_CHECKPOINT_INTERVAL", 2))
+
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_CANCELLED = "cancelled"
+
+
+class Broadcast:
+    """
+    Рассылка одного бота и ее прогресс; cursor - последний chat_id, обработанный вместе со всеми предыдущими,
+    completed - chat_id после курсора, которым сообщение уже отправлено (при остановке отправки завершаются вразброс)
+    """
+
+    FIELDS = ('id', 'bot_id', 'text', 'parse_mode', 'status', 'cursor', 'completed', 'total',
+              'sent', 'failed', 'blocked', 'created_at', 'finished_at')
+
+    def __init__(self, bot_id: str, text: str, parse_mode: Optional[str] = None, path: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.bot_id = bot_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.status = STATUS_RUNNING
+        self.cursor: Optional[int] = None
+        self.completed: List[int] = []
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.path = path
+        self.active = False
+        self._started = time.monotonic()
+        self._started_count = 0
+
+    @classmethod
+    def load(cls, path: str) -> 'Broadcast':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        broadcast = cls(data['bot_id'], data['text'], data.get('parse_mode'), path)
+        for field in cls.FIELDS:
+            if field in data:
+                setattr(broadcast, field, data[field])
+        return broadcast
+
+    def save(self):
+        if self.path:
+            write_json_atomic(self.path, {field: getattr(self, field) for field in self.FIELDS})
+
+    def progress(self) -> Dict[str, Any]:
+        """Счетчики рассылки и текущая скорость отправки"""
+        processed = self.sent + self.failed + self.blocked
+        elapsed = time.monotonic() - self._started
+        rate = (processed - self._started_count) / elapsed if self.active and elapsed > 0 else 0.0
+        return {
+            "id": self.id,
+            "status": self.status,
+            "active": self.active,
+            "total": self.total,
+            "processed": processed,
+            "sent": self.sent,
+            "failed": self.failed,
+            "blocked": self.blocked,
+            "rate": round(rate, 1),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class _BotBroadcasts:
+    """Подключенный бот: через что отправлять, откуда брать получателей и его активные рассылки"""
+
+    def __init__(self, sender: RateLimitedBot, store: SessionStore, directory: Optional[str]):
+        self.sender = sender.with_priority(PRIORITY_BULK)
+        self.store = store
+        self.directory = directory
+        self.broadcasts: Dict[str, Broadcast] = {}
+        self.threads: Dict[str, threading.Thread] = {}
+        self.stop = threading.Event()
+
+
+class BroadcastManager:
+    """
+    Рассылки по всем известным чатам бота: получатели читаются из хранилища контекстов
+    частями, сообщения идут через очередь отправки в полосе PRIORITY_BULK, прогресс
+    периодически сохраняется на диск, и после перезапуска рассылка продолжается с места остановки
+    """
+
+    def __init__(self):
+        self._bots: Dict[str, _BotBroadcasts] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, bot_id: str, sender: RateLimitedBot, store: SessionStore, bot_dir: Optional[str] = None):
+        """Подключает запущенного бота и возобновляет его незавершенные рассылки"""
+        directory = os.path.join(bot_dir, BROADCASTS_DIR_NAME) if bot_dir else None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        entry = _BotBroadcasts(sender, store, directory)
+        with self._lock:
+            self._bots[bot_id] = entry
+
+        if not directory:
+            return
+        for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            try:
+                broadcast = Broadcast.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"❌ Не удалось прочитать рассылку {path}: {e}")
+                continue
+            entry.broadcasts[broadcast.id] = broadcast
+            if broadcast.status == STATUS_RUNNING:
+                logger.info(f"📣 Возобновляем рассылку {broadcast.id} бота {bot_id} после chat_id {broadcast.cursor}")
+                self._launch(entry, broadcast)
+
+    def detach(self, bot_id: str, timeout: float = 10, store: Optional[SessionStore] = None):
+        """
+        Останавливает рассылки бота, сохраняя прогресс (они продолжатся при следующем запуске).
+        Если передан store - только пока бот подключен с этим хранилищем, а не перезапущен с новым
+        """
+        with self._lock:
+            entry = self._bots.get(bot_id)
+            if entry is None or (store is not None and entry.store is not store):
+                return
+            del self._bots[bot_id]
+        entry.stop.set()
+        for thread in list(entry.threads.values()):
+            thread.join(timeout)
+
+    def start(self, bot_id: str, text: str, parse_mode: Optional[str] = None) -> Broadcast:
+        """Запускает рассылку; бот должен быть запущен"""
+        with self._lock:
+            entry = self._bots.get(bot_id)
+        if entry is None:
+            raise ValueError(f"Бот {bot_id} не запущен")
+        broadcast = Broadcast(bot_id, text, parse_mode)
+        if entry.directory:
+            broadcast.path = os.path.join(entry.directory, f"{broadcast.id}.json")
+        broadcast.total = len(entry.store)
+        broadcast.save()
+        entry.broadcasts[broadcast.id] = broadcast
+        self._launch(entry, broadcast)
+        logger.info(f"📣 Рассылка {broadcast.id} бота {bot_id} запущена: ~{broadcast.total} получателей")
+        return broadcast
+
+    def cancel(self, bot_id: str, broadcast_id: str) -> Optional[Broadcast]:
+        """Отменяет рассылку; уже отправленные сообщения остаются"""
+        broadcast = self.get(bot_id, broadcast_id)
+        if broadcast is None or broadcast.status != STATUS_RUNNING:
+            return broadcast
+        broadcast.status = STATUS_CANCELLED
+        if not broadcast.active:
+            broadcast.finished_at = time.time()
+            broadcast.save()
+        return broadcast
+
+    def get(self, bot_id: str, broadcast_id: str) -> Optional[Broadcast]:
+        with self._lock:
+            entry = self._bots.get(bot_id)
+        return entry.broadcasts.get(broadcast_id) if entry else None
+
+    def list(self, bot_id: str) -> List[Broadcast]:
+        with self._lock:
+            entry = self._bots.get(bot_id)
+        if entry is None:
+            return []
+        return sorted(entry.broadcasts.values(), key=lambda broadcast: broadcast.created_at, reverse=True)
+
+    def _launch(self, entry: _BotBroadcasts, broadcast: Broadcast):
+        thread = threading.Thread(target=self._run, args=(entry, broadcast),
+                                  name=f"broadcast-{broadcast.id}", daemon=True)
+        entry.threads[broadcast.id] = thread
+        thread.start()
+
+    def _run(self, entry: _BotBroadcasts, broadcast: Broadcast):
+        broadcast.active = True
+        broadcast._started = time.monotonic()
+        broadcast._started_count = broadcast.sent + broadcast.failed + broadcast.blocked
+        kwargs = {'parse_mode': broadcast.parse_mode} if broadcast.parse_mode else {}
+        # Отправки по порядку chat_id; курсор сдвигается только по непрерывно завершенному началу окна
+        window: Deque[Tuple[int, Future]] = deque()
+        after = broadcast.cursor
+        # Отправленные до прошлой остановки за курсором не повторяем
+        completed = set(broadcast.completed)
+        exhausted = False
+        last_checkpoint = time.monotonic()
+        try:
+            while broadcast.status == STATUS_RUNNING and not entry.stop.is_set():
+                # Обычно одна часть за проход; если вся часть уже отправлена до остановки, читаем следующую
+                while not exhausted and len(window) < WINDOW_SIZE and not entry.stop.is_set():
+                    chunk = entry.store.chat_ids(after, CHUNK_SIZE)
+                    exhausted = len(chunk) < CHUNK_SIZE
+                    for chat_id in chunk:
+                        if chat_id in completed:
+                            continue
+                        window.append((chat_id, entry.sender.submit('send_message', chat_id, broadcast.text, **kwargs)))
+                    if chunk:
+                        after = chunk[-1]
+                    if window:
+                        break
+                if not window:
+                    if not exhausted:
+                        # Остановлены во время чтения - прогресс сохранится в finally
+                        continue
+                    broadcast.status = STATUS_COMPLETED
+                    broadcast.completed = []
+                    break
+
+                wait([window[0][1]], timeout=0.5)
+                self._collect(broadcast, window)
+                if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    broadcast.save()
+                    last_checkpoint = time.monotonic()
+        except Exception as e:
+            logger.error(f"❌ Ошибка рассылки {broadcast.id} бота {broadcast.bot_id}: {e}")
+        finally:
+            # Неначатые отправки отменяем, начатые дожидаемся - курсор не должен их пропустить
+            for _, future in window:
+                future.cancel()
+            wait([future for _, future in window if not future.cancelled()], timeout=30)
+            self._collect(broadcast, window, stopping=True)
+            if broadcast.status != STATUS_RUNNING:
+                broadcast.finished_at = time.time()
+            broadcast.active = False
+            broadcast.save()
+            entry.threads.pop(broadcast.id, None)
+            logger.info(f"📣 Рассылка {broadcast.id} бота {broadcast.bot_id}: {broadcast.progress()}")
+
+    @classmethod
+    def _collect(cls, broadcast: Broadcast, window: Deque[Tuple[int, Future]], stopping: bool = False):
+        """
+        Учитывает завершенные отправки в начале окна и сдвигает курсор. При остановке учитывает
+        и завершенные за первой незавершенной: их chat_id сохраняются в completed, чтобы не отправить повторно
+        """
+        while window and window[0][1].done() and not window[0][1].cancelled():
+            chat_id, future = window.popleft()
+            cls._account(broadcast, chat_id, future)
+            broadcast.cursor = chat_id
+        if broadcast.completed and broadcast.cursor is not None:
+            broadcast.completed = [chat_id for chat_id in broadcast.completed if chat_id > broadcast.cursor]
+        if stopping:
+            for chat_id, future in window:
+                if future.done() and not future.cancelled():
+                    cls._account(broadcast, chat_id, future)
+                    broadcast.completed.append(chat_id)
+            window.clear()
+
+    @staticmethod
+    def _account(broadcast: Broadcast, chat_id: int, future: Future):
+        error = future.exception()
+        if error is None:
+            broadcast.sent += 1
+        elif getattr(error, 'error_code', None) == 403:
+            # Пользователь заблокировал бота или удалил аккаунт
+            broadcast.blocked += 1
+        else:
+            broadcast.failed += 1
+            logger.warning(f"⚠️ Рассылка {broadcast.id}: не удалось отправить в чат {chat_id}: {error}")
+
+_manager: Optional[BroadcastManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_broadcast_manager() -> BroadcastManager:
+    """Возвращает общий для процесса менеджер рассылок"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = BroadcastManager()
+        return _manager
@@ -0,0 +1,82 @@
+from typing import Dict, Optional, Tuple, Any
+import base64
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на размер callback_data
+CALLBACK_DATA_MAX_BYTES = 64
+
+# Префикс callback_data, сгенерированных конструктором
+CALLBACK_PREFIX = "ib"
+
+# Префикс callback_data кнопок свободного времени блока расписания
+SLOT_CALLBACK_PREFIX = "sl"
+
+
+def node_code(node_id: str) -> str:
+    """Возвращает короткий стабильный код узла (не зависит от перезапуска процесса)"""
+    digest = hashlib.blake2b(str(node_id).encode('utf-8'), digest_size=6).digest()
+    return base64.urlsafe_b64encode(digest).decode('ascii')
+
+
+def build_callback_data(node_id: str, button_index: int, button: Optional[Dict[str, Any]] = None) -> str:
+    """Формирует callback_data для inline-кнопки: пользовательский callbackData или код (узел, индекс)"""
+    custom = (button or {}).get('callbackData')
+    if custom and len(str(custom).encode('utf-8')) <= CALLBACK_DATA_MAX_BYTES:
+        return str(custom)
+    if custom:
+        logger.warning(f"⚠️ callbackData кнопки длиннее {CALLBACK_DATA_MAX_BYTES} байт, используется сгенерированный")
+    return f"{CALLBACK_PREFIX}:{node_code(node_id)}:{button_index}"
+
+
+def build_slot_callback_data(node_id: str, date_str: str, time_str: str) -> str:
+    """callback_data кнопки времени: код узла, дата ГГГГММДД и время ЧЧММ (дата защищает от старых клавиатур)"""
+    return f"{SLOT_CALLBACK_PREFIX}:{node_code(node_id)}:{date_str.replace('-', '')}:{time_str.replace(':', '')}"
+
+
+class CallbackRouter:
+    """Таблица маршрутизации inline-кнопок: callback_data -> (узел, индекс кнопки)"""
+
+    def __init__(self, nodes_map: Dict[str, Any]):
+        self._routes: Dict[str, Tuple[str, int]] = {}
+        # Код узла расписания -> ID узла
+        self._schedule_nodes: Dict[str, str] = {}
+        for node_id, block in nodes_map.items():
+            if getattr(block, 'type', None) == 'schedule':
+                self._schedule_nodes[node_code(node_id)] = node_id
+            if getattr(block, 'type', None) != 'inline_button':
+                continue
+            buttons = block.node_data.get('data', {}).get('buttons') or []
+            for index, button in enumerate(buttons):
+                self._add_route(build_callback_data(node_id, index, button), node_id, index)
+
+        logger.info(f"🧭 Таблица callback-маршрутов собрана: {len(self._routes)} кнопок")
+
+    def _add_route(self, callback_data: str, node_id: str, button_index: int):
+        if callback_data in self._routes:
+            existing_node, existing_index = self._routes[callback_data]
+            logger.warning(
+                f"⚠️ Повторяющийся callback_data '{callback_data}' у {node_id}[{button_index}], "
+                f"используется {existing_node}[{existing_index}]")
+            return
+        self._routes[callback_data] = (node_id, button_index)
+
+    def resolve(self, callback_data: str) -> Optional[Tuple[str, int]]:
+        """Возвращает (ID узла, индекс кнопки) для callback_data или None"""
+        return self._routes.get(callback_data)
+
+    def resolve_slot(self, callback_data: str) -> Optional[Tuple[str, str, str]]:
+        """Разбирает callback_data кнопки времени: (ID узла расписания, ГГГГ-ММ-ДД, ЧЧ:ММ) или None"""
+        parts = (callback_data or '').split(':')
+        if len(parts) != 4 or parts[0] != SLOT_CALLBACK_PREFIX:
+            return None
+        node_id = self._schedule_nodes.get(parts[1])
+        date_part, time_part = parts[2], parts[3]
+        if node_id is None or len(date_part) != 8 or len(time_part) != 4:
+            return None
+        return node_id, f"{date_part[:4]}-{date_part[4:6]}-{date_part[6:]}", f"{time_part[:2]}:{time_part[2:]}"
+
+    def __len__(self) -> int:
+        return len(self._routes)
@@ -0,0 +1,269 @@
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import datetime
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Таймауты запросов к CRM (секунды): обработчик сообщения ждет ответа, поэтому они короткие
+CONNECT_TIMEOUT = float(os.getenv("CRM_CONNECT_TIMEOUT", 2))
+READ_TIMEOUT = float(os.getenv("CRM_READ_TIMEOUT", 4))
+
+# Соединений в пуле на один хост CRM
+POOL_SIZE = int(os.getenv("CRM_POOL_SIZE", 32))
+
+# Сколько помнить ответ CRM о дате или времени (секунды)
+CACHE_TTL = float(os.getenv("CRM_CACHE_TTL", 60))
+
+# Сколько записей кеша держать, прежде чем удалять устаревшие
+CACHE_SIZE = int(os.getenv("CRM_CACHE_SIZE", 10000))
+
+# Предохранитель: после стольких ошибок подряд CRM не опрашивается BREAKER_COOLDOWN секунд
+BREAKER_THRESHOLD = int(os.getenv("CRM_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.getenv("CRM_BREAKER_COOLDOWN", 30))
+
+# Повторы только при установке соединения, как у клиента Telegram
+CONNECT_RETRIES = 2
+
+
+def normalize_time(value: Any) -> Optional[str]:
+    """Приводит время слота CRM (9:00, 09:00, 09:00:00) к ЧЧ:ММ"""
+    text = str(value).strip()
+    for time_format in ('%H:%M', '%H:%M:%S', '%H.%M'):
+        try:
+            return datetime.datetime.strptime(text, time_format).strftime('%H:%M')
+        except ValueError:
+            continue
+    return None
+
+
+class DayAvailability:
+    """Ответ CRM о дате: доступна ли она и, если CRM их вернула, занятость слотов дня"""
+
+    __slots__ = ('available', 'slots', 'unlisted_available')
+
+    def __init__(self, available: bool, slots: Optional[Dict[str, bool]] = None, unlisted_available: bool = True):
+        self.available = available
+        # ЧЧ:ММ -> свободен ли слот; None - CRM не прислала слоты, время проверяется отдельным запросом
+        self.slots = slots
+        # Свободно ли время, которого нет в slots
+        self.unlisted_available = unlisted_available
+
+    @classmethod
+    def from_response(cls, data: Dict[str, Any]) -> 'DayAvailability':
+        """
+        Разбирает ответ на ?date=...: {"available": bool} и необязательно слоты дня -
+        "slots" ({"10:00": true, ...} или [{"time": "10:00", "available": true}, ...]),
+        "free_slots" и/или "busy_slots" (списки времени)
+        """
+        available = bool(data.get('available', True))
+        raw_slots = data.get('slots')
+        if raw_slots is None and 'free_slots' not in data and 'busy_slots' not in data:
+            return cls(available)
+
+        if isinstance(raw_slots, dict):
+            items = list(raw_slots.items())
+        elif isinstance(raw_slots, list):
+            items = [(slot.get('time'), slot.get('available', True)) for slot in raw_slots if isinstance(slot, dict)]
+        else:
+            items = []
+        items += [(slot_time, True) for slot_time in data.get('free_slots') or []]
+        items += [(slot_time, False) for slot_time in data.get('busy_slots') or []]
+
+        slots: Dict[str, bool] = {}
+        for slot_time, slot_available in items:
+            normalized = normalize_time(slot_time)
+            if normalized:
+                slots[normalized] = bool(slot_available)
+        # Перечислены слоты или свободное время - остальное занято; перечислено только занятое - остальное свободно
+        unlisted_available = raw_slots is None and 'free_slots' not in data
+        return cls(available, slots, unlisted_available)
+
+    def time_available(self, time_str: str) -> Optional[bool]:
+        """Свободно ли время по данным дня (None - данных о слотах нет)"""
+        if self.slots is None:
+            return None
+        return self.slots.get(time_str, self.unlisted_available)
+
+
+class _Breaker:
+    """Предохранитель одного хоста CRM: открывается после серии ошибок, через паузу пропускает пробный запрос"""
+
+    def __init__(self):
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.failures < BREAKER_THRESHOLD:
+                return True
+            now = time.monotonic()
+            if now < self.open_until:
+                return False
+            # Пробный запрос; следующие ждут, пока он не завершится или снова не пройдет пауза
+            self.open_until = now + BREAKER_COOLDOWN
+            return True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.open_until = 0.0
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= BREAKER_THRESHOLD:
+                self.open_until = time.monotonic() + BREAKER_COOLDOWN
+
+
+class CRMAvailabilityClient:
+    """
+    Клиент проверки занятости в CRM для блока расписания: общий пул соединений, таймауты,
+    предохранитель на хост и кеш ответов. Ответ о дате со слотами дня кешируется целиком,
+    и шаг выбора времени отвечает из кеша без запроса. Если CRM недоступна,
+    время считается свободным (как и раньше)
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, ttl: float = CACHE_TTL):
+        self.session = requests.Session()
+        retry = Retry(total=CONNECT_RETRIES, connect=CONNECT_RETRIES, read=0, status=0,
+                      backoff_factor=0.2, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.ttl = ttl
+        self._days: Dict[Tuple[str, str], Tuple[float, DayAvailability]] = {}
+        self._times: Dict[Tuple[str, str, str], Tuple[float, bool]] = {}
+        self._breakers: Dict[str, _Breaker] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.short_circuited = 0
+
+    def day(self, endpoint: str, date_str: str) -> Optional[DayAvailability]:
+        """Занятость даты (и слотов дня, если CRM их возвращает); None - CRM недоступна"""
+        key = (endpoint, date_str)
+        cached = self._cached(self._days, key)
+        if cached is not None:
+            return cached
+        data = self._get(endpoint, {'date': date_str})
+        if data is None:
+            return None
+        day = DayAvailability.from_response(data)
+        self._store(self._days, key, day)
+        return day
+
+    def date_available(self, endpoint: str, date_str: str) -> bool:
+        day = self.day(endpoint, date_str)
+        return True if day is None else day.available
+
+    def time_available(self, endpoint: str, date_str: str, time_str: str) -> bool:
+        """Свободно ли время: из слотов дня, из кеша или отдельным запросом к CRM"""
+        day = self._cached(self._days, (endpoint, date_str))
+        if day is not None and day.slots is not None:
+            return bool(day.time_available(time_str))
+
+        key = (endpoint, date_str, time_str)
+        cached = self._cached(self._times, key)
+        if cached is not None:
+            return cached
+        data = self._get(endpoint, {'date': date_str, 'time': time_str})
+        if data is None:
+            return True
+        available = bool(data.get('available', True))
+        self._store(self._times, key, available)
+        return available
+
+    def invalidate(self, endpoint: str, date_str: str):
+        """Забывает ответы о дате (например, после записи на нее)"""
+        with self._lock:
+            self._days.pop((endpoint, date_str), None)
+            for key in [key for key in self._times if key[0] == endpoint and key[1] == date_str]:
+                del self._times[key]
+
+    def _cached(self, cache: Dict, key):
+        with self._lock:
+            entry = cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del cache[key]
+                return None
+            self.cache_hits += 1
+            return entry[1]
+
+    def _store(self, cache: Dict, key, value):
+        now = time.monotonic()
+        with self._lock:
+            if len(cache) >= CACHE_SIZE:
+                for expired in [k for k, (expires_at, _) in cache.items() if expires_at <= now]:
+                    del cache[expired]
+                if len(cache) >= CACHE_SIZE:
+                    cache.clear()
+            cache[key] = (now + self.ttl, value)
+
+    def _breaker(self, endpoint: str) -> _Breaker:
+        host = urlsplit(endpoint).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = _Breaker()
+            return breaker
+
+    def _get(self, endpoint: str, params: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """GET к CRM; None при ошибке, неуспешном ответе или открытом предохранителе"""
+        breaker = self._breaker(endpoint)
+        if not breaker.allow():
+            with self._lock:
+                self.short_circuited += 1
+            return None
+        with self._lock:
+            self.requests += 1
+        try:
+            response = self.session.get(endpoint, params=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            if response.status_code >= 500:
+                raise requests.HTTPError(f"HTTP {response.status_code}")
+            data = response.json() if response.status_code == 200 else None
+            # Ответ получен - CRM работает, даже если запрос она не приняла
+            breaker.success()
+            return data if isinstance(data, dict) else None
+        except Exception as e:
+            breaker.failure()
+            with self._lock:
+                self.errors += 1
+            logger.error(f"❌ Ошибка запроса к CRM {endpoint}: {e}")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "cache_hits": self.cache_hits,
+                "short_circuited": self.short_circuited,
+                "cached_days": len(self._days),
+                "open_breakers": sum(1 for breaker in self._breakers.values()
+                                     if breaker.failures >= BREAKER_THRESHOLD),
+            }
+
+
+_client: Optional[CRMAvailabilityClient] = None
+_client_lock = threading.Lock()
+
+
+def get_crm_client() -> CRMAvailabilityClient:
+    """Возвращает общий для процесса клиент CRM"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = CRMAvailabilityClient()
+        return _client
@@ -0,0 +1,51 @@
+from typing import Dict, List, Optional, Tuple, Iterable
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EdgeIndex:
+    """Индекс связей сценария для поиска переходов за O(1)"""
+
+    def __init__(self, edges: Optional[Iterable[Dict]] = None):
+        # (source, sourceHandle) -> target, первая связь побеждает (как при линейном обходе)
+        self._by_source_handle: Dict[Tuple[str, Optional[str]], str] = {}
+        # source -> target первой связи узла, используется когда handle не указан
+        self._first_by_source: Dict[str, str] = {}
+        # target -> список source, обратный индекс
+        self._by_target: Dict[str, List[str]] = {}
+        # source -> все исходящие связи в порядке появления
+        self._outgoing: Dict[str, List[Tuple[Optional[str], str]]] = {}
+
+        for edge in edges or []:
+            self.add_edge(edge)
+
+    def add_edge(self, edge: Dict):
+        """Добавляет связь в индекс"""
+        source = edge.get('source')
+        target = edge.get('target')
+        if source is None or target is None:
+            return
+        handle = edge.get('sourceHandle')
+
+        self._by_source_handle.setdefault((source, handle), target)
+        self._first_by_source.setdefault(source, target)
+        self._by_target.setdefault(target, []).append(source)
+        self._outgoing.setdefault(source, []).append((handle, target))
+
+    def next_node_id(self, source: str, handle_id: Optional[str] = None) -> Optional[str]:
+        """Возвращает следующий узел для source и handle (или первую связь, если handle не указан)"""
+        if handle_id is None:
+            return self._first_by_source.get(source)
+        return self._by_source_handle.get((source, handle_id))
+
+    def previous_node_ids(self, target: str) -> List[str]:
+        """Возвращает список узлов, ведущих в target"""
+        return list(self._by_target.get(target, []))
+
+    def outgoing(self, source: str) -> List[Tuple[Optional[str], str]]:
+        """Возвращает исходящие связи узла в виде (handle, target)"""
+        return list(self._outgoing.get(source, []))
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._outgoing.values())
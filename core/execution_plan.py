@@ -0,0 +1,148 @@
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple, Any
+import logging
+
+from .edge_index import EdgeIndex
+
+logger = logging.getLogger(__name__)
+
+# Блоки, после которых автоматическое выполнение останавливается и ждет пользователя
+INTERACTIVE_BLOCK_TYPES = frozenset({'button', 'inline_button', 'input', 'menu', 'schedule'})
+
+# Блоки, продолжение которых запускается обработчиками сообщений, а не /start
+ENTRY_SOURCE_BLOCK_TYPES = frozenset({'keyword_processor'})
+
+# Значение, которое блок возвращает вместо следующего узла, чтобы приостановить цепочку
+# (продолжение запланировано отдельно, например, блоком задержки)
+SUSPEND_CHAIN = "__suspend__"
+
+# Значение, которое интерактивный блок возвращает из обработчика ответа, когда ответ получен полностью:
+# чат перестает ждать этот узел, и сценарий продолжается по его основной связи
+INTERACTION_COMPLETE = "__complete__"
+
+
+class ExecutionPlan:
+    """Неизменяемый план исполнения сценария, собранный один раз при загрузке"""
+
+    __slots__ = ('_start_node_id', '_node_types', '_nodes_by_type', '_successors', '_default_successor',
+                 '_interactive', '_chains')
+
+    def __init__(self, start_node_id: Optional[str], node_types: Dict[str, str],
+                 successors: Dict[str, Dict[Optional[str], str]], chains: Dict[str, Tuple[str, ...]]):
+        self._start_node_id = start_node_id
+        self._node_types = MappingProxyType(dict(node_types))
+        nodes_by_type = {}
+        for node_id, block_type in node_types.items():
+            nodes_by_type.setdefault(block_type, []).append(node_id)
+        self._nodes_by_type = MappingProxyType({
+            block_type: tuple(node_ids) for block_type, node_ids in nodes_by_type.items()
+        })
+        self._successors = MappingProxyType({
+            node_id: MappingProxyType(dict(handles)) for node_id, handles in successors.items()
+        })
+        self._default_successor = MappingProxyType({
+            node_id: handles[None] for node_id, handles in successors.items() if None in handles
+        })
+        self._interactive = frozenset(
+            node_id for node_id, block_type in node_types.items() if block_type in INTERACTIVE_BLOCK_TYPES
+        )
+        self._chains = MappingProxyType(dict(chains))
+
+    @property
+    def start_node_id(self) -> Optional[str]:
+        """ID стартового узла сценария"""
+        return self._start_node_id
+
+    @property
+    def node_types(self) -> Mapping[str, str]:
+        """Типы блоков по ID узла"""
+        return self._node_types
+
+    def nodes_of_type(self, block_type: str) -> Tuple[str, ...]:
+        """Возвращает ID узлов указанного типа в порядке сценария"""
+        return self._nodes_by_type.get(block_type, ())
+
+    def successor(self, node_id: str, handle_id: Optional[str] = None) -> Optional[str]:
+        """Возвращает следующий узел для указанного handle (None - основная связь)"""
+        handles = self._successors.get(node_id)
+        if not handles:
+            return None
+        return handles.get(handle_id)
+
+    def successors(self, node_id: str) -> Mapping[Optional[str], str]:
+        """Возвращает все переходы узла в виде handle -> target"""
+        return self._successors.get(node_id, MappingProxyType({}))
+
+    def is_interactive(self, node_id: str) -> bool:
+        """Проверяет, ожидает ли узел действия пользователя"""
+        return node_id in self._interactive
+
+    def chain(self, node_id: str) -> Tuple[str, ...]:
+        """Возвращает цепочку узлов, выполняемых подряд начиная с node_id"""
+        chain = self._chains.get(node_id)
+        if chain is None:
+            # Цепочки хранятся только для точек входа, остальные собираются по карте переходов
+            chain = _build_chain(node_id, self._node_types, self._default_successor)
+        return chain
+
+
+def _build_chain(node_id: str, node_types: Mapping[str, str],
+                 default_successor: Mapping[str, str]) -> Tuple[str, ...]:
+    """Собирает линейную цепочку до первого интерактивного узла, конца сценария или цикла"""
+    chain = []
+    visited = set()
+    current = node_id
+    while current and current not in visited:
+        chain.append(current)
+        visited.add(current)
+        if node_types.get(current) in INTERACTIVE_BLOCK_TYPES:
+            break
+        current = default_successor.get(current)
+
+    if current and current in visited and node_types.get(chain[-1]) not in INTERACTIVE_BLOCK_TYPES:
+        logger.warning(f"⚠️ Цикл без интерактивных блоков начиная с узла {node_id}, цепочка обрезана")
+    return tuple(chain)
+
+
+def compile_scenario(scenario_data: Dict, nodes_map: Dict[str, Any],
+                     edge_index: Optional[EdgeIndex] = None) -> ExecutionPlan:
+    """Компилирует сценарий в план исполнения"""
+    if edge_index is None:
+        edge_index = EdgeIndex(scenario_data.get('edges', []))
+
+    node_types = {}
+    for node in scenario_data.get('nodes', []):
+        node_id = node.get('id')
+        block = nodes_map.get(node_id)
+        node_types[node_id] = block.type if block is not None and hasattr(block, 'type') else node.get('type')
+
+    successors = {}
+    default_successor = {}
+    for node_id in node_types:
+        handles = {}
+        for handle_id, target in edge_index.outgoing(node_id):
+            handles.setdefault(handle_id, target)
+        default_target = edge_index.next_node_id(node_id)
+        if default_target:
+            handles[None] = default_target
+            default_successor[node_id] = default_target
+        if handles:
+            successors[node_id] = handles
+
+    start_node_id = next((node_id for node_id, block_type in node_types.items() if block_type == 'start'), None)
+
+    # Точки входа: старт, переходы из интерактивных блоков и по именованным handle
+    entry_points = set()
+    if start_node_id:
+        entry_points.add(start_node_id)
+    for node_id, handles in successors.items():
+        source_type = node_types.get(node_id)
+        for handle_id, target in handles.items():
+            if (source_type in INTERACTIVE_BLOCK_TYPES or source_type in ENTRY_SOURCE_BLOCK_TYPES
+                    or target != default_successor.get(node_id)):
+                entry_points.add(target)
+
+    chains = {node_id: _build_chain(node_id, node_types, default_successor) for node_id in entry_points}
+
+    logger.info(f"🧩 План сценария собран: {len(node_types)} узлов, {len(edge_index)} связей")
+    return ExecutionPlan(start_node_id, node_types, successors, chains)
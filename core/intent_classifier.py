@@ -0,0 +1,181 @@
+from typing import Dict, List, Optional, Tuple, Any
+import json
+import logging
+import math
+import os
+import random
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # Без NumPy классификатор работает на словарях, медленнее
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Файл с интентами бота в директории бота
+INTENTS_FILE_NAME = "intents.json"
+
+# Диапазон длин символьных n-грамм
+NGRAM_RANGE = (2, 4)
+
+# Минимальная близость, при которой текст считается похожим на интент
+MIN_INTENT_SCORE = 0.2
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = NGRAM_RANGE) -> Dict[str, int]:
+    """Считает символьные n-граммы по словам текста (слова дополняются пробелами по краям)"""
+    counts: Dict[str, int] = {}
+    min_n, max_n = ngram_range
+    for word in text.lower().split():
+        padded = f" {word} "
+        length = len(padded)
+        for n in range(min_n, max_n + 1):
+            for start in range(0, length - n + 1):
+                gram = padded[start:start + n]
+                counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+class IntentClassifier:
+    """TF-IDF классификатор интентов по символьным n-граммам с косинусной близостью"""
+
+    def __init__(self, intents: List[Dict[str, Any]], default_response: Optional[str] = None,
+                 threshold: Optional[float] = None):
+        self.intents = [intent for intent in intents if intent.get('name') and intent.get('examples')]
+        self.names = [intent['name'] for intent in self.intents]
+        self.responses = {intent['name']: intent.get('response') for intent in self.intents}
+        self.default_response = default_response
+        self.threshold = threshold
+
+        # Словарь n-грамм и IDF считаются по всем примерам всех интентов
+        examples = [(row, char_ngrams(example))
+                    for row, intent in enumerate(self.intents) for example in intent['examples'] if example]
+        document_frequency: Dict[str, int] = {}
+        for _, grams in examples:
+            for gram in grams:
+                document_frequency[gram] = document_frequency.get(gram, 0) + 1
+
+        self.vocabulary = {gram: column for column, gram in enumerate(document_frequency)}
+        documents = len(examples) or 1
+        self.idf = [math.log((1 + documents) / (1 + document_frequency[gram])) + 1.0 for gram in self.vocabulary]
+
+        # Центроид интента - среднее нормированных векторов его примеров
+        centroids: List[Dict[int, float]] = [{} for _ in self.intents]
+        for row, grams in examples:
+            vector = self._vectorize_grams(grams)
+            for column, value in vector.items():
+                centroids[row][column] = centroids[row].get(column, 0.0) + value
+        self._centroids = [self._normalize(centroid) for centroid in centroids]
+
+        # Разреженная матрица по столбцам (n-грамма -> строки интентов и веса): память растет
+        # с числом ненулевых весов, а не с произведением интентов на словарь
+        self._postings = None
+        if np is not None and self.intents:
+            columns: List[List[Tuple[int, float]]] = [[] for _ in self.vocabulary]
+            for row, centroid in enumerate(self._centroids):
+                for column, value in centroid.items():
+                    columns[column].append((row, value))
+            indptr = np.zeros(len(columns) + 1, dtype=np.intp)
+            indptr[1:] = np.cumsum([len(entries) for entries in columns])
+            rows = np.fromiter((row for entries in columns for row, _ in entries), dtype=np.intp,
+                               count=int(indptr[-1]))
+            values = np.fromiter((value for entries in columns for _, value in entries), dtype=np.float32,
+                                 count=int(indptr[-1]))
+            self._postings = (indptr, rows, values)
+
+        logger.info(f"🧠 Классификатор интентов: {len(self.intents)} интентов, {len(self.vocabulary)} n-грамм")
+
+    @staticmethod
+    def _normalize(vector: Dict[int, float]) -> Dict[int, float]:
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        if not norm:
+            return {}
+        return {column: value / norm for column, value in vector.items()}
+
+    def _vectorize_grams(self, grams: Dict[str, int]) -> Dict[int, float]:
+        """Возвращает нормированный TF-IDF вектор (сублинейный TF) в виде column -> вес"""
+        vector = {}
+        for gram, count in grams.items():
+            column = self.vocabulary.get(gram)
+            if column is not None:
+                vector[column] = (1.0 + math.log(count)) * self.idf[column]
+        return self._normalize(vector)
+
+    def classify(self, text: str) -> Tuple[Optional[str], float]:
+        """Возвращает (интент, уверенность) для текста; интент None, если похожих интентов нет"""
+        if not text or not self.intents:
+            return None, 0.0
+
+        vector = self._vectorize_grams(char_ngrams(text))
+        if not vector:
+            return None, 0.0
+
+        if self._postings is not None:
+            indptr, rows, values = self._postings
+            slices = [slice(indptr[column], indptr[column + 1]) for column in vector]
+            weights = np.concatenate([
+                values[part] * weight for part, weight in zip(slices, vector.values())
+            ])
+            # Косинусная близость со всеми интентами сразу: центроиды уже нормированы
+            scores = np.bincount(np.concatenate([rows[part] for part in slices]), weights=weights,
+                                 minlength=len(self.intents))
+            best = int(scores.argmax())
+            score = float(scores[best])
+        else:
+            best, score = 0, 0.0
+            for row, centroid in enumerate(self._centroids):
+                current = sum(value * centroid.get(column, 0.0) for column, value in vector.items())
+                if current > score:
+                    best, score = row, current
+
+        if score < MIN_INTENT_SCORE:
+            return None, score
+        return self.names[best], score
+
+    def get_response(self, intent: Optional[str]) -> Optional[str]:
+        """Возвращает ответ интента (случайный, если задано несколько)"""
+        response = self.responses.get(intent) if intent else None
+        if isinstance(response, list):
+            response = random.choice(response) if response else None
+        return response or self.default_response
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'IntentClassifier':
+        """Создает классификатор из словаря формата intents.json"""
+        return cls(
+            data.get('intents', []),
+            default_response=data.get('default_response'),
+            threshold=data.get('threshold')
+        )
+
+
+_file_cache: Dict[str, Tuple[float, IntentClassifier]] = {}
+_file_cache_lock = threading.Lock()
+
+
+def load_bot_intents(bot_dir: Optional[str]) -> Optional[IntentClassifier]:
+    """Загружает интенты бота из intents.json его директории (с кешем по времени изменения)"""
+    if not bot_dir:
+        return None
+    path = os.path.join(bot_dir, INTENTS_FILE_NAME)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _file_cache_lock:
+        cached = _file_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            classifier = IntentClassifier.from_dict(json.load(f))
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки интентов {path}: {e}")
+        return None
+
+    with _file_cache_lock:
+        _file_cache[path] = (mtime, classifier)
+    return classifier
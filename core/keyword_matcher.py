@@ -0,0 +1,136 @@
+from typing import Dict, Iterable, List, Optional, Tuple, Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _is_word_char(char: str) -> bool:
+    """Совпадает с \\w модуля re для str-шаблонов"""
+    return char.isalnum() or char == '_'
+
+
+def _is_boundary(text: str, position: int) -> bool:
+    """Проверяет границу слова \\b в позиции position"""
+    before = position > 0 and _is_word_char(text[position - 1])
+    after = position < len(text) and _is_word_char(text[position])
+    return before != after
+
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик: поиск всех вхождений набора строк за один проход по тексту"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Для каждого состояния - ID шаблонов, заканчивающихся в нем (с учетом суффиксных ссылок)
+        self._output: List[List[int]] = [[]]
+        self.patterns: List[str] = []
+
+        for pattern in patterns:
+            self._add(pattern)
+        self._build_links()
+
+    def _add(self, pattern: str):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(len(self.patterns))
+        self.patterns.append(pattern)
+
+    def _build_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fallback = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fallback if fallback != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text: str):
+        """Возвращает (позиция начала, позиция конца, ID шаблона) для всех вхождений, включая перекрывающиеся"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        patterns = self.patterns
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                end = position + 1
+                for pattern_id in output[state]:
+                    yield end - len(patterns[pattern_id]), end, pattern_id
+
+
+class KeywordMatcher:
+    """
+    Общий матчер ключевых слов нескольких блоков: все наборы компилируются один раз,
+    а сообщение проверяется за один проход независимо от количества ключевых слов
+    """
+
+    def __init__(self, keyword_sets: Iterable[Tuple[Any, List[str], bool, str]]):
+        # Шаблон -> список (порядок владельца, владелец, исходное ключевое слово, точное совпадение)
+        entries_by_pattern: Dict[Tuple[bool, str], List[Tuple[int, Any, str, bool]]] = {}
+        owners = 0
+        for order, (owner, keywords, case_sensitive, match_mode) in enumerate(keyword_sets):
+            owners += 1
+            exact = match_mode == 'exact'
+            for keyword in keywords or []:
+                if not keyword:  # Пропускаем пустые ключевые слова
+                    continue
+                pattern = keyword if case_sensitive else keyword.lower()
+                entries_by_pattern.setdefault((case_sensitive, pattern), []).append((order, owner, keyword, exact))
+
+        # Отдельные автоматы для шаблонов с учетом регистра и без
+        self._automata: Dict[bool, Tuple[AhoCorasick, List[List[Tuple[int, Any, str, bool]]]]] = {}
+        for case_sensitive in (False, True):
+            patterns = [pattern for (sensitive, pattern) in entries_by_pattern if sensitive == case_sensitive]
+            if not patterns:
+                continue
+            automaton = AhoCorasick(patterns)
+            entries = [entries_by_pattern[(case_sensitive, pattern)] for pattern in automaton.patterns]
+            self._automata[case_sensitive] = (automaton, entries)
+
+        self.keywords_count = len(entries_by_pattern)
+        logger.info(f"🔍 Матчер ключевых слов собран: {self.keywords_count} слов в {owners} наборах")
+
+    def match(self, message: str) -> Optional[Tuple[Any, str]]:
+        """
+        Находит владельца с наименьшим порядковым номером, чье ключевое слово есть в сообщении
+        Returns: (владелец, ключевое слово) или None
+        """
+        if not message:
+            return None
+
+        best = None
+        for case_sensitive, (automaton, entries) in self._automata.items():
+            search_message = message if case_sensitive else message.lower()
+            for start, end, pattern_id in automaton.iter_matches(search_message):
+                for entry in entries[pattern_id]:
+                    if best is not None and entry[0] >= best[0]:
+                        continue
+                    # Точное совпадение - ключевое слово должно быть отдельным словом (как \b...\b)
+                    if entry[3] and not (_is_boundary(search_message, start) and _is_boundary(search_message, end)):
+                        continue
+                    best = entry
+
+        if best is None:
+            return None
+        return best[1], best[2]
+
+    def __bool__(self) -> bool:
+        return bool(self._automata)
@@ -0,0 +1,54 @@
+from typing import Dict, Optional, Tuple, Any
+import logging
+import re
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Селекторы вариантов (текстовое/эмодзи-представление), модификаторы тона кожи и ZWJ
+_EMOJI_VARIANT_CHARS = re.compile('[\ufe0e\ufe0f\u200d\U0001F3FB-\U0001F3FF]')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_label(text: Optional[str]) -> str:
+    """Нормализует текст кнопки: регистр, пробелы и варианты эмодзи"""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text)
+    text = _EMOJI_VARIANT_CHARS.sub('', text)
+    text = text.replace('\u200b', '')
+    return _WHITESPACE.sub(' ', text).strip().casefold()
+
+
+class LabelIndex:
+    """Индекс подписей reply-кнопок: нормализованный текст -> (узел, индекс кнопки)"""
+
+    def __init__(self, nodes_map: Dict[str, Any], block_type: str = 'button'):
+        # (ID узла, текст) -> индекс кнопки, для проверки активного узла
+        self._by_node: Dict[Tuple[str, str], int] = {}
+        # текст -> (ID узла, индекс кнопки), первая кнопка в порядке сценария
+        self._global: Dict[str, Tuple[str, int]] = {}
+
+        for node_id, block in nodes_map.items():
+            if getattr(block, 'type', None) != block_type:
+                continue
+            buttons = block.node_data.get('data', {}).get('buttons') or []
+            for index, button in enumerate(buttons):
+                label = normalize_label(button.get('label'))
+                if not label:
+                    continue
+                self._by_node.setdefault((node_id, label), index)
+                self._global.setdefault(label, (node_id, index))
+
+        logger.info(f"🏷️ Индекс подписей кнопок собран: {len(self._global)} подписей")
+
+    def find_in_node(self, node_id: str, normalized_text: str) -> Optional[int]:
+        """Возвращает индекс кнопки узла с указанной подписью"""
+        return self._by_node.get((node_id, normalized_text))
+
+    def find(self, normalized_text: str) -> Optional[Tuple[str, int]]:
+        """Возвращает (ID узла, индекс кнопки) для подписи из любой клавиатуры сценария"""
+        return self._global.get(normalized_text)
+
+    def __len__(self) -> int:
+        return len(self._global)
@@ -0,0 +1,296 @@
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+# Файл кеша file_id в директории бота
+MEDIA_CACHE_FILE_NAME = "media.db"
+
+# Сколько помнить, что Telegram не смог загрузить URL (секунды)
+FAILURE_TTL = float(os.getenv("MEDIA_FAILURE_TTL", 24 * 60 * 60))
+
+# Предзагрузка медиа сценария при запуске бота (в чат администратора или MEDIA_WARMUP_CHAT_ID)
+MEDIA_WARMUP = os.getenv("MEDIA_WARMUP", "false").lower() in ("1", "true", "yes")
+MEDIA_WARMUP_CHAT_ID = os.getenv("MEDIA_WARMUP_CHAT_ID", "")
+
+# Вид медиа -> метод отправки
+SEND_METHODS = {
+    'photo': 'send_photo',
+    'video': 'send_video',
+    'audio': 'send_audio',
+    'document': 'send_document',
+}
+
+# Вид медиа -> класс элемента альбома
+INPUT_MEDIA = {
+    'photo': types.InputMediaPhoto,
+    'video': types.InputMediaVideo,
+    'audio': types.InputMediaAudio,
+    'document': types.InputMediaDocument,
+}
+
+# Виды, которые можно смешивать в одном альбоме: фото с видео, документы и аудио - только между собой
+ALBUM_GROUPS = {'photo': 'visual', 'video': 'visual', 'audio': 'audio', 'document': 'document'}
+
+# Максимум элементов в sendMediaGroup
+ALBUM_SIZE = 10
+
+# Элемент альбома: (вид, путь или URL, подпись)
+MediaItem = Tuple[str, str, Optional[str]]
+
+
+def group_media(items: List[MediaItem]) -> List[List[MediaItem]]:
+    """
+    Раскладывает медиа по совместимым альбомам до ALBUM_SIZE элементов
+    (альбомы идут в порядке первого появления своего вида)
+    """
+    groups: Dict[str, List[MediaItem]] = {}
+    for item in items:
+        groups.setdefault(ALBUM_GROUPS[item[0]], []).append(item)
+    return [group[start:start + ALBUM_SIZE] for group in groups.values()
+            for start in range(0, len(group), ALBUM_SIZE)]
+
+
+class MediaUnavailable(Exception):
+    """URL недавно не удалось отправить - сразу используем запасной вариант"""
+
+
+def is_url(source: str) -> bool:
+    return source.startswith(('http://', 'https://'))
+
+
+def extract_file_id(message, kind: str) -> Optional[str]:
+    """Возвращает file_id из ответа на отправку (для фото - самого большого размера)"""
+    media = getattr(message, kind, None)
+    if isinstance(media, list):
+        media = media[-1] if media else None
+    if media is None:
+        # Telegram может сохранить файл другого вида (например, GIF как animation)
+        for other in ('animation', 'document', 'video', 'audio', 'photo'):
+            media = getattr(message, other, None)
+            if isinstance(media, list):
+                media = media[-1] if media else None
+            if media is not None:
+                break
+    return getattr(media, 'file_id', None)
+
+
+class MediaCache:
+    """
+    Кеш file_id одного бота: локальные файлы ключуются хешем содержимого, ссылки - URL.
+    Первая отправка загружает файл, следующие используют file_id. Ссылки, которые
+    Telegram не смог загрузить, запоминаются на FAILURE_TTL
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        # (вид, ключ) -> file_id
+        self._file_ids: Dict[Tuple[str, str], str] = {}
+        # ключ -> время ошибки
+        self._failures: Dict[str, float] = {}
+        # путь -> (размер, mtime_ns, хеш), чтобы не перечитывать неизмененные файлы
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.uploads = 0
+        self.skipped_failures = 0
+
+        self._connection = None
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS media ("
+                    "kind TEXT NOT NULL, key TEXT NOT NULL, file_id TEXT NOT NULL, updated_at REAL NOT NULL, "
+                    "PRIMARY KEY (kind, key))"
+                )
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS failures (key TEXT PRIMARY KEY, error TEXT, failed_at REAL NOT NULL)"
+                )
+                for kind, key, file_id in self._connection.execute("SELECT kind, key, file_id FROM media"):
+                    self._file_ids[(kind, key)] = file_id
+                cutoff = time.time() - FAILURE_TTL
+                self._connection.execute("DELETE FROM failures WHERE failed_at < ?", (cutoff,))
+                for key, failed_at in self._connection.execute("SELECT key, failed_at FROM failures"):
+                    self._failures[key] = failed_at
+
+    def key_for(self, source: str) -> str:
+        """Ключ источника: URL или SHA-256 содержимого локального файла"""
+        if is_url(source):
+            return f"url:{source}"
+        stat = os.stat(source)
+        with self._lock:
+            cached = self._hashes.get(source)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return f"sha256:{cached[2]}"
+        digest = hashlib.sha256()
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+        with self._lock:
+            self._hashes[source] = (stat.st_size, stat.st_mtime_ns, content_hash)
+        return f"sha256:{content_hash}"
+
+    def get(self, kind: str, key: str) -> Optional[str]:
+        with self._lock:
+            return self._file_ids.get((kind, key))
+
+    def remember(self, kind: str, key: str, file_id: str):
+        with self._lock:
+            self._file_ids[(kind, key)] = file_id
+            self._failures.pop(key, None)
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO media (kind, key, file_id, updated_at) VALUES (?, ?, ?, ?)",
+                        (kind, key, file_id, time.time())
+                    )
+                    self._connection.execute("DELETE FROM failures WHERE key = ?", (key,))
+
+    def forget(self, kind: str, key: str):
+        with self._lock:
+            self._file_ids.pop((kind, key), None)
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("DELETE FROM media WHERE kind = ? AND key = ?", (kind, key))
+
+    def has_failed(self, key: str) -> bool:
+        with self._lock:
+            failed_at = self._failures.get(key)
+        return failed_at is not None and time.time() - failed_at < FAILURE_TTL
+
+    def remember_failure(self, key: str, error: Exception):
+        now = time.time()
+        with self._lock:
+            self._failures[key] = now
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO failures (key, error, failed_at) VALUES (?, ?, ?)",
+                        (key, str(error)[:500], now)
+                    )
+
+    def send(self, bot, kind: str, chat_id: int, source: str, **kwargs):
+        """
+        Отправляет медиа по file_id из кеша, а при его отсутствии - загружает и запоминает file_id
+        Raises: MediaUnavailable, если URL недавно не удалось отправить
+        """
+        method = getattr(bot, SEND_METHODS[kind])
+        key = self.key_for(source)
+
+        file_id = self.get(kind, key)
+        if file_id:
+            try:
+                message = method(chat_id, file_id, **kwargs)
+                self.hits += 1
+                return message
+            except Exception as e:
+                if getattr(e, 'error_code', None) != 400:
+                    raise
+                # file_id другого бота или удаленного файла - загружаем заново
+                logger.warning(f"⚠️ file_id для {source} больше не действителен: {e}")
+                self.forget(kind, key)
+
+        if is_url(source):
+            if self.has_failed(key):
+                self.skipped_failures += 1
+                raise MediaUnavailable(source)
+            try:
+                message = method(chat_id, source, **kwargs)
+            except Exception as e:
+                if getattr(e, 'error_code', None) == 400:
+                    self.remember_failure(key, e)
+                raise
+        else:
+            with open(source, 'rb') as f:
+                message = method(chat_id, f, **kwargs)
+
+        self.uploads += 1
+        file_id = extract_file_id(message, kind)
+        if file_id:
+            self.remember(kind, key, file_id)
+        return message
+
+    def send_group(self, bot, chat_id: int, items: List[MediaItem], **kwargs) -> List:
+        """
+        Отправляет совместимые медиа одним sendMediaGroup (один запрос вместо len(items));
+        один элемент отправляется обычным методом. Ссылки из кеша ошибок нужно отфильтровать заранее
+        """
+        if len(items) == 1:
+            kind, source, caption = items[0]
+            return [self.send(bot, kind, chat_id, source, caption=caption, **kwargs)]
+
+        keys = [self.key_for(source) for _, source, _ in items]
+        with ExitStack() as files:
+            media = []
+            for (kind, source, caption), key in zip(items, keys):
+                file_id = self.get(kind, key)
+                if file_id:
+                    value = file_id
+                elif is_url(source):
+                    value = source
+                else:
+                    value = files.enter_context(open(source, 'rb'))
+                media.append(INPUT_MEDIA[kind](value, caption=caption or None))
+            messages = bot.send_media_group(chat_id, media, **kwargs)
+
+        for (kind, source, _), key, message in zip(items, keys, messages or []):
+            if self.get(kind, key):
+                self.hits += 1
+                continue
+            self.uploads += 1
+            file_id = extract_file_id(message, kind)
+            if file_id:
+                self.remember(kind, key, file_id)
+        return messages
+
+    def has_failed_source(self, source: str) -> bool:
+        """Ссылка недавно не загрузилась в Telegram"""
+        return is_url(source) and self.has_failed(self.key_for(source))
+
+    def is_cached(self, kind: str, source: str) -> bool:
+        try:
+            return self.get(kind, self.key_for(source)) is not None
+        except OSError:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "file_ids": len(self._file_ids),
+                "failed_urls": len(self._failures),
+                "hits": self.hits,
+                "uploads": self.uploads,
+                "skipped_failures": self.skipped_failures,
+            }
+
+
+_caches: Dict[str, MediaCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_media_cache(bot_dir: Optional[str]) -> MediaCache:
+    """Кеш бота (общий для всех его блоков); без директории бота - только в памяти"""
+    if not bot_dir:
+        return MediaCache()
+    path = os.path.join(bot_dir, MEDIA_CACHE_FILE_NAME)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            try:
+                cache = _caches[path] = MediaCache(path)
+            except sqlite3.Error as e:
+                logger.error(f"❌ Не удалось открыть кеш медиа {path}: {e}, используется кеш в памяти")
+                cache = MediaCache()
+        return cache
@@ -101,10 +101,11 @@ class UserManager:
             encrypted_token = encrypt_token(token)
             
             # Check if token already exists for this user and bot
-            query = "SELECT id FROM user_tokens WHERE user_id = %s AND bot_id = %s"
+            query = "SELECT token FROM user_tokens WHERE user_id = %s AND bot_id = %s"
             result = db.execute_query(query, (user_id, bot_id))
             
             if result and len(result) > 0:
+                self._forget_token_identity(result[0][0], token)
                 # Update existing token
                 update_query = "UPDATE user_tokens SET token = %s, created_at = %s WHERE user_id = %s AND bot_id = %s"
                 result = db.execute_update(update_query, (encrypted_token, datetime.now().isoformat(), user_id, bot_id))
@@ -138,6 +139,10 @@ class UserManager:
     def delete_user_token(self, user_id: str, bot_id: str) -> bool:
         """Удаляет токен пользователя"""
         try:
+            result = db.execute_query("SELECT token FROM user_tokens WHERE user_id = %s AND bot_id = %s", (user_id, bot_id))
+            if result and len(result) > 0:
+                self._forget_token_identity(result[0][0])
+
             query = "DELETE FROM user_tokens WHERE user_id = %s AND bot_id = %s"
             result = db.execute_update(query, (user_id, bot_id))
             return result is not None and result > 0
@@ -145,6 +150,18 @@ class UserManager:
             print(f"Ошибка удаления токена пользователя: {e}")
             return False
     
+    @staticmethod
+    def _forget_token_identity(encrypted_token: str, new_token: Optional[str] = None):
+        """Сбрасывает кеш getMe старого токена, если токен бота заменен или удален"""
+        try:
+            from core.security import decrypt_token
+            from core.bot_identity import get_bot_identity
+            old_token = decrypt_token(encrypted_token)
+            if old_token != new_token:
+                get_bot_identity().invalidate(old_token)
+        except Exception as e:
+            print(f"Ошибка сброса кеша токена: {e}")
+
     def register_bot_ownership(self, user_id: str, bot_id: str) -> bool:
         """Регистрирует право собственности пользователя на бота"""
         try:
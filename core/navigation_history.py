@@ -0,0 +1,102 @@
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple, Any
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних шагов хранится для команды "Назад"
+DEFAULT_HISTORY_DEPTH = 10
+
+# Через сколько секунд простоя история чата удаляется
+DEFAULT_HISTORY_TTL = 24 * 60 * 60
+
+# Максимальное число чатов с историей у одного бота
+DEFAULT_MAX_CHATS = 50000
+
+
+class NavigationHistory:
+    """
+    История переходов чатов одного бота: кольцевой буфер фиксированного размера на чат,
+    простаивающие чаты удаляются по TTL, самые старые - при превышении лимита чатов
+    """
+
+    def __init__(self, depth: int = DEFAULT_HISTORY_DEPTH, ttl: Optional[float] = DEFAULT_HISTORY_TTL,
+                 max_chats: int = DEFAULT_MAX_CHATS):
+        self.depth = depth
+        self.ttl = ttl
+        self.max_chats = max_chats
+        # chat_id -> (буфер узлов, время последнего обращения), от давно активных к недавним
+        self._chats: "OrderedDict[int, Tuple[Deque[str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _touch(self, chat_id: int, now: float) -> Deque[str]:
+        """Возвращает буфер чата, создавая его при необходимости, и отмечает обращение"""
+        entry = self._chats.get(chat_id)
+        steps = entry[0] if entry is not None else deque(maxlen=self.depth)
+        self._chats[chat_id] = (steps, now)
+        self._chats.move_to_end(chat_id)
+        return steps
+
+    def _evict(self, now: float):
+        """Удаляет истории, простаивающие дольше TTL, и самые старые сверх лимита"""
+        while self._chats:
+            chat_id, (_, accessed_at) = next(iter(self._chats.items()))
+            expired = self.ttl and now - accessed_at > self.ttl
+            if not expired and len(self._chats) <= self.max_chats:
+                break
+            del self._chats[chat_id]
+
+    def push(self, chat_id: int, node_id: str):
+        """Добавляет узел в историю чата (одинаковые узлы подряд не повторяются)"""
+        now = time.monotonic()
+        with self._lock:
+            steps = self._touch(chat_id, now)
+            if not steps or steps[-1] != node_id:
+                steps.append(node_id)
+                logger.info(f"🗺️ Добавлено в историю {chat_id}: {node_id}")
+            self._evict(now)
+
+    def back(self, chat_id: int) -> Optional[str]:
+        """Убирает текущий узел и возвращает предыдущий (он остается в истории)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            if entry is None or (self.ttl and now - entry[1] > self.ttl):
+                return None
+            steps = self._touch(chat_id, now)
+            if len(steps) < 2:
+                return None
+            steps.pop()
+            previous_node = steps[-1]
+        logger.info(f"↩️ Возврат к узлу {previous_node} для чата {chat_id}")
+        return previous_node
+
+    def clear(self, chat_id: int):
+        """Очищает историю чата"""
+        with self._lock:
+            if self._chats.pop(chat_id, None) is not None:
+                logger.info(f"🧽 Очищена история чата {chat_id}")
+
+    def evict_expired(self):
+        """Удаляет истории чатов, простаивающих дольше TTL"""
+        with self._lock:
+            self._evict(time.monotonic())
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Оценивает память, занятую историей (без строк ID узлов - они общие со сценарием)"""
+        with self._lock:
+            buffers = [steps for steps, _ in self._chats.values()]
+            table_bytes = sys.getsizeof(self._chats)
+        buffer_bytes = sum(sys.getsizeof(steps) for steps in buffers)
+        return {
+            "chats": len(buffers),
+            "steps": sum(len(steps) for steps in buffers),
+            "depth": self.depth,
+            "bytes": table_bytes + buffer_bytes,
+        }
+
+    def __len__(self) -> int:
+        return len(self._chats)
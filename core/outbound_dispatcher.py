@@ -0,0 +1,423 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from collections import deque
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+
+from requests.exceptions import ConnectTimeout
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+try:
+    from aiohttp import ClientConnectorError
+    _ASYNC_CONNECT_ERRORS: tuple = (ClientConnectorError,)
+except ImportError:  # aiohttp нужен только асинхронной среде
+    _ASYNC_CONNECT_ERRORS = ()
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота, ~1 в секунду в личный чат, 20 в минуту в группу
+BOT_RATE = float(os.getenv("OUTBOUND_BOT_RATE", 30))
+CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", 1))
+GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", 20 / 60))
+
+# Сколько сообщений можно отправить в чат подряд, прежде чем включится лимит (ответ блока из нескольких сообщений)
+CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", 5))
+
+# Потоки, выполняющие запросы к API для всех ботов процесса
+DEFAULT_OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", 16))
+
+# Повторы при сетевых ошибках и ответах 5xx: экспоненциальная пауза со случайным разбросом
+MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 5))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30
+
+# Сколько вызывающий поток ждет отправки своего сообщения
+SEND_TIMEOUT = float(os.getenv("OUTBOUND_SEND_TIMEOUT", 300))
+
+# Полосы приоритета: ответы пользователям идут раньше фоновых рассылок
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+# Как часто удалять простаивающие очереди чатов (каждые N постановок)
+SWEEP_INTERVAL = 1024
+
+# Методы API, которые отправляют или меняют сообщения в чате и подпадают под лимиты
+RATE_LIMITED_PREFIXES = ('send_', 'edit_message_', 'forward_message', 'copy_message', 'delete_message')
+
+# Методы, повтор которых после доставки создает второе сообщение: при обрыве или таймауте ответа
+# (запрос мог дойти до Telegram) они не повторяются
+NON_IDEMPOTENT_PREFIXES = ('send_', 'forward_message', 'copy_message')
+
+# Ошибки установки соединения: запрос точно не дошел до Telegram
+CONNECT_ERRORS = (ConnectTimeout, ConnectTimeoutError, NewConnectionError, ConnectionRefusedError) + _ASYNC_CONNECT_ERRORS
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity подряд"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float, count: int = 1) -> float:
+        """Через сколько секунд появятся count токенов (0 - доступны сейчас)"""
+        self._refill(now)
+        count = min(count, self.capacity)
+        return 0.0 if self.tokens >= count else (count - self.tokens) / self.rate
+
+    def take(self, now: float, count: int = 1):
+        self._refill(now)
+        self.tokens -= min(count, self.capacity)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    """Один вызов API с результатом в Future"""
+
+    __slots__ = ('method', 'args', 'kwargs', 'priority', 'weight', 'future', 'attempts', 'positions')
+
+    def __init__(self, method: Callable, args: tuple, kwargs: dict, priority: int, weight: int = 1):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        # Сколько сообщений создает вызов (альбом - по сообщению на элемент)
+        self.weight = weight
+        self.future: Future = Future()
+        self.attempts = 0
+        # Позиции файловых аргументов, чтобы повторная попытка отправила файл целиком
+        self.positions = [(value, value.tell()) for value in itertools.chain(args, kwargs.values())
+                          if hasattr(value, 'seek') and hasattr(value, 'tell')]
+
+    def rewind(self):
+        for value, position in self.positions:
+            try:
+                value.seek(position)
+            except Exception:
+                pass
+
+
+class _ChatLane:
+    """Очередь сообщений одного чата: отправляются строго по порядку, не больше одного одновременно"""
+
+    __slots__ = ('limiter', 'chat_id', 'bucket', 'jobs', 'scheduled', 'busy', 'blocked_until')
+
+    def __init__(self, limiter: '_BotLimiter', chat_id: Any):
+        self.limiter = limiter
+        self.chat_id = chat_id
+        is_group = isinstance(chat_id, int) and chat_id < 0 or isinstance(chat_id, str) and chat_id.startswith('@')
+        self.bucket = TokenBucket(GROUP_RATE, CHAT_BURST) if is_group else TokenBucket(CHAT_RATE, CHAT_BURST)
+        self.jobs: Deque[_Job] = deque()
+        self.scheduled = False
+        self.busy = False
+        self.blocked_until = 0.0
+
+
+class _BotLimiter:
+    """Лимиты одного бота: общая корзина и очереди чатов"""
+
+    def __init__(self, bot_key: str, rate: float):
+        self.bot_key = bot_key
+        self.bucket = TokenBucket(rate, rate)
+        self.lanes: Dict[Any, _ChatLane] = {}
+        self.blocked_until = 0.0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.rate_limited = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": sum(len(lane.jobs) for lane in self.lanes.values()),
+            "chats": sum(1 for lane in self.lanes.values() if lane.jobs),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+        }
+
+
+def message_weight(method_name: str, args: tuple, kwargs: dict) -> int:
+    """Сколько сообщений в чате создает вызов: лимиты Telegram считают каждый элемент альбома"""
+    if method_name == 'send_media_group':
+        media = kwargs.get('media', args[1] if len(args) > 1 else None)
+        return max(len(media or []), 1)
+    return 1
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Возвращает retry_after из ответа 429 Too Many Requests"""
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    parameters = (getattr(error, 'result_json', None) or {}).get('parameters') or {}
+    return float(parameters.get('retry_after', 1))
+
+
+def is_connect_error(error: Exception) -> bool:
+    """
+    Соединение с Telegram не установлено. Клиенты оборачивают исходную ошибку
+    (requests - MaxRetryError с reason, telebot asyncio - RequestTimeout), поэтому проверяется вся цепочка
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, CONNECT_ERRORS) or isinstance(getattr(error, 'reason', None), CONNECT_ERRORS):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def is_transient(error: Exception, method_name: str = '') -> bool:
+    """
+    Можно ли повторить вызов: ответы 5xx и ошибки соединения - да. Обрыв или таймаут чтения ответа
+    повторяется только для методов без побочного эффекта при повторе (правка, удаление):
+    сообщение могло быть уже доставлено, и повтор send* прислал бы его дважды
+    """
+    code = getattr(error, 'error_code', None)
+    if code is not None:
+        return code >= 500
+    if is_connect_error(error):
+        return True
+    if method_name.startswith(NON_IDEMPOTENT_PREFIXES):
+        return False
+    return isinstance(error, (OSError, TimeoutError))
+
+
+class OutboundDispatcher:
+    """
+    Общая для процесса очередь исходящих запросов к Telegram API: корзины токенов
+    на бота и на чат, учет retry_after, повторы с разбросом и полосы приоритета.
+    Сообщения одного чата отправляются по порядку, разные чаты - параллельно
+    """
+
+    def __init__(self, workers: int = DEFAULT_OUTBOUND_WORKERS, bot_rate: float = BOT_RATE):
+        self.bot_rate = bot_rate
+        self._limiters: Dict[str, _BotLimiter] = {}
+        # Чаты, ожидающие токена или паузы: (время готовности, номер, очередь чата)
+        self._waiting: List[Tuple[float, int, _ChatLane]] = []
+        # Готовые к отправке чаты: (приоритет первого сообщения, номер, очередь чата)
+        self._ready: List[Tuple[int, int, _ChatLane]] = []
+        self._sequence = itertools.count()
+        self._submitted = 0
+        self._condition = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"outbound-{index}", daemon=True)
+            for index in range(max(workers, 1))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, bot_key: str, chat_id: Any, method: Callable, *args,
+               priority: int = PRIORITY_NORMAL, weight: int = 1, **kwargs) -> Future:
+        """Ставит вызов method(*args, **kwargs) в очередь чата; результат - в возвращаемом Future"""
+        job = _Job(method, args, kwargs, priority, weight)
+        with self._condition:
+            limiter = self._limiters.get(bot_key)
+            if limiter is None:
+                limiter = self._limiters[bot_key] = _BotLimiter(bot_key, self.bot_rate)
+            lane = limiter.lanes.get(chat_id)
+            if lane is None:
+                lane = limiter.lanes[chat_id] = _ChatLane(limiter, chat_id)
+            lane.jobs.append(job)
+            now = time.monotonic()
+            self._schedule(lane, now)
+            self._submitted += 1
+            if self._submitted % SWEEP_INTERVAL == 0:
+                self._sweep(now)
+        return job.future
+
+    def _sweep(self, now: float):
+        """Удаляет пустые очереди чатов, корзины которых успели наполниться (их состояние не нужно)"""
+        for limiter in self._limiters.values():
+            idle = [chat_id for chat_id, lane in limiter.lanes.items()
+                    if not lane.jobs and not lane.busy and not lane.scheduled and lane.bucket.is_full(now)]
+            for chat_id in idle:
+                del limiter.lanes[chat_id]
+
+    def _schedule(self, lane: _ChatLane, now: float):
+        """Ставит чат в очередь готовности, если у него есть сообщения и он не отправляет сейчас"""
+        if lane.scheduled or lane.busy or not lane.jobs:
+            return
+        lane.scheduled = True
+        ready_at = max(now + lane.bucket.delay(now), lane.blocked_until, lane.limiter.blocked_until)
+        if ready_at <= now:
+            heapq.heappush(self._ready, (lane.jobs[0].priority, next(self._sequence), lane))
+        else:
+            heapq.heappush(self._waiting, (ready_at, next(self._sequence), lane))
+        self._condition.notify()
+
+    def _next_lane(self) -> _ChatLane:
+        """Ждет чат, которому можно отправить сообщение, и забирает токены"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                while self._waiting and self._waiting[0][0] <= now:
+                    _, sequence, lane = heapq.heappop(self._waiting)
+                    heapq.heappush(self._ready, (lane.jobs[0].priority, sequence, lane))
+                if not self._ready:
+                    timeout = self._waiting[0][0] - now if self._waiting else None
+                    self._condition.wait(timeout)
+                    continue
+
+                _, sequence, lane = heapq.heappop(self._ready)
+                limiter = lane.limiter
+                weight = lane.jobs[0].weight
+                ready_at = max(now + limiter.bucket.delay(now, weight), limiter.blocked_until, lane.blocked_until)
+                if ready_at > now:
+                    # Бот исчерпал лимит: чат подождет вместе с остальными чатами бота
+                    heapq.heappush(self._waiting, (ready_at, sequence, lane))
+                    continue
+
+                # Общий лимит бота считает каждое сообщение альбома, лимит чата - запрос
+                limiter.bucket.take(now, weight)
+                lane.bucket.take(now)
+                lane.scheduled = False
+                lane.busy = True
+                return lane
+
+    def _run(self):
+        while True:
+            lane = self._next_lane()
+            job = lane.jobs[0]
+            if job.attempts == 0 and not job.future.set_running_or_notify_cancel():
+                self._complete(lane, job)
+                continue
+            job.attempts += 1
+            try:
+                result = job.method(*job.args, **job.kwargs)
+            except Exception as e:
+                self._on_error(lane, job, e)
+            else:
+                lane.limiter.sent += 1
+                job.future.set_result(result)
+                self._complete(lane, job)
+
+    def _complete(self, lane: _ChatLane, job: _Job):
+        with self._condition:
+            lane.jobs.popleft()
+            lane.busy = False
+            # Пустая очередь остается до очистки: ее корзина помнит недавние отправки в чат
+            self._schedule(lane, time.monotonic())
+
+    def _on_error(self, lane: _ChatLane, job: _Job, error: Exception):
+        limiter = lane.limiter
+        pause = retry_after(error)
+        if pause is not None:
+            # 429: останавливаем весь бот - Telegram считает лимит на токен
+            limiter.rate_limited += 1
+            logger.warning(f"⏳ Бот {limiter.bot_key}: лимит Telegram, пауза {pause} сек (чат {lane.chat_id})")
+            with self._condition:
+                limiter.blocked_until = max(limiter.blocked_until, time.monotonic() + pause)
+        elif is_transient(error, getattr(job.method, '__name__', '')) and job.attempts <= MAX_RETRIES:
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+            delay *= random.uniform(0.5, 1.5)
+            limiter.retried += 1
+            logger.warning(f"🔁 Повтор отправки в чат {lane.chat_id} через {delay:.1f} сек: {error}")
+            with self._condition:
+                lane.blocked_until = time.monotonic() + delay
+        else:
+            limiter.failed += 1
+            job.future.set_exception(error)
+            self._complete(lane, job)
+            return
+
+        job.rewind()
+        with self._condition:
+            lane.busy = False
+            self._schedule(lane, time.monotonic())
+
+    def forget_bot(self, bot_key: str):
+        """Удаляет счетчики остановленного бота (неотправленные сообщения дорабатываются)"""
+        with self._condition:
+            limiter = self._limiters.get(bot_key)
+            if limiter is not None and not any(lane.jobs or lane.busy for lane in limiter.lanes.values()):
+                del self._limiters[bot_key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Очереди и счетчики по ботам"""
+        with self._condition:
+            bots = {bot_key: limiter.stats() for bot_key, limiter in self._limiters.items()}
+            return {
+                "workers": len(self._threads),
+                "ready_chats": len(self._ready),
+                "waiting_chats": len(self._waiting),
+                "queued": sum(bot["queued"] for bot in bots.values()),
+                "bots": bots,
+            }
+
+
+class RateLimitedBot:
+    """
+    Обертка бота для блоков сценария: методы отправки проходят через OutboundDispatcher,
+    вызывающий поток ждет результат (исключения API пробрасываются как раньше),
+    остальные методы вызываются напрямую
+    """
+
+    def __init__(self, bot, bot_key: str, dispatcher: Optional[OutboundDispatcher] = None,
+                 priority: int = PRIORITY_INTERACTIVE):
+        self._bot = bot
+        self._bot_key = bot_key
+        self._dispatcher = dispatcher or get_outbound_dispatcher()
+        self._priority = priority
+
+    @property
+    def bot(self):
+        return self._bot
+
+    def with_priority(self, priority: int) -> 'RateLimitedBot':
+        """Та же обертка с другой полосой приоритета (например, PRIORITY_BULK для рассылок)"""
+        return RateLimitedBot(self._bot, self._bot_key, self._dispatcher, priority)
+
+    def submit(self, method_name: str, chat_id: Any, *args, **kwargs) -> Future:
+        """Ставит отправку в очередь без ожидания"""
+        method = getattr(self._bot, method_name)
+        weight = message_weight(method_name, (chat_id,) + args, kwargs)
+        return self._dispatcher.submit(self._bot_key, chat_id, method, chat_id, *args,
+                                       priority=self._priority, weight=weight, **kwargs)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._bot, name)
+        if not name.startswith(RATE_LIMITED_PREFIXES) or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            chat_id = kwargs.get('chat_id', args[0] if args else None)
+            future = self._dispatcher.submit(self._bot_key, chat_id, attribute, *args, priority=self._priority,
+                                             weight=message_weight(name, args, kwargs), **kwargs)
+            try:
+                return future.result(SEND_TIMEOUT)
+            except FutureTimeoutError:
+                future.cancel()
+                raise
+
+        return call
+
+
+_dispatcher: Optional[OutboundDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_outbound_dispatcher() -> OutboundDispatcher:
+    """Возвращает общую для всех ботов процесса очередь исходящих запросов"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = OutboundDispatcher()
+        return _dispatcher
@@ -0,0 +1,136 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from .intent_classifier import INTENTS_FILE_NAME
+from .scenario_runner import CompiledScenario
+
+logger = logging.getLogger(__name__)
+
+
+def _intents_stamp(bot_dir: Optional[str]) -> Optional[int]:
+    """mtime intents.json бота: блоки NLP загружают его при подготовке"""
+    if not bot_dir:
+        return None
+    try:
+        return os.stat(os.path.join(bot_dir, INTENTS_FILE_NAME)).st_mtime_ns
+    except OSError:
+        return None
+
+
+class CachedScenario:
+    """Загруженный сценарий бота: проверенная модель, ее словарь и скомпилированные блоки"""
+
+    def __init__(self, owner: str, bot_id: str, stamp: Tuple[int, int], digest: str, scenario: Any):
+        self.owner = owner
+        self.bot_id = bot_id
+        # (mtime_ns, размер) файла, по которому проверена актуальность записи
+        self.stamp = stamp
+        self.digest = digest
+        self.scenario = scenario
+        self._scenario_data: Optional[Dict] = None
+        # (директория бота, mtime intents.json) -> блоки и план: блоки готовятся с учетом данных директории
+        self._compiled: Dict[Tuple[Optional[str], Optional[int]], CompiledScenario] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def key(self) -> Tuple[str, str, int, str]:
+        return self.owner, self.bot_id, self.stamp[0], self.digest
+
+    @property
+    def scenario_data(self) -> Dict:
+        """Словарь сценария для исполнителя (scenario.dict()), строится один раз"""
+        with self._lock:
+            if self._scenario_data is None:
+                self._scenario_data = self.scenario.dict()
+            return self._scenario_data
+
+    def compiled(self, bot_dir: Optional[str] = None) -> CompiledScenario:
+        """Блоки, индексы и план сценария для директории бота, компилируются один раз"""
+        scenario_data = self.scenario_data
+        key = (bot_dir, _intents_stamp(bot_dir))
+        with self._lock:
+            compiled = self._compiled.get(key)
+            if compiled is None:
+                self._compiled = {key: CompiledScenario(scenario_data, bot_dir)}
+                compiled = self._compiled[key]
+            return compiled
+
+
+class ScenarioCache:
+    """
+    Кеш сценариев процесса по (владелец, бот). Актуальность проверяется по stat файла:
+    файл читается только при изменении mtime или размера, а если содержимое не изменилось
+    (совпал хеш), сохраняется прежняя запись вместе со скомпилированными блоками
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], CachedScenario] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.reads = 0
+        self.parses = 0
+
+    def load(self, owner: str, bot_id: str, path: str,
+             parse: Callable[[Dict], Any]) -> Optional[CachedScenario]:
+        """
+        Возвращает сценарий из кеша или читает файл; parse строит модель из JSON
+        Returns: None, если файла нет. Ошибки чтения и разбора не кешируются
+        """
+        key = (owner, bot_id)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate(bot_id, owner)
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.stamp == stamp:
+                self.hits += 1
+                return entry
+            self.reads += 1
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+
+        if entry is not None and entry.digest == digest:
+            # Файл перезаписан тем же содержимым
+            entry.stamp = stamp
+            return entry
+
+        scenario = parse(json.loads(content))
+        entry = CachedScenario(owner, bot_id, stamp, digest, scenario)
+        with self._lock:
+            self.parses += 1
+            self._entries[key] = entry
+        logger.info(f"📄 Сценарий бота {bot_id} загружен ({len(content)} байт)")
+        return entry
+
+    def invalidate(self, bot_id: str, owner: Optional[str] = None):
+        """Забывает сценарий бота (при сохранении, переименовании, удалении)"""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == bot_id and owner in (None, key[0])]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"scenarios": len(self._entries), "hits": self.hits, "reads": self.reads, "parses": self.parses}
+
+
+_cache: Optional[ScenarioCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_scenario_cache() -> ScenarioCache:
+    """Возвращает общий для процесса кеш сценариев"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ScenarioCache()
+        return _cache
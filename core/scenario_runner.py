@@ -1,18 +1,46 @@
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Tuple, Any
 import telebot
 from .block_registry import block_registry
+from .edge_index import EdgeIndex
+from .execution_plan import ExecutionPlan, INTERACTION_COMPLETE, SUSPEND_CHAIN, compile_scenario
+from .callback_router import CallbackRouter
+from .label_index import LabelIndex, normalize_label
+from .keyword_matcher import KeywordMatcher
+from .session_store import SessionStore, create_session_store
+from .templates import set_variable
+from .timer_scheduler import TIMERS_FILE_NAME, TimerDeferred, TimerScheduler
+from .update_dispatcher import get_update_dispatcher
 import logging
+import os
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Сколько секунд таймер ждет, пока очередь чата дойдет до отложенного продолжения (иначе таймер переносится)
+TIMER_RESUME_TIMEOUT = float(os.getenv("TIMER_RESUME_TIMEOUT", 5))
 
-class ScenarioRunner:
-    """Исполнитель сценариев Telegram бота"""
 
-    def __init__(self, scenario_data: Dict):
+class CompiledScenario:
+    """
+    Неизменяемая часть исполнителя: экземпляры блоков, индексы и план.
+    Не хранит состояния пользователей, поэтому может переиспользоваться
+    при перезапуске бота с тем же сценарием
+    """
+
+    def __init__(self, scenario_data: Dict, bot_dir: Optional[str] = None):
         self.scenario_data = scenario_data
+        self.bot_dir = bot_dir
         self.nodes_map = self._create_nodes_map()
-        self.user_contexts = {}  # Храним контекст для каждого пользователя
+        # Индексы связей строятся один раз, чтобы переходы не требовали обхода всех edges
+        self.edge_index = EdgeIndex(self.scenario_data.get('edges', []))
+        # Скомпилированный план: переходы, интерактивные блоки и цепочки автоперехода
+        self.plan: ExecutionPlan = compile_scenario(self.scenario_data, self.nodes_map, self.edge_index)
+        # Таблица callback_data -> (узел, кнопка) для inline-клавиатур
+        self.callback_router = CallbackRouter(self.nodes_map)
+        # Индекс нормализованных подписей reply-кнопок
+        self.label_index = LabelIndex(self.nodes_map)
+        # Общий матчер ключевых слов всех блоков keyword_processor
+        self.keyword_matcher = self._create_keyword_matcher()
 
     def _create_nodes_map(self) -> Dict[str, Any]:
         """Создает карту узлов с экземплярами блоков"""
@@ -20,25 +48,387 @@ class ScenarioRunner:
         for node in self.scenario_data.get('nodes', []):
             try:
                 block = block_registry.create_block_instance(node)
+                block.prepare(bot_dir=self.bot_dir, scenario_data=self.scenario_data)
                 nodes_map[node['id']] = block
             except Exception as e:
                 logger.error(f"Ошибка создания блока {node.get('id')}: {e}")
         return nodes_map
 
+    def _create_keyword_matcher(self) -> KeywordMatcher:
+        """Компилирует ключевые слова всех блоков keyword_processor в один матчер"""
+        keyword_sets = []
+        for node_id in self.plan.nodes_of_type('keyword_processor'):
+            block = self.nodes_map.get(node_id)
+            if block:
+                keyword_sets.append((node_id, block.keywords, block.case_sensitive, block.match_mode))
+        return KeywordMatcher(keyword_sets)
+
+
+class ScenarioRunner:
+    """Исполнитель сценариев Telegram бота"""
+
+    def __init__(self, scenario_data: Dict, bot_dir: Optional[str] = None,
+                 session_store: Optional[SessionStore] = None,
+                 compiled: Optional[CompiledScenario] = None):
+        self.scenario_data = scenario_data
+        # Директория бота с его данными (интенты NLP и т.п.), может отсутствовать
+        self.bot_dir = bot_dir
+        # Блоки и индексы сценария; готовые берутся из кеша сценариев, если он их передал
+        if compiled is None:
+            compiled = CompiledScenario(scenario_data, bot_dir)
+        self.compiled = compiled
+        self.nodes_map = compiled.nodes_map
+        self.edge_index = compiled.edge_index
+        self.plan: ExecutionPlan = compiled.plan
+        self.callback_router = compiled.callback_router
+        self.label_index = compiled.label_index
+        self.keyword_matcher = compiled.keyword_matcher
+        # Контексты пользователей: ограниченное хранилище, переживающее перезапуск бота
+        self.user_contexts: SessionStore = session_store or create_session_store(self.bot_dir)
+        # Планировщик отложенных продолжений, создается при подключении бота (start_timers)
+        self.timer_scheduler: Optional[TimerScheduler] = None
+
     def get_next_node_id(self, current_node_id: str, handle_id: Optional[str] = None) -> Optional[str]:
-        """Находит следующий узел на основе связей (работает со словарями)"""
-        edges = self.scenario_data.get('edges', [])
+        """Находит следующий узел по плану исполнения"""
         logger.info(f"🔍 Ищем следующий узел для {current_node_id}, handle: {handle_id}")
 
-        for edge in edges:
-            if edge.get('source') == current_node_id:
-                if handle_id is None or edge.get('sourceHandle') == handle_id:
-                    target = edge.get('target')
-                    logger.info(f"   ✅ Найдено совпадение: {target}")
-                    return target
+        target = self.plan.successor(current_node_id, handle_id)
+        if target:
+            logger.info(f"   ✅ Найдено совпадение: {target}")
+            return target
         logger.info("   ❌ Совпадений не найдено")
         return None
 
+    def get_previous_node_ids(self, node_id: str) -> List[str]:
+        """Возвращает узлы, из которых есть связь в указанный узел"""
+        return self.edge_index.previous_node_ids(node_id)
+
+    def resolve_callback(self, callback_data: str) -> Optional[Tuple[str, int]]:
+        """Находит (ID узла, индекс кнопки) по callback_data inline-кнопки"""
+        return self.callback_router.resolve(callback_data)
+
+    def get_callback_data(self, node_id: str, button_index: int) -> Optional[str]:
+        """Возвращает callback_data кнопки узла (для имитации нажатия при скрытой клавиатуре)"""
+        block = self.nodes_map.get(node_id)
+        if not block or getattr(block, 'type', None) != 'inline_button':
+            return None
+        buttons = block.node_data.get('data', {}).get('buttons') or []
+        if not 0 <= button_index < len(buttons):
+            return None
+        return block.get_callback_data(button_index, buttons[button_index])
+
+    def get_start_node_id(self) -> Optional[str]:
+        """Возвращает ID стартового узла сценария"""
+        return self.plan.start_node_id
+
+    def run_chain(self, bot: telebot.TeleBot, chat_id: int, node_id: str,
+                  on_enter: Optional[Callable[[str], None]] = None, **kwargs) -> Optional[str]:
+        """
+        Выполняет узел и следующие за ним неинтерактивные блоки подряд,
+        останавливаясь на первом интерактивном блоке или в конце цепочки
+        Returns: ID последнего выполненного узла или None
+        """
+        last_node_id = None
+        current = node_id
+        # Защита от бесконечных переходов, если блоки сами возвращают следующий узел по кругу
+        steps_left = max(len(self.plan.node_types), 1) * 2
+
+        while current and steps_left > 0:
+            chain = self.plan.chain(current)
+            current = None
+            for position, step_id in enumerate(chain):
+                if on_enter:
+                    on_enter(step_id)
+                next_node_id = self.process_node(bot, chat_id, step_id, **kwargs)
+                last_node_id = step_id
+                steps_left -= 1
+
+                if next_node_id == SUSPEND_CHAIN:
+                    # Продолжение запланировано блоком - сейчас чат ничего не ждет
+                    logger.info(f"⏸️ Цепочка приостановлена на узле {step_id}")
+                    self.set_active_node(chat_id, None)
+                    return last_node_id
+
+                if self.plan.is_interactive(step_id):
+                    # Чат ждет ответа именно от этого узла
+                    self.set_active_node(chat_id, step_id)
+                    return last_node_id
+
+                expected = chain[position + 1] if position + 1 < len(chain) else None
+                if next_node_id is not None and next_node_id != expected:
+                    # Блок сам выбрал переход вне основной цепочки
+                    current = next_node_id if expected is not None or next_node_id not in chain else None
+                    break
+
+        # Цепочка закончилась без интерактивного блока - чат больше ничего не ждет
+        if last_node_id is not None:
+            self.set_active_node(chat_id, None)
+        return last_node_id
+
+    def get_active_node(self, chat_id: int) -> Optional[str]:
+        """Возвращает интерактивный узел, ответа на который ждет чат"""
+        return self.get_user_context(chat_id).get('active_node_id')
+
+    def set_active_node(self, chat_id: int, node_id: Optional[str]):
+        """Запоминает интерактивный узел чата (None - чат ничего не ждет)"""
+        user_context = self.get_user_context(chat_id)
+        if node_id is None:
+            if 'active_node_id' not in user_context:
+                return
+            user_context.pop('active_node_id')
+        elif user_context.get('active_node_id') == node_id:
+            return
+        else:
+            user_context['active_node_id'] = node_id
+        self.save_user_context(chat_id, user_context)
+
+    def get_user_context(self, chat_id: int) -> Dict[str, Any]:
+        """Возвращает контекст пользователя (пустой, если чат еще не сохранялся)"""
+        user_context = self.user_contexts.get(chat_id)
+        return user_context if user_context is not None else {}
+
+    def save_user_context(self, chat_id: int, user_context: Dict[str, Any]):
+        """Сохраняет контекст пользователя в хранилище"""
+        self.user_contexts.set(chat_id, user_context)
+
+    def remember_answer(self, chat_id: int, node_id: str, value: Any):
+        """Сохраняет ответ пользователя в переменную узла (data.variableName), если она задана"""
+        block = self.nodes_map.get(node_id)
+        name = block.node_data.get('data', {}).get('variableName') if block else None
+        if not name or value is None:
+            return
+        user_context = self.get_user_context(chat_id)
+        if set_variable(user_context, name, value):
+            self.save_user_context(chat_id, user_context)
+
+    def remember_user(self, chat_id: int, user) -> None:
+        """Сохраняет имя пользователя Telegram в переменные first_name, last_name и username"""
+        if user is None:
+            return
+        user_context = self.get_user_context(chat_id)
+        changed = False
+        for name in ('first_name', 'last_name', 'username'):
+            changed = set_variable(user_context, name, getattr(user, name, None) or '') or changed
+        if changed:
+            self.save_user_context(chat_id, user_context)
+
+    def _button_label(self, node_id: str, button_index: int) -> Optional[str]:
+        block = self.nodes_map.get(node_id)
+        buttons = (block.node_data.get('data', {}).get('buttons') or []) if block else []
+        if 0 <= button_index < len(buttons):
+            return buttons[button_index].get('label', '')
+        return None
+
+    def session_stats(self) -> Dict[str, Any]:
+        """Возвращает статистику хранилища контекстов"""
+        return self.user_contexts.stats()
+
+    def start_timers(self, bot: telebot.TeleBot, on_enter: Optional[Callable[[int, str], None]] = None,
+                     bot_id: Optional[str] = None):
+        """
+        Запускает планировщик отложенных продолжений для бота и восстанавливает сохраненные таймеры
+        on_enter(chat_id, node_id) вызывается для каждого узла продолженной цепочки
+        bot_id - ключ очередей диспетчера обновлений: продолжение выполняется в очереди чата,
+        строго по порядку с его обновлениями (без bot_id - прямо в потоке таймеров)
+        """
+        if self.timer_scheduler is not None:
+            return
+
+        def continue_chain(chat_id: int, node_id: str):
+            next_node_id = self.plan.successor(node_id)
+            if not next_node_id:
+                logger.info(f"⏹️ После задержки в узле {node_id} переходов нет")
+                return
+            logger.info(f"⏰ Продолжаем чат {chat_id} после узла {node_id}")
+            self.run_chain(bot, chat_id, next_node_id,
+                           on_enter=(lambda step_id: on_enter(chat_id, step_id)) if on_enter else None)
+
+        def resume(chat_id: int, node_id: str):
+            if bot_id is None:
+                continue_chain(chat_id, node_id)
+                return
+
+            done = threading.Event()
+            state_lock = threading.Lock()
+            # queued -> running, либо queued -> abandoned, если таймер перенесен раньше, чем очередь дошла до задачи
+            state = 'queued'
+
+            def task():
+                nonlocal state
+                with state_lock:
+                    if state == 'abandoned':
+                        return
+                    state = 'running'
+                try:
+                    continue_chain(chat_id, node_id)
+                finally:
+                    done.set()
+
+            if not get_update_dispatcher().submit((bot_id, chat_id), task):
+                raise TimerDeferred(f"очередь обновлений чата {chat_id} заполнена")
+            # Таймер удаляется с диска после возврата: ждем, пока продолжение выполнится
+            if done.wait(TIMER_RESUME_TIMEOUT):
+                return
+            with state_lock:
+                if state == 'queued':
+                    state = 'abandoned'
+                    raise TimerDeferred(f"очередь чата {chat_id} не дошла до продолжения за {TIMER_RESUME_TIMEOUT} сек")
+            # Продолжение уже выполняется и не потеряется, пока процесс жив
+            if not done.wait(TIMER_RESUME_TIMEOUT):
+                logger.warning(f"⚠️ Продолжение чата {chat_id} выполняется дольше {2 * TIMER_RESUME_TIMEOUT} сек")
+
+        path = os.path.join(self.bot_dir, TIMERS_FILE_NAME) if self.bot_dir else None
+        self.timer_scheduler = TimerScheduler(resume, path=path)
+
+    def warm_media(self, bot: telebot.TeleBot, chat_id: int) -> int:
+        """
+        Загружает в Telegram медиа всех блоков, которых еще нет в кеше file_id, отправляя их
+        в служебный чат (сообщения сразу удаляются). Returns: число загруженных файлов
+        """
+        uploaded = 0
+        for node_id, block in self.nodes_map.items():
+            cache = getattr(block, 'media_cache', None)
+            if cache is None:
+                continue
+            for kind, source in block.media_sources():
+                if cache.is_cached(kind, source):
+                    continue
+                try:
+                    message = cache.send(bot, kind, chat_id, source, disable_notification=True)
+                    uploaded += 1
+                    bot.delete_message(chat_id, message.message_id)
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось предзагрузить {source} (узел {node_id}): {e}")
+        logger.info(f"🖼️ Предзагружено медиа: {uploaded}")
+        return uploaded
+
+    def cancel_delay(self, chat_id: int):
+        """Отменяет отложенное продолжение чата (например, при новом /start)"""
+        if self.timer_scheduler is not None:
+            self.timer_scheduler.cancel(chat_id)
+
+    def close(self):
+        """Останавливает таймеры, сохраняет контексты и закрывает хранилище"""
+        if self.timer_scheduler is not None:
+            self.timer_scheduler.close()
+            self.timer_scheduler = None
+        logger.info(f"💾 Хранилище контекстов закрывается: {self.session_stats()}")
+        self.user_contexts.close()
+
+    def handle_keyword_message(self, bot: telebot.TeleBot, chat_id: int, text: str, **kwargs) -> bool:
+        """
+        Проверяет сообщение ключевыми словами всех блоков keyword_processor за один проход
+        и продолжает сценарий от первого совпавшего блока
+        Returns: True если ключевое слово найдено
+        """
+        match = self.keyword_matcher.match(text) if self.keyword_matcher else None
+        if not match:
+            return False
+
+        node_id, keyword = match
+        logger.info(f"🔍 Найдено ключевое слово '{keyword}' блока {node_id}")
+        # Продолжаем выполнение сценария по основной связи блока
+        next_node_id = self.get_next_node_id(node_id)
+        if next_node_id:
+            self.run_chain(bot, chat_id, next_node_id, **kwargs)
+        return True
+
+    def handle_text_message(self, bot: telebot.TeleBot, message, **kwargs) -> bool:
+        """
+        Направляет текстовое сообщение обработчикам активного узла чата,
+        а если он не ответил - глобальным обработчикам
+        Returns: True если сообщение обработано
+        """
+        chat_id = message.chat.id
+        active_node_id = self.get_active_node(chat_id)
+        # Нормализуем текст один раз на сообщение
+        label = normalize_label(message.text)
+        if active_node_id and self._dispatch_to_node(bot, message, active_node_id, label, **kwargs):
+            return True
+        return self._dispatch_fallback(bot, message, active_node_id, label, **kwargs)
+
+    def _dispatch_to_node(self, bot: telebot.TeleBot, message, node_id: str, label: str, **kwargs) -> bool:
+        """Передает сообщение обработчику, который ожидает узел node_id"""
+        chat_id = message.chat.id
+        text = message.text or ''
+        block_type = self.plan.node_types.get(node_id)
+
+        if block_type == 'button':
+            button_index = self._match_button(node_id, text, label)
+            if button_index is not None:
+                logger.info(f"🔘 Нажата кнопка {button_index} узла {node_id}")
+                self.handle_button_press(bot, chat_id, node_id, button_index)
+                return True
+
+        elif block_type == 'inline_button':
+            block = self.nodes_map.get(node_id)
+            hide_keyboard = block.node_data.get('data', {}).get('hideKeyboard', False) if block else False
+            if hide_keyboard and text.isdigit():
+                callback_data = self.get_callback_data(node_id, int(text) - 1)  # Пользователь вводит 1-based индекс
+                if callback_data:
+                    logger.info(f"🔘 Выбран inline-вариант {text} узла {node_id}")
+                    self.handle_inline_button_press(bot, message, node_id, callback_data)
+                    return True
+
+        elif block_type == 'schedule':
+            logger.info(f"📅 Обработка ответа для блока расписания: {text}")
+            self.handle_schedule_response(bot, chat_id, node_id, text)
+            return True
+
+        elif block_type == 'nlp_response':
+            return self._dispatch_nlp(bot, chat_id, node_id, text, **kwargs)
+
+        return False
+
+    def _dispatch_fallback(self, bot: telebot.TeleBot, message, active_node_id: Optional[str],
+                           label: str, **kwargs) -> bool:
+        """Глобальные обработчики: кнопки старых клавиатур и NLP-блок сценария"""
+        chat_id = message.chat.id
+        text = message.text or ''
+
+        route = self.label_index.find(label) if label else None
+        if route and route[0] != active_node_id:
+            node_id, button_index = route
+            logger.info(f"🔘 Нажата кнопка {button_index} узла {node_id} (вне активного узла)")
+            self.handle_button_press(bot, chat_id, node_id, button_index)
+            return True
+
+        nlp_nodes = self.plan.nodes_of_type('nlp_response')
+        if nlp_nodes and nlp_nodes[0] != active_node_id:
+            return self._dispatch_nlp(bot, chat_id, nlp_nodes[0], text, **kwargs)
+
+        return False
+
+    def _dispatch_nlp(self, bot: telebot.TeleBot, chat_id: int, node_id: str, text: str, **kwargs) -> bool:
+        """Передает сообщение NLP-блоку, если уверенность классификатора не ниже порога блока"""
+        block = self.nodes_map.get(node_id)
+        if not block:
+            return False
+
+        intent, confidence = block.classify(text)
+        if not block.accepts(confidence):
+            logger.info(f"🧠 NLP-блок {node_id} пропускает сообщение: уверенность {confidence:.2f}")
+            return False
+
+        logger.info(f"🧠 Обработка сообщения с помощью NLP: {text} (интент {intent}, {confidence:.2f})")
+        self.process_node(bot, chat_id, node_id, nlp_intent=(intent, confidence), **kwargs)
+        return True
+
+    def _match_button(self, node_id: str, text: str, label: str) -> Optional[int]:
+        """Находит индекс reply-кнопки узла по подписи или по номеру варианта"""
+        block = self.nodes_map.get(node_id)
+        if not block:
+            return None
+        data = block.node_data.get('data', {})
+
+        # Если клавиатура скрыта, пользователь отвечает номером варианта
+        if data.get('hideKeyboard', False) and text.isdigit():
+            button_index = int(text) - 1
+            if 0 <= button_index < len(data.get('buttons') or []):
+                return button_index
+
+        return self.label_index.find_in_node(node_id, label) if label else None
+
     def process_node(self, bot: telebot.TeleBot, chat_id: int, node_id: str, **kwargs) -> Optional[str]:
         """Обрабатывает указанный узел"""
         block = self.nodes_map.get(node_id)
@@ -50,17 +440,23 @@ class ScenarioRunner:
             logger.info(f"🔹 Обрабатываем узел {node_id} типа {block.type}")
 
             # Передаем контекст пользователя в блок
-            user_context = self.user_contexts.get(chat_id, {})
+            user_context = self.get_user_context(chat_id)
             kwargs['user_context'] = user_context
             
             # Передаем данные сценария в блок
             kwargs['scenario_data'] = self.scenario_data
 
+            # Планировщик, через который блоки откладывают продолжение цепочки
+            kwargs['timer_scheduler'] = self.timer_scheduler
+
             # Выполняем блок
             next_node_id = block.execute(bot, chat_id, **kwargs)
 
             # Сохраняем обновленный контекст
-            self.user_contexts[chat_id] = user_context
+            self.save_user_context(chat_id, user_context)
+
+            if next_node_id == SUSPEND_CHAIN:
+                return next_node_id
 
             # Если блок не вернул следующий узел, ищем его по связям
             if next_node_id is None:
@@ -89,7 +485,7 @@ class ScenarioRunner:
 
         try:
             # Получаем контекст пользователя
-            user_context = self.user_contexts.get(chat_id, {})
+            user_context = self.get_user_context(chat_id)
             
             # Определяем, какой тип ответа мы ожидаем (дата или время)
             if 'selected_date' not in user_context:
@@ -100,7 +496,18 @@ class ScenarioRunner:
                 next_node_id = block.process_time_response(bot, chat_id, user_response, user_context=user_context, scenario_data=self.scenario_data)
             
             # Сохраняем обновленный контекст
-            self.user_contexts[chat_id] = user_context
+            self.save_user_context(chat_id, user_context)
+
+            if next_node_id == INTERACTION_COMPLETE:
+                # Запись завершена: чат больше не ждет блок расписания, сценарий идет дальше
+                self.set_active_node(chat_id, None)
+                next_node_id = self.plan.successor(node_id)
+                if not next_node_id:
+                    logger.info("⏹️ Конец цепочки")
+                    return None
+                logger.info(f"➡️ Переходим к узлу {next_node_id}")
+                self.run_chain(bot, chat_id, next_node_id)
+                return next_node_id
 
             if next_node_id:
                 logger.info(f"➡️ Переходим к узлу {next_node_id}")
@@ -117,6 +524,32 @@ class ScenarioRunner:
                 pass
             return None
 
+    def handle_schedule_slot(self, bot: telebot.TeleBot, call) -> bool:
+        """
+        Обрабатывает нажатие кнопки свободного времени блока расписания
+        Returns: True если callback_data относится к кнопке времени
+        """
+        slot = self.callback_router.resolve_slot(call.data)
+        if slot is None:
+            return False
+
+        node_id, date_str, time_str = slot
+        chat_id = call.message.chat.id
+        user_context = self.get_user_context(chat_id)
+        if self.get_active_node(chat_id) != node_id or user_context.get('selected_date') != date_str:
+            bot.answer_callback_query(call.id, text="Эта кнопка больше не активна")
+            return True
+
+        bot.answer_callback_query(call.id)
+        try:
+            # Клавиатура выбора больше не нужна: при занятом слоте блок пришлет новую
+            bot.edit_message_reply_markup(chat_id=chat_id, message_id=call.message.message_id, reply_markup=None)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось убрать клавиатуру времени: {e}")
+        logger.info(f"📅 Выбрано время {time_str} на {date_str} в узле {node_id}")
+        self.handle_schedule_response(bot, chat_id, node_id, time_str)
+        return True
+
     def handle_inline_button_press(self, bot: telebot.TeleBot, call, node_id: str, callback_data: str) -> Optional[str]:
         """Обрабатывает нажатие inline-кнопки"""
         block = self.nodes_map.get(node_id)
@@ -124,15 +557,17 @@ class ScenarioRunner:
             return None
 
         try:
-            # Ответим на callback запрос (если это callback)
-            if hasattr(call, 'id'):
+            # Ответим на callback запрос (если это callback, а не текстовый ответ при скрытой клавиатуре)
+            if hasattr(call, 'id') and hasattr(call, 'data'):
                 bot.answer_callback_query(call.id)
 
-            # Ищем следующий узел для этой кнопки
-            next_node_id = block.get_next_node_id_for_button(
-                callback_data,
-                self.scenario_data.get('edges', [])
-            )
+            # Ищем следующий узел для этой кнопки по таблице маршрутов
+            next_node_id = None
+            route = self.callback_router.resolve(callback_data)
+            if route and route[0] == node_id:
+                next_node_id = self.plan.successor(node_id, str(route[1]))
+                chat_id = call.message.chat.id if hasattr(call, 'message') else call.chat.id
+                self.remember_answer(chat_id, node_id, self._button_label(node_id, route[1]))
 
             if next_node_id:
                 logger.info(f"🔘 Нажата inline-кнопка {callback_data}, переходим к {next_node_id}")
@@ -158,7 +593,7 @@ class ScenarioRunner:
 
                 # Определяем chat_id
                 chat_id = call.message.chat.id if hasattr(call, 'message') else call.chat.id
-                return self.process_node(bot, chat_id, next_node_id)
+                return self.run_chain(bot, chat_id, next_node_id)
             else:
                 chat_id = call.message.chat.id if hasattr(call, 'message') else call.chat.id
                 bot.send_message(chat_id, "Спасибо за выбор!")
@@ -175,12 +610,14 @@ class ScenarioRunner:
             return None
 
         try:
+            self.remember_answer(chat_id, node_id, self._button_label(node_id, button_index))
+
             # Ищем следующий узел для этой кнопки
             next_node_id = self.get_next_node_id(node_id, str(button_index))
 
             if next_node_id:
                 logger.info(f"🔘 Нажата кнопка {button_index}, переходим к {next_node_id}")
-                return self.process_node(bot, chat_id, next_node_id)
+                return self.run_chain(bot, chat_id, next_node_id)
             else:
                 bot.send_message(chat_id, "Спасибо за выбор!")
                 return None
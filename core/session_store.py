@@ -0,0 +1,408 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Any
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Файл базы сессий в директории бота
+SESSIONS_FILE_NAME = "sessions.db"
+
+# Бэкенд по умолчанию: memory, sqlite или hybrid
+DEFAULT_BACKEND = os.getenv("SESSION_STORE", "hybrid")
+
+# Ограничения хранилища в памяти
+DEFAULT_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", 10000))
+DEFAULT_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", 32 * 1024 * 1024))
+DEFAULT_TTL = float(os.getenv("SESSION_TTL", 30 * 60))
+
+# Время жизни контекстов на диске и интервал фоновой записи
+DEFAULT_DISK_TTL = float(os.getenv("SESSION_DISK_TTL", 30 * 24 * 60 * 60))
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", 5))
+
+
+def serialize_context(context: Dict[str, Any]) -> str:
+    """Сериализует контекст пользователя в JSON"""
+    return json.dumps(context, ensure_ascii=False, default=str)
+
+
+class SessionStore(ABC):
+    """Абстрактное хранилище контекстов пользователей: chat_id -> dict"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def get(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """Возвращает контекст чата или None"""
+        pass
+
+    @abstractmethod
+    def set(self, chat_id: int, context: Dict[str, Any]):
+        """Сохраняет контекст чата"""
+        pass
+
+    @abstractmethod
+    def delete(self, chat_id: int):
+        """Удаляет контекст чата"""
+        pass
+
+    @abstractmethod
+    def chat_ids(self, after: Optional[int] = None, limit: int = 1000) -> List[int]:
+        """Возвращает до limit известных chat_id больше after по возрастанию (для обхода частями)"""
+        pass
+
+    def close(self):
+        """Освобождает ресурсы хранилища"""
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """LRU-хранилище в памяти с TTL простоя и ограничением по числу записей и объему"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: Optional[float] = DEFAULT_TTL,
+                 on_evict: Optional[Callable[[int, Dict[str, Any]], None]] = None):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # Вызывается для вытесненных контекстов (например, чтобы сбросить их на диск)
+        self.on_evict = on_evict
+        # chat_id -> (контекст, оценка размера, время последнего обращения), от старых к новым
+        self._entries: "OrderedDict[int, Tuple[Dict[str, Any], int, float]]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+
+    def get(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            now = time.monotonic()
+            if entry is not None and self.ttl and now - entry[2] > self.ttl:
+                evicted.append((chat_id, self._pop(chat_id)))
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                context = None
+            else:
+                self.hits += 1
+                self._entries[chat_id] = (entry[0], entry[1], now)
+                self._entries.move_to_end(chat_id)
+                context = entry[0]
+        self._notify(evicted)
+        return context
+
+    def set(self, chat_id: int, context: Dict[str, Any], size: Optional[int] = None):
+        if size is None:
+            size = len(serialize_context(context))
+        with self._lock:
+            previous = self._entries.pop(chat_id, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[chat_id] = (context, size, time.monotonic())
+            self._bytes += size
+            evicted = self._evict()
+        self._notify(evicted)
+
+    def delete(self, chat_id: int):
+        with self._lock:
+            if chat_id in self._entries:
+                self._pop(chat_id)
+
+    def chat_ids(self, after: Optional[int] = None, limit: int = 1000) -> List[int]:
+        with self._lock:
+            keys = [chat_id for chat_id in self._entries if after is None or chat_id > after]
+        return heapq.nsmallest(limit, keys)
+
+    def _pop(self, chat_id: int) -> Dict[str, Any]:
+        context, size, _ = self._entries.pop(chat_id)
+        self._bytes -= size
+        return context
+
+    def _evict(self):
+        """Вытесняет просроченные записи и самые старые сверх лимитов"""
+        evicted = []
+        now = time.monotonic()
+        while self._entries:
+            chat_id, (_, _, accessed_at) = next(iter(self._entries.items()))
+            expired = self.ttl and now - accessed_at > self.ttl
+            over_limit = len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            # Последнюю запись не вытесняем по объему, иначе большой контекст сразу потеряется
+            if not expired and not (over_limit and len(self._entries) > 1):
+                break
+            evicted.append((chat_id, self._pop(chat_id)))
+        self.evictions += len(evicted)
+        return evicted
+
+    def evict_expired(self):
+        """Вытесняет контексты чатов, простаивающих дольше TTL"""
+        with self._lock:
+            evicted = self._evict()
+        self._notify(evicted)
+
+    def _notify(self, evicted):
+        if not self.on_evict:
+            return
+        for chat_id, context in evicted:
+            try:
+                self.on_evict(chat_id, context)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработки вытесненного контекста {chat_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            stats.update({
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+            })
+        return stats
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Хранилище контекстов в SQLite-файле директории бота"""
+
+    def __init__(self, path: str, ttl: Optional[float] = DEFAULT_DISK_TTL):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "chat_id INTEGER PRIMARY KEY, context TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+        self.purge_expired()
+
+    def get(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT context FROM sessions WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            return json.loads(row[0])
+        except ValueError as e:
+            logger.error(f"❌ Поврежденный контекст чата {chat_id}: {e}")
+            return None
+
+    def set(self, chat_id: int, context: Dict[str, Any]):
+        self.set_many([(chat_id, serialize_context(context))])
+
+    def set_many(self, items: Iterable[Tuple[int, str]]):
+        """Сохраняет уже сериализованные контексты одной транзакцией"""
+        now = time.time()
+        rows = [(chat_id, payload, now) for chat_id, payload in items]
+        if not rows:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO sessions (chat_id, context, updated_at) VALUES (?, ?, ?)", rows
+            )
+
+    def delete(self, chat_id: int):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM sessions WHERE chat_id = ?", (chat_id,))
+
+    def chat_ids(self, after: Optional[int] = None, limit: int = 1000) -> List[int]:
+        # Обход по первичному ключу: каждая часть - отдельный короткий запрос по индексу
+        with self._lock:
+            if after is None:
+                rows = self._connection.execute(
+                    "SELECT chat_id FROM sessions ORDER BY chat_id LIMIT ?", (limit,)
+                ).fetchall()
+            else:
+                rows = self._connection.execute(
+                    "SELECT chat_id FROM sessions WHERE chat_id > ? ORDER BY chat_id LIMIT ?", (after, limit)
+                ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge_expired(self):
+        """Удаляет контексты, не обновлявшиеся дольше TTL"""
+        if not self.ttl:
+            return
+        with self._lock, self._connection:
+            deleted = self._connection.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+        if deleted:
+            logger.info(f"🧽 Удалено устаревших контекстов: {deleted}")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class HybridSessionStore(SessionStore):
+    """
+    Горячие контексты в памяти, остальные на диске: изменения пишутся в SQLite
+    пачками в фоне, а вытесненные из памяти чаты догружаются с диска
+    """
+
+    def __init__(self, memory: MemorySessionStore, disk: SQLiteSessionStore,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        super().__init__()
+        self.memory = memory
+        self.disk = disk
+        self.memory.on_evict = self._spill
+        # chat_id -> сериализованный контекст, еще не записанный на диск
+        self._dirty: Dict[int, str] = {}
+        self._dirty_lock = threading.Lock()
+        # Записи на диск идут по одной: более старая версия контекста не перезапишет более новую
+        self._write_lock = threading.Lock()
+        # Промахи памяти, найденные в очереди записи или на диске
+        self.restored = 0
+        self._flush_interval = flush_interval
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-flush", daemon=True)
+        self._flusher.start()
+
+    def get(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        # Попадания и промахи считает слой памяти, здесь - только догруженные после промаха
+        context = self.memory.get(chat_id)
+        if context is not None:
+            return context
+
+        with self._dirty_lock:
+            payload = self._dirty.get(chat_id)
+        context = json.loads(payload) if payload is not None else self.disk.get(chat_id)
+        if context is None:
+            return None
+
+        self.restored += 1
+        self.memory.set(chat_id, context, size=len(payload) if payload is not None else None)
+        return context
+
+    def set(self, chat_id: int, context: Dict[str, Any]):
+        # Сериализуем сразу: запись в фоне не должна читать словарь, который меняет другой поток
+        payload = serialize_context(context)
+        with self._dirty_lock:
+            self._dirty[chat_id] = payload
+        self.memory.set(chat_id, context, size=len(payload))
+
+    def delete(self, chat_id: int):
+        self.memory.delete(chat_id)
+        with self._write_lock:
+            with self._dirty_lock:
+                self._dirty.pop(chat_id, None)
+            self.disk.delete(chat_id)
+
+    def _spill(self, chat_id: int, context: Dict[str, Any]):
+        """Вытесненный из памяти контекст сразу записывается на диск, если он изменен"""
+        with self._write_lock:
+            with self._dirty_lock:
+                payload = self._dirty.get(chat_id)
+            if payload is not None:
+                self.disk.set_many([(chat_id, payload)])
+                self._forget_written({chat_id: payload})
+
+    def flush(self):
+        """Записывает на диск все измененные контексты"""
+        with self._write_lock:
+            with self._dirty_lock:
+                dirty = dict(self._dirty)
+            if not dirty:
+                return
+            try:
+                self.disk.set_many(dirty.items())
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи контекстов на диск: {e}")
+                return
+            self._forget_written(dirty)
+
+    def _forget_written(self, written: Dict[int, str]):
+        """
+        Убирает записанные контексты из измененных. До конца записи они остаются в _dirty,
+        чтобы get вытесненного чата не прочитал с диска старую версию; измененные за время записи остаются
+        """
+        with self._dirty_lock:
+            for chat_id, payload in written.items():
+                if self._dirty.get(chat_id) is payload:
+                    del self._dirty[chat_id]
+
+    def chat_ids(self, after: Optional[int] = None, limit: int = 1000) -> List[int]:
+        # Все известные чаты есть на диске после записи измененных контекстов
+        self.flush()
+        return self.disk.chat_ids(after, limit)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self._flush_interval):
+            self.memory.evict_expired()
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join(timeout=self._flush_interval + 1)
+        self.flush()
+        self.disk.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Попадания и промахи слоя памяти, догрузки с диска и состояние обоих слоев"""
+        memory = self.memory.stats()
+        stats = {key: memory.pop(key) for key in ("hits", "misses", "hit_rate")}
+        stats["restored"] = self.restored
+        with self._dirty_lock:
+            stats["dirty"] = len(self._dirty)
+        stats["memory"] = memory
+        stats["disk"] = self.disk.stats()
+        return stats
+
+    def __len__(self) -> int:
+        self.flush()
+        return len(self.disk)
+
+
+def create_session_store(bot_dir: Optional[str] = None, backend: Optional[str] = None) -> SessionStore:
+    """Создает хранилище контекстов; без директории бота доступно только хранилище в памяти"""
+    backend = (backend or DEFAULT_BACKEND).lower()
+    if backend not in ("memory", "sqlite", "hybrid"):
+        logger.warning(f"⚠️ Неизвестное хранилище сессий '{backend}', используется memory")
+        backend = "memory"
+
+    if backend == "memory" or not bot_dir:
+        return MemorySessionStore()
+
+    path = os.path.join(bot_dir, SESSIONS_FILE_NAME)
+    try:
+        if backend == "sqlite":
+            return SQLiteSessionStore(path)
+        return HybridSessionStore(MemorySessionStore(), SQLiteSessionStore(path))
+    except sqlite3.Error as e:
+        logger.error(f"❌ Не удалось открыть хранилище сессий {path}: {e}, используется memory")
+        return MemorySessionStore()
@@ -0,0 +1,98 @@
+from typing import Any, Dict, Optional
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from telebot import apihelper
+
+logger = logging.getLogger(__name__)
+
+# Соединений в пуле на один хост. Каждый бот в потоковом режиме держит одно соединение long polling,
+# поэтому пул должен покрывать число ботов плюс потоки отправки
+POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", 128))
+
+# Сколько пулов разных хостов хранить (api.telegram.org, локальный Bot API, файловый сервер)
+POOL_HOSTS = int(os.getenv("TELEGRAM_POOL_HOSTS", 4))
+
+# Таймауты запросов к Bot API (секунды); для getUpdates таймаут чтения telebot увеличивает сам
+CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", 30))
+
+# Повторы на уровне соединения: только ошибки установки соединения, чтобы не отправить сообщение дважды
+CONNECT_RETRIES = 3
+
+
+class TelegramHTTPSession:
+    """
+    Общая для процесса keep-alive сессия requests для всех ботов: соединения с Bot API
+    переиспользуются между ботами и потоками вместо отдельной сессии (и TLS-рукопожатия) на поток
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, pool_hosts: int = POOL_HOSTS):
+        self.session = requests.Session()
+        retry = Retry(total=CONNECT_RETRIES, connect=CONNECT_RETRIES, read=0, status=0,
+                      backoff_factor=0.3, raise_on_status=False)
+        self.adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size,
+                                   max_retries=retry, pool_block=False)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Отправитель запросов для apihelper.CUSTOM_REQUEST_SENDER"""
+        started = time.monotonic()
+        try:
+            return self.session.request(method, url, **kwargs)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.requests += 1
+                self.total_time += time.monotonic() - started
+
+    def stats(self) -> Dict[str, Any]:
+        """Запросы, открытые соединения и доля запросов, выполненных по уже открытому соединению"""
+        pools = []
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                pools.append(pool)
+        connections = sum(pool.num_connections for pool in pools)
+        pool_requests = sum(pool.num_requests for pool in pools)
+        with self._lock:
+            requests_count, errors, total_time = self.requests, self.errors, self.total_time
+        return {
+            "requests": requests_count,
+            "errors": errors,
+            "connections_opened": connections,
+            "reuse_rate": round(1 - connections / pool_requests, 4) if pool_requests else 0.0,
+            "avg_latency_ms": round(total_time / requests_count * 1000, 1) if requests_count else 0.0,
+            "pool_size": self.adapter._pool_maxsize,
+            "hosts": len(pools),
+        }
+
+
+_session: Optional[TelegramHTTPSession] = None
+_session_lock = threading.Lock()
+
+
+def get_telegram_session() -> TelegramHTTPSession:
+    """Возвращает общую сессию; при первом вызове подключает ее ко всем синхронным клиентам telebot"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = TelegramHTTPSession()
+            apihelper.CUSTOM_REQUEST_SENDER = _session.request
+            apihelper.CONNECT_TIMEOUT = CONNECT_TIMEOUT
+            apihelper.READ_TIMEOUT = READ_TIMEOUT
+            logger.info(f"🔌 Общая HTTP-сессия Telegram: пул {POOL_SIZE} соединений на хост")
+        return _session
@@ -0,0 +1,102 @@
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+import html
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Сколько скомпилированных шаблонов держать в памяти (общий кеш всех ботов процесса)
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", 4096))
+
+# Ключ контекста пользователя, под которым лежат переменные сценария
+VARIABLES_KEY = "variables"
+
+# Подстановка: {{имя}} или {{имя|значение по умолчанию}}
+PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*(?:\|([^{}]*?))?\s*\}\}")
+
+_MARKDOWN_SPECIAL = re.compile(r"([_*`\[])")
+_MARKDOWN_V2_SPECIAL = re.compile(r"([_*\[\]()~`>#+\-=|{}.!\\])")
+
+# parse_mode -> экранирование подставляемых значений (текст самого шаблона не экранируется)
+ESCAPERS: Dict[Optional[str], Callable[[str], str]] = {
+    None: lambda value: value,
+    'Markdown': lambda value: _MARKDOWN_SPECIAL.sub(r"\\\1", value),
+    'MarkdownV2': lambda value: _MARKDOWN_V2_SPECIAL.sub(r"\\\1", value),
+    'HTML': lambda value: html.escape(value, quote=False),
+}
+
+
+class Template:
+    """
+    Скомпилированный шаблон текста блока: разбор выполняется один раз,
+    render только подставляет экранированные значения в готовую строку формата
+    """
+
+    __slots__ = ('source', 'parse_mode', 'fields', '_format', '_escape')
+
+    def __init__(self, source: str, parse_mode: Optional[str] = None):
+        if parse_mode not in ESCAPERS:
+            raise ValueError(f"Неизвестный parse_mode шаблона: {parse_mode}")
+        self.source = source
+        self.parse_mode = parse_mode
+        self._escape = ESCAPERS[parse_mode]
+
+        fields = []
+        parts = []
+        position = 0
+        for match in PLACEHOLDER.finditer(source):
+            parts.append(source[position:match.start()].replace('{', '{{').replace('}', '}}'))
+            parts.append(f"{{{len(fields)}}}")
+            fields.append((match.group(1), match.group(2) or ''))
+            position = match.end()
+        parts.append(source[position:].replace('{', '{{').replace('}', '}}'))
+
+        # (имя, значение по умолчанию) в порядке появления
+        self.fields: Tuple[Tuple[str, str], ...] = tuple(fields)
+        self._format = ''.join(parts) if fields else source
+
+    @property
+    def is_static(self) -> bool:
+        """Шаблон без подстановок - текст одинаков для всех чатов"""
+        return not self.fields
+
+    def render(self, variables: Optional[Dict[str, Any]] = None, **extra) -> str:
+        """Подставляет значения: сначала из extra, затем из variables, иначе значение по умолчанию"""
+        if not self.fields:
+            return self.source
+        variables = variables or {}
+        escape = self._escape
+        values = []
+        for name, default in self.fields:
+            value = extra[name] if name in extra else variables.get(name)
+            values.append(default if value is None else escape(str(value)))
+        return self._format.format(*values)
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(source: Optional[str], parse_mode: Optional[str] = None) -> Template:
+    """Компилирует шаблон; одинаковые тексты разных узлов и ботов компилируются один раз"""
+    return Template(source or '', parse_mode)
+
+
+def user_variables(user_context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Переменные сценария из контекста пользователя"""
+    if not user_context:
+        return {}
+    return user_context.get(VARIABLES_KEY) or {}
+
+
+def set_variable(user_context: Dict[str, Any], name: Optional[str], value: Any) -> bool:
+    """
+    Сохраняет значение переменной в контексте пользователя
+    Returns: True если контекст изменился
+    """
+    if not name:
+        return False
+    variables = user_context.setdefault(VARIABLES_KEY, {})
+    if variables.get(name) == value:
+        return False
+    variables[name] = value
+    return True
@@ -0,0 +1,97 @@
+"""
+Возобновление рассылки с сохраненного места: курсор и отправленные за ним чаты.
+
+    python -m unittest core.test_broadcast
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+from core import broadcast as broadcast_module
+from core.broadcast import BROADCASTS_DIR_NAME, STATUS_COMPLETED, STATUS_RUNNING, Broadcast, BroadcastManager
+from core.session_store import MemorySessionStore
+
+logging.disable(logging.CRITICAL)
+
+BOT_ID = 'bot'
+
+
+class RecordingSender:
+    """Отправитель-заглушка: запоминает получателей и сразу завершает отправку"""
+
+    def __init__(self):
+        self.chat_ids = []
+        self._lock = threading.Lock()
+
+    def with_priority(self, priority):
+        return self
+
+    def submit(self, method, chat_id, text, **kwargs):
+        with self._lock:
+            self.chat_ids.append(chat_id)
+        future = Future()
+        future.set_result(True)
+        return future
+
+
+class BroadcastResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bot_dir = tempfile.mkdtemp()
+        self.store = MemorySessionStore()
+        for chat_id in range(1, 21):
+            self.store.set(chat_id, {})
+        self.sender = RecordingSender()
+        self.manager = BroadcastManager()
+
+    def tearDown(self):
+        self.manager.detach(BOT_ID)
+
+    def saved_broadcast(self, cursor=None, completed=()):
+        """Рассылка, остановленная на полпути, как ее оставляет detach"""
+        directory = os.path.join(self.bot_dir, BROADCASTS_DIR_NAME)
+        os.makedirs(directory, exist_ok=True)
+        broadcast = Broadcast(BOT_ID, 'Новости')
+        broadcast.path = os.path.join(directory, f"{broadcast.id}.json")
+        broadcast.cursor = cursor
+        broadcast.completed = list(completed)
+        broadcast.sent = len(broadcast.completed) + (cursor or 0)
+        broadcast.save()
+        return broadcast.id
+
+    def resume(self, broadcast_id):
+        self.manager.attach(BOT_ID, self.sender, self.store, self.bot_dir)
+        broadcast = self.manager.get(BOT_ID, broadcast_id)
+        deadline = time.monotonic() + 5
+        while (broadcast.status == STATUS_RUNNING or broadcast.active) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return broadcast
+
+    def test_resume_skips_fully_completed_chunk(self):
+        broadcast_id = self.saved_broadcast(completed=range(1, 6))
+
+        with mock.patch.object(broadcast_module, 'CHUNK_SIZE', 5):
+            broadcast = self.resume(broadcast_id)
+
+        self.assertEqual(broadcast.status, STATUS_COMPLETED)
+        self.assertEqual(sorted(self.sender.chat_ids), list(range(6, 21)))
+        self.assertEqual(broadcast.sent, 20)
+
+    def test_resume_skips_completed_chunks_after_cursor(self):
+        broadcast_id = self.saved_broadcast(cursor=3, completed=[5] + list(range(6, 16)))
+
+        with mock.patch.object(broadcast_module, 'CHUNK_SIZE', 5):
+            broadcast = self.resume(broadcast_id)
+
+        self.assertEqual(broadcast.status, STATUS_COMPLETED)
+        self.assertEqual(sorted(self.sender.chat_ids), [4] + list(range(16, 21)))
+        self.assertEqual(broadcast.completed, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
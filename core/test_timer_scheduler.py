@@ -0,0 +1,115 @@
+"""
+Отложенные продолжения, которые нельзя выполнить сразу: перенос таймера без потери записи на диске.
+
+    python -m unittest core.test_timer_scheduler
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from core import scenario_runner as scenario_runner_module
+from core import timer_scheduler as timer_scheduler_module
+from core.scenario_runner import ScenarioRunner
+from core.session_store import MemorySessionStore
+from core.timer_scheduler import TIMERS_FILE_NAME, TimerDeferred, TimerScheduler
+from core.update_dispatcher import get_update_dispatcher
+
+logging.disable(logging.CRITICAL)
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class TimerDeferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), TIMERS_FILE_NAME)
+
+    def rows(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute("SELECT chat_id, node_id FROM timers").fetchall()
+        finally:
+            connection.close()
+
+    def test_deferred_timer_fires_again(self):
+        calls = []
+
+        def callback(chat_id, node_id):
+            calls.append((chat_id, node_id))
+            if len(calls) == 1:
+                raise TimerDeferred("занято", delay=0.05)
+
+        scheduler = TimerScheduler(callback, path=self.path)
+        scheduler.schedule(1, 'd', 0)
+
+        self.assertTrue(wait_for(lambda: len(calls) == 2 and not self.rows()))
+        scheduler.close()
+        self.assertEqual(calls, [(1, 'd'), (1, 'd')])
+
+    def test_deferred_timer_stays_on_disk_after_close(self):
+        fired = threading.Event()
+
+        def callback(chat_id, node_id):
+            fired.set()
+            raise TimerDeferred("занято", delay=60)
+
+        scheduler = TimerScheduler(callback, path=self.path)
+        scheduler.schedule(1, 'd', 0)
+        self.assertTrue(fired.wait(5))
+        self.assertTrue(wait_for(lambda: scheduler.stats()["running"] == 0))
+        scheduler.close()
+
+        self.assertEqual(self.rows(), [(1, 'd')])
+
+
+class RecordingBot:
+    token = None
+
+    def __init__(self):
+        self.texts = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.texts.append(text)
+
+
+class ResumeInChatQueueTest(unittest.TestCase):
+
+    def test_busy_chat_queue_defers_continuation_once(self):
+        scenario = {
+            'nodes': [{'id': 'd', 'type': 'delay', 'data': {'seconds': 0}},
+                      {'id': 'm', 'type': 'message', 'data': {'label': 'после задержки'}}],
+            'edges': [{'source': 'd', 'target': 'm'}],
+        }
+        runner = ScenarioRunner(scenario, session_store=MemorySessionStore())
+        bot = RecordingBot()
+        release = threading.Event()
+        # Обновление чата занимает его очередь дольше, чем таймер готов ждать
+        get_update_dispatcher().submit(('timer-test', 9), release.wait, 5)
+
+        with mock.patch.object(scenario_runner_module, 'TIMER_RESUME_TIMEOUT', 0.1), \
+                mock.patch.object(timer_scheduler_module, 'DEFAULT_RETRY_DELAY', 0.3):
+            runner.start_timers(bot, bot_id='timer-test')
+            runner.timer_scheduler.schedule(9, 'd', 0)
+            time.sleep(0.2)
+            # Таймер не держит поток в ожидании очереди, а снова ждет своего времени
+            self.assertEqual(runner.timer_scheduler.stats(), {"pending": 1, "running": 0})
+            release.set()
+            self.assertTrue(wait_for(lambda: bot.texts and runner.timer_scheduler.stats()["pending"] == 0))
+            time.sleep(0.5)
+
+        runner.close()
+        self.assertEqual(bot.texts, ['после задержки'])
+
+
+if __name__ == '__main__':
+    unittest.main()
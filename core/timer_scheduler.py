@@ -0,0 +1,222 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Any
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Файл отложенных продолжений в директории бота
+TIMERS_FILE_NAME = "timers.db"
+
+# Сколько сработавших таймеров всех ботов выполняется одновременно
+DEFAULT_TIMER_WORKERS = int(os.getenv("TIMER_WORKERS", 4))
+
+# Через сколько секунд повторить продолжение, которое не удалось выполнить сразу (очередь чата занята)
+DEFAULT_RETRY_DELAY = float(os.getenv("TIMER_RETRY_DELAY", 5))
+
+
+class TimerDeferred(Exception):
+    """Исключение callback: продолжение сейчас не выполнено, таймер переносится на delay секунд и остается на диске"""
+
+    def __init__(self, message: str, delay: Optional[float] = None):
+        super().__init__(message)
+        self.delay = DEFAULT_RETRY_DELAY if delay is None else delay
+
+
+class _TimerService:
+    """Общий для процесса поток ожидания таймеров всех ботов и пул обработки сработавших"""
+
+    def __init__(self, workers: int = DEFAULT_TIMER_WORKERS):
+        # (время срабатывания, порядковый номер, слабая ссылка на планировщик, chat_id)
+        self._heap: List[Tuple[float, int, 'weakref.ref[TimerScheduler]', int]] = []
+        self._condition = threading.Condition()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="timer")
+        self._thread = threading.Thread(target=self._run, name="timer-scheduler", daemon=True)
+        self._thread.start()
+
+    def push(self, fire_at: float, sequence: int, scheduler: 'TimerScheduler', chat_id: int):
+        with self._condition:
+            heapq.heappush(self._heap, (fire_at, sequence, weakref.ref(scheduler), chat_id))
+            if self._heap[0][1] == sequence:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.time():
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._condition.wait(timeout)
+                _, sequence, scheduler_ref, chat_id = heapq.heappop(self._heap)
+            scheduler = scheduler_ref()
+            if scheduler is not None:
+                scheduler._on_due(chat_id, sequence)
+
+
+_service: Optional[_TimerService] = None
+_service_lock = threading.Lock()
+
+
+def _get_service() -> _TimerService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = _TimerService()
+        return _service
+
+
+class TimerScheduler:
+    """
+    Планировщик отложенных продолжений сценария одного бота: таймеры хранятся в SQLite,
+    а ожидают в общей куче процесса - на все таймеры всех ботов один поток ожидания
+    и небольшой пул для обработки сработавших, у каждого чата не больше одного продолжения
+    """
+
+    # Порядковые номера общие для всех планировщиков, чтобы записи кучи не сравнивались дальше
+    _sequence = itertools.count()
+
+    def __init__(self, callback: Callable[[int, str], None], path: Optional[str] = None):
+        # callback(chat_id, node_id) вызывается, когда таймер срабатывает
+        self.callback = callback
+        self.path = path
+        # chat_id -> (порядковый номер, ID узла, время срабатывания); устаревшие записи кучи пропускаются
+        self._pending: Dict[int, Tuple[int, str, float]] = {}
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._running = 0
+        self._idle = threading.Condition(self._lock)
+        self._service = _get_service()
+
+        self._connection = None
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._db_lock = threading.Lock()
+            with self._db_lock, self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute("PRAGMA synchronous=NORMAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS timers ("
+                    "chat_id INTEGER PRIMARY KEY, node_id TEXT NOT NULL, fire_at REAL NOT NULL)"
+                )
+            self._restore()
+
+    def _restore(self):
+        """Загружает таймеры, сохраненные до перезапуска (просроченные сработают сразу)"""
+        with self._db_lock:
+            rows = self._connection.execute("SELECT chat_id, node_id, fire_at FROM timers").fetchall()
+        for chat_id, node_id, fire_at in rows:
+            self._push(chat_id, node_id, fire_at)
+        if rows:
+            logger.info(f"⏰ Восстановлено отложенных продолжений: {len(rows)}")
+
+    def _push(self, chat_id: int, node_id: str, fire_at: float):
+        sequence = next(self._sequence)
+        with self._lock:
+            self._pending[chat_id] = (sequence, node_id, fire_at)
+        self._service.push(fire_at, sequence, self, chat_id)
+
+    def schedule(self, chat_id: int, node_id: str, delay: float):
+        """Запланировать продолжение чата с узла node_id через delay секунд (заменяет прежнее)"""
+        fire_at = time.time() + max(delay, 0)
+        if self._connection is not None:
+            with self._db_lock, self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO timers (chat_id, node_id, fire_at) VALUES (?, ?, ?)",
+                    (chat_id, node_id, fire_at)
+                )
+        self._push(chat_id, node_id, fire_at)
+        logger.info(f"⏰ Продолжение чата {chat_id} с узла {node_id} через {delay} сек")
+
+    def cancel(self, chat_id: int) -> bool:
+        """Отменяет отложенное продолжение чата"""
+        with self._lock:
+            cancelled = self._pending.pop(chat_id, None) is not None
+        if cancelled:
+            self._delete(chat_id)
+            logger.info(f"⏰ Отложенное продолжение чата {chat_id} отменено")
+        return cancelled
+
+    def _delete(self, chat_id: int, node_id: Optional[str] = None, fire_at: Optional[float] = None):
+        if self._connection is None:
+            return
+        with self._db_lock, self._connection:
+            if node_id is None:
+                self._connection.execute("DELETE FROM timers WHERE chat_id = ?", (chat_id,))
+            else:
+                # Удаляем только сработавший таймер, а не запланированный после него
+                self._connection.execute(
+                    "DELETE FROM timers WHERE chat_id = ? AND node_id = ? AND fire_at = ?",
+                    (chat_id, node_id, fire_at)
+                )
+
+    def _on_due(self, chat_id: int, sequence: int):
+        """Вызывается общим потоком ожидания, когда подошло время записи кучи"""
+        with self._lock:
+            pending = self._pending.get(chat_id)
+            if self._stopped or pending is None or pending[0] != sequence:
+                return  # Таймер отменен, заменен или бот остановлен
+            del self._pending[chat_id]
+            self._running += 1
+        self._service.executor.submit(self._fire, chat_id, pending[1], pending[2])
+
+    def _fire(self, chat_id: int, node_id: str, fire_at: float):
+        deferred = False
+        try:
+            self.callback(chat_id, node_id)
+        except TimerDeferred as e:
+            deferred = True
+            logger.warning(f"⏳ Продолжение чата {chat_id} перенесено на {e.delay} сек: {e}")
+            self._defer(chat_id, node_id, fire_at, e.delay)
+        except Exception as e:
+            logger.error(f"❌ Ошибка отложенного продолжения чата {chat_id}: {e}")
+        finally:
+            # Запись удаляется после обработки: при падении процесса продолжение выполнится после запуска
+            if not deferred:
+                self._delete(chat_id, node_id, fire_at)
+            with self._lock:
+                self._running -= 1
+                self._idle.notify_all()
+
+    def _defer(self, chat_id: int, node_id: str, fire_at: float, delay: float):
+        """
+        Переносит сработавший таймер. Если бот остановлен, запись просто остается на диске,
+        а если чату уже назначено новое продолжение - прежнее не восстанавливается
+        """
+        new_fire_at = time.time() + max(delay, 0)
+        sequence = next(self._sequence)
+        with self._lock:
+            if self._stopped or chat_id in self._pending:
+                return
+            self._pending[chat_id] = (sequence, node_id, new_fire_at)
+        if self._connection is not None:
+            with self._db_lock, self._connection:
+                self._connection.execute(
+                    "UPDATE timers SET fire_at = ? WHERE chat_id = ? AND node_id = ? AND fire_at = ?",
+                    (new_fire_at, chat_id, node_id, fire_at)
+                )
+        self._service.push(new_fire_at, sequence, self, chat_id)
+
+    def close(self, timeout: float = 10):
+        """Останавливает планировщик; несработавшие таймеры остаются на диске"""
+        with self._lock:
+            self._stopped = True
+            self._pending.clear()
+            # Дожидаемся уже запущенных продолжений, чтобы не закрыть базу под ними
+            self._idle.wait_for(lambda: self._running == 0, timeout)
+        if self._connection is not None:
+            with self._db_lock:
+                self._connection.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает число ожидающих и выполняющихся продолжений"""
+        with self._lock:
+            return {"pending": len(self._pending), "running": self._running}
+
+    def __len__(self) -> int:
+        return len(self._pending)
@@ -0,0 +1,136 @@
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Число очередей (и потоков-обработчиков) общего диспетчера
+DEFAULT_UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 8))
+
+# Емкость каждой очереди
+DEFAULT_UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+
+# Сколько ждать места в заполненной очереди, прежде чем отбросить обновление
+DEFAULT_SUBMIT_TIMEOUT = float(os.getenv("UPDATE_SUBMIT_TIMEOUT", 10))
+
+
+def update_chat_id(update) -> Optional[int]:
+    """Возвращает chat_id сообщения или callback-запроса"""
+    chat = getattr(update, 'chat', None)
+    if chat is None:
+        message = getattr(update, 'message', None)
+        chat = getattr(message, 'chat', None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, 'from_user', None)
+    return user.id if user is not None else None
+
+
+class _Shard:
+    """Очередь и поток одного шарда с метриками"""
+
+    def __init__(self, index: int, queue_size: int):
+        self.index = index
+        self.queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.thread = threading.Thread(target=self._run, name=f"update-worker-{index}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            callback, args = task
+            try:
+                callback(*args)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"❌ Ошибка обработки обновления в шарде {self.index}: {e}")
+            finally:
+                self.processed += 1
+                self.queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "errors": self.errors,
+        }
+
+
+class UpdateDispatcher:
+    """
+    Пул обработчиков обновлений с шардированием по ключу (бот, чат): обновления одного чата
+    выполняются строго по порядку в одном потоке, разные чаты - параллельно
+    """
+
+    def __init__(self, workers: int = DEFAULT_UPDATE_WORKERS, queue_size: int = DEFAULT_UPDATE_QUEUE_SIZE):
+        self.shards: List[_Shard] = [_Shard(index, queue_size) for index in range(max(workers, 1))]
+        logger.info(f"🧵 Диспетчер обновлений: {len(self.shards)} очередей по {queue_size} обновлений")
+
+    def shard_for(self, key: Hashable) -> _Shard:
+        """Выбирает шард по ключу (стабильный хеш, не зависящий от PYTHONHASHSEED)"""
+        return self.shards[zlib.crc32(repr(key).encode('utf-8')) % len(self.shards)]
+
+    def submit(self, key: Hashable, callback: Callable, *args, block: bool = True,
+               timeout: Optional[float] = DEFAULT_SUBMIT_TIMEOUT) -> bool:
+        """
+        Ставит обработку в очередь шарда ключа
+        Returns: False, если очередь заполнена (при block=False вызывающий сам повторяет попытку)
+        """
+        shard = self.shard_for(key)
+        try:
+            shard.queue.put((callback, args), block=block, timeout=timeout if block else None)
+        except queue.Full:
+            if not block:
+                return False
+            shard.rejected += 1
+            logger.error(f"❌ Очередь шарда {shard.index} заполнена, обновление {key} отброшено")
+            return False
+        depth = shard.queue.qsize()
+        if depth > shard.max_depth:
+            shard.max_depth = depth
+        return True
+
+    def wait_idle(self, timeout: float = 5) -> bool:
+        """Ждет, пока все очереди опустеют (для остановки и проверок)"""
+        deadline = time.time() + timeout
+        while any(shard.queue.unfinished_tasks for shard in self.shards):
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики очередей: глубина, максимум, обработано, отброшено"""
+        shards = [shard.stats() for shard in self.shards]
+        return {
+            "workers": len(self.shards),
+            "depth": sum(shard["depth"] for shard in shards),
+            "processed": sum(shard["processed"] for shard in shards),
+            "rejected": sum(shard["rejected"] for shard in shards),
+            "shards": shards,
+        }
+
+
+_dispatcher: Optional[UpdateDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_update_dispatcher() -> UpdateDispatcher:
+    """Возвращает общий для всех ботов процесса диспетчер обновлений"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = UpdateDispatcher()
+        return _dispatcher
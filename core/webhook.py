@@ -0,0 +1,93 @@
+from typing import Callable, Dict, Optional, Tuple, Any
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передает secret_token вебхука
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Путь эндпоинта обновлений в FastAPI-приложении
+WEBHOOK_PATH = "/api/webhook/{bot_id}/"
+
+# Ключ для вывода секретов ботов; без него секреты меняются при каждом запуске процесса
+_secret_key = os.getenv("WEBHOOK_SECRET") or secrets.token_hex(32)
+
+
+def webhook_secret(bot_id: str) -> str:
+    """Возвращает secret_token бота (Telegram допускает только A-Z, a-z, 0-9, _ и -)"""
+    return hmac.new(_secret_key.encode('utf-8'), str(bot_id).encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def webhook_url(base_url: str, bot_id: str) -> str:
+    """Формирует публичный URL вебхука бота"""
+    path = WEBHOOK_PATH.format(bot_id=urllib.parse.quote(str(bot_id), safe=''))
+    return base_url.rstrip('/') + path
+
+
+class WebhookBotHandle:
+    """Бот, получающий обновления через вебхук; повторяет интерфейс потока (is_alive/join) и бота (stop_polling)"""
+
+    def __init__(self, bot_id: str, bot, on_stop: Optional[Callable[['WebhookBotHandle'], None]] = None):
+        self.bot_id = bot_id
+        self.name = f"webhook_bot_{bot_id}"
+        self.bot = bot
+        self._on_stop = on_stop
+        self._stopped = threading.Event()
+        self._stop_lock = threading.Lock()
+
+    def is_alive(self) -> bool:
+        return not self._stopped.is_set()
+
+    def join(self, timeout: Optional[float] = None):
+        self._stopped.wait(timeout)
+
+    def stop_polling(self):
+        """Снимает вебхук и освобождает ресурсы бота"""
+        with self._stop_lock:
+            if self._stopped.is_set():
+                return
+            if self._on_stop:
+                try:
+                    self._on_stop(self)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка остановки вебхука бота {self.bot_id}: {e}")
+            self._stopped.set()
+
+
+class WebhookRegistry:
+    """Боты, зарегистрированные на вебхуки этого процесса: bot_id -> (бот, секрет)"""
+
+    def __init__(self):
+        self._bots: Dict[str, Tuple[Any, str]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, bot_id: str, bot, secret: str):
+        with self._lock:
+            self._bots[bot_id] = (bot, secret)
+
+    def unregister(self, bot_id: str, bot=None):
+        """Снимает регистрацию бота; если передан bot - только пока зарегистрирован именно он"""
+        with self._lock:
+            entry = self._bots.get(bot_id)
+            if entry is not None and (bot is None or entry[0] is bot):
+                del self._bots[bot_id]
+
+    def get(self, bot_id: str, secret: Optional[str]):
+        """Возвращает бота, если секрет совпадает, иначе None"""
+        with self._lock:
+            entry = self._bots.get(bot_id)
+        if entry is None or not secret or not hmac.compare_digest(entry[1], secret):
+            return None
+        return entry[0]
+
+    def __contains__(self, bot_id: str) -> bool:
+        return bot_id in self._bots
+
+    def __len__(self) -> int:
+        return len(self._bots)
@@ -0,0 +1,333 @@
+"""
+Локальная заглушка Telegram Bot API для проверки ботов без выхода в сеть
+
+Запуск:
+    python fake_telegram_server.py --port 8081
+
+Затем запустите приложение с TELEGRAM_API_URL=http://127.0.0.1:8081 - боты будут
+обращаться к заглушке. Заглушка хранит отправленные ботами сообщения, доставляет
+входящие обновления через getUpdates или на зарегистрированный вебхук
+(с заголовком X-Telegram-Bot-Api-Secret-Token), как настоящий Telegram.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Any
+from email.parser import BytesParser
+import argparse
+import email.policy
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Методы отправки, на которые заглушка отвечает объектом сообщения
+SEND_METHODS = {
+    'sendMessage', 'sendPhoto', 'sendDocument', 'sendVideo', 'sendAudio', 'sendAnimation',
+    'sendVoice', 'sendSticker', 'sendLocation', 'sendContact', 'editMessageText',
+    'editMessageReplyMarkup',
+}
+
+# Поле с файлом в методах отправки медиа
+MEDIA_FIELDS = {
+    'sendPhoto': 'photo', 'sendDocument': 'document', 'sendVideo': 'video', 'sendAudio': 'audio',
+}
+
+
+def media_object(kind: str, file_id: str):
+    """Объект файла в ответе Bot API с обязательными полями своего вида"""
+    media = {'file_id': file_id, 'file_unique_id': file_id}
+    if kind == 'photo':
+        return [dict(media, width=1, height=1)]
+    if kind == 'video':
+        return dict(media, width=1, height=1, duration=1)
+    if kind == 'audio':
+        return dict(media, duration=1)
+    return media
+
+
+class FakeTelegramServer:
+    """Заглушка Bot API: /bot<token>/<method>"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081):
+        self.host = host
+        self.port = port
+        # Вызовы методов отправки: {'token', 'method', 'params'}
+        self.sent: List[Dict[str, Any]] = []
+        # token -> {'url', 'secret_token'}
+        self.webhooks: Dict[str, Dict[str, str]] = {}
+        # token -> обновления, ожидающие getUpdates
+        self.updates: Dict[str, List[Dict[str, Any]]] = {}
+        # Ответы вебхуков: (token, HTTP-статус)
+        self.webhook_responses: List[Any] = []
+        # Ошибки, которыми заглушка ответит на ближайшие вызовы отправки: (HTTP-статус, ответ)
+        self.failures: List[Any] = []
+        # Принятые TCP-соединения (для проверки переиспользования соединений клиентом)
+        self.connections = 0
+        # Токены, которые заглушка отклоняет (401 Unauthorized), и число вызовов getMe
+        self.revoked_tokens: set = set()
+        self.get_me_calls = 0
+        self._update_id = 0
+        self._message_id = 0
+        self._condition = threading.Condition()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def api_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        """Запускает сервер в фоновом потоке"""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, как у настоящего Bot API: клиент может переиспользовать соединение
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._condition:
+                    server.connections += 1
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def _handle(self):
+                parts = urllib.parse.urlparse(self.path)
+                segments = parts.path.strip('/').split('/')
+                if len(segments) != 2 or not segments[0].startswith('bot'):
+                    self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+                    return
+                params = {key: values[0] for key, values in urllib.parse.parse_qs(parts.query).items()}
+                params.update(self._read_body())
+                status, payload = server.call(segments[0][3:], segments[1], params)
+                self._reply(status, payload)
+
+            def _read_body(self) -> Dict[str, Any]:
+                length = int(self.headers.get('Content-Length') or 0)
+                content_type = self.headers.get('Content-Type', '')
+                raw = self.rfile.read(length) if length else b''
+                if content_type.startswith('multipart/form-data'):
+                    # Файлы заменяются их именами, остальные поля - строками
+                    message = BytesParser(policy=email.policy.default).parsebytes(
+                        f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + raw)
+                    return {part.get_param('name', header='content-disposition'):
+                            part.get_filename() or part.get_content()
+                            for part in message.iter_parts()}
+                body = raw.decode('utf-8')
+                if not body:
+                    return {}
+                if content_type.startswith('application/json'):
+                    return json.loads(body)
+                return {key: values[0] for key, values in urllib.parse.parse_qs(body).items()}
+
+            def _reply(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-telegram", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def call(self, token: str, method: str, params: Dict[str, Any]):
+        """Выполняет метод Bot API и возвращает (HTTP-статус, ответ)"""
+        if token in self.revoked_tokens:
+            return 401, {'ok': False, 'error_code': 401, 'description': 'Unauthorized'}
+
+        if method == 'getMe':
+            with self._condition:
+                self.get_me_calls += 1
+            bot_id = int(token.split(':')[0]) if token.split(':')[0].isdigit() else 1
+            return 200, {'ok': True, 'result': {
+                'id': bot_id, 'is_bot': True, 'first_name': 'Test bot', 'username': f'test_{bot_id}_bot'}}
+
+        if method == 'setWebhook':
+            with self._condition:
+                self.webhooks[token] = {'url': params.get('url', ''), 'secret_token': params.get('secret_token', '')}
+                pending = self.updates.pop(token, [])
+            for update in pending:
+                self._deliver_webhook(token, update)
+            return 200, {'ok': True, 'result': True, 'description': 'Webhook was set'}
+
+        if method == 'deleteWebhook':
+            with self._condition:
+                self.webhooks.pop(token, None)
+            return 200, {'ok': True, 'result': True, 'description': 'Webhook was deleted'}
+
+        if method == 'getWebhookInfo':
+            webhook = self.webhooks.get(token, {})
+            return 200, {'ok': True, 'result': {'url': webhook.get('url', ''), 'pending_update_count': 0}}
+
+        if method == 'getUpdates':
+            if token in self.webhooks:
+                return 409, {'ok': False, 'error_code': 409,
+                             'description': "Conflict: can't use getUpdates method while webhook is active"}
+            return 200, {'ok': True, 'result': self._get_updates(token, params)}
+
+        if method == 'sendMediaGroup':
+            return self._send_media_group(token, params)
+
+        if method in SEND_METHODS:
+            with self._condition:
+                if self.failures:
+                    return self.failures.pop(0)
+                self._message_id += 1
+                self.sent.append({'token': token, 'method': method, 'params': params})
+                self._condition.notify_all()
+                message_id = self._message_id
+            chat_id = int(params.get('chat_id', 0))
+            result = {'message_id': message_id, 'date': int(time.time()),
+                      'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')}
+            # Как Telegram, возвращаем file_id отправленного медиа (переданный file_id остается прежним)
+            kind = MEDIA_FIELDS.get(method)
+            if kind:
+                source = str(params.get(kind, ''))
+                file_id = source if source.startswith('file_') else f'file_{message_id}'
+                result[kind] = media_object(kind, file_id)
+            return 200, {'ok': True, 'result': result}
+
+        # answerCallbackQuery, setMyCommands и прочие методы просто подтверждаются
+        return 200, {'ok': True, 'result': True}
+
+    def _send_media_group(self, token: str, params: Dict[str, Any]):
+        """Альбом: по сообщению на элемент, file_id как у одиночных отправок"""
+        media = params.get('media', '[]')
+        media = json.loads(media) if isinstance(media, str) else media
+        chat_id = int(params.get('chat_id', 0))
+        with self._condition:
+            if self.failures:
+                return self.failures.pop(0)
+            self.sent.append({'token': token, 'method': 'sendMediaGroup', 'params': params})
+            self._condition.notify_all()
+            messages = []
+            for item in media:
+                self._message_id += 1
+                source = str(item.get('media', ''))
+                file_id = source if source.startswith('file_') else f'file_{self._message_id}'
+                message = {'message_id': self._message_id, 'date': int(time.time()),
+                           'chat': {'id': chat_id, 'type': 'private'}, 'media_group_id': str(self._message_id)}
+                message[item['type']] = media_object(item['type'], file_id)
+                messages.append(message)
+        return 200, {'ok': True, 'result': messages}
+
+    def _get_updates(self, token: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        timeout = min(float(params.get('timeout') or 0), 5)
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                queue = self.updates.get(token, [])
+                # Как в Telegram: offset подтверждает все обновления до него
+                queue[:] = [update for update in queue if update['update_id'] >= offset]
+                if queue or time.time() >= deadline:
+                    return list(queue)
+                self._condition.wait(deadline - time.time())
+
+    def _deliver_webhook(self, token: str, update: Dict[str, Any]):
+        webhook = self.webhooks[token]
+        request = urllib.request.Request(
+            webhook['url'], data=json.dumps(update).encode('utf-8'), method='POST',
+            headers={'Content-Type': 'application/json', SECRET_HEADER: webhook.get('secret_token', '')}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        self.webhook_responses.append((token, status))
+
+    def fail_next(self, error_code: int = 429, retry_after: Optional[int] = 1, count: int = 1):
+        """Следующие count вызовов отправки завершатся ошибкой (по умолчанию 429 Too Many Requests)"""
+        descriptions = {429: 'Too Many Requests: retry later', 403: 'Forbidden: bot was blocked by the user',
+                        400: 'Bad Request: chat not found'}
+        payload = {'ok': False, 'error_code': error_code,
+                   'description': descriptions.get(error_code, 'Internal Server Error')}
+        if error_code == 429:
+            payload['parameters'] = {'retry_after': retry_after}
+        with self._condition:
+            self.failures.extend([(error_code, payload)] * count)
+
+    def push_update(self, token: str, update: Dict[str, Any]) -> Dict[str, Any]:
+        """Добавляет входящее обновление: отправляет на вебхук или ставит в очередь getUpdates"""
+        with self._condition:
+            self._update_id += 1
+            update = dict(update, update_id=self._update_id)
+            webhook = token in self.webhooks
+            if not webhook:
+                self.updates.setdefault(token, []).append(update)
+                self._condition.notify_all()
+        if webhook:
+            self._deliver_webhook(token, update)
+        return update
+
+    def push_message(self, token: str, chat_id: int, text: str) -> Dict[str, Any]:
+        """Входящее текстовое сообщение (команды размечаются как bot_command)"""
+        with self._condition:
+            self._message_id += 1
+            message_id = self._message_id
+        message = {
+            'message_id': message_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User', 'username': f'user{chat_id}'},
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return self.push_update(token, {'message': message})
+
+    def push_callback(self, token: str, chat_id: int, data: str) -> Dict[str, Any]:
+        """Входящее нажатие inline-кнопки"""
+        with self._condition:
+            self._message_id += 1
+            message_id = self._message_id
+        callback = {
+            'id': str(message_id), 'chat_instance': str(chat_id), 'data': data,
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User'},
+            'message': {'message_id': message_id, 'date': int(time.time()),
+                        'chat': {'id': chat_id, 'type': 'private'}, 'text': ''},
+        }
+        return self.push_update(token, {'callback_query': callback})
+
+    def wait_for_sent(self, count: int, timeout: float = 5) -> bool:
+        """Ждет, пока боты отправят не меньше count сообщений"""
+        deadline = time.time() + timeout
+        with self._condition:
+            while len(self.sent) < count:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+
+    fake = FakeTelegramServer(args.host, args.port).start()
+    print(f"Заглушка Telegram Bot API запущена: TELEGRAM_API_URL={fake.api_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        fake.stop()
@@ -39,13 +39,24 @@ import hashlib
 import hmac
 import base64
 from cryptography.fernet import Fernet
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 # Импорты архитектуры блоков
 from core.block_registry import block_registry
-from core.scenario_runner import ScenarioRunner
+from core.scenario_runner import CompiledScenario, ScenarioRunner
+from core.scenario_cache import CachedScenario, get_scenario_cache
+from core.bot_storage import get_bot_storage
+from core.booking_store import discard_booking_store
+from core.navigation_history import NavigationHistory
+from core.async_runtime import get_async_runtime, is_available as async_runtime_available
+from core.update_dispatcher import get_update_dispatcher, update_chat_id
+from core.outbound_dispatcher import PRIORITY_BULK, RateLimitedBot, get_outbound_dispatcher
+from core.media_cache import MEDIA_WARMUP, MEDIA_WARMUP_CHAT_ID
+from core.bot_identity import InvalidToken, get_bot_identity
+from core.broadcast import get_broadcast_manager
+from core.crm_client import get_crm_client
+from core.telegram_http import get_telegram_session
+from core.webhook import SECRET_HEADER, WebhookBotHandle, WebhookRegistry, webhook_secret, webhook_url
 
 # Загрузка переменных окружения из файла .env
 load_dotenv()
@@ -156,6 +167,9 @@ class NodeData(BaseModel):
     keywords: Optional[List[str]] = None
     caseSensitive: Optional[bool] = None
     matchMode: Optional[str] = None
+    # Поля для nlp_response блока
+    intents: Optional[List[Dict]] = None
+    confidenceThreshold: Optional[float] = None
 
 class Node(BaseModel):
     id: str
@@ -203,9 +217,16 @@ class BotImportData(BaseModel):
 class TokenData(BaseModel):
     token: str
 
+class TokensValidationRequest(BaseModel):
+    tokens: List[str]
+
 class AuthData(BaseModel):
     password: str
 
+class BroadcastRequest(BaseModel):
+    text: str
+    parse_mode: Optional[str] = None
+
 # ========== НАСТРОЙКИ ==========
 BOTS_DIR = "bots"
 os.makedirs(BOTS_DIR, exist_ok=True)
@@ -225,7 +246,38 @@ def authenticate_admin(password: str) -> bool:
 running_bots = {}
 bot_stop_flags = {}
 bot_restart_counter = {}  # Счетчик перезапусков для уникальных имен потоков
-chat_history = {}  # Храним историю переходов для каждого чата
+chat_histories = {}  # История переходов чатов отдельно для каждого бота
+chat_histories_lock = threading.Lock()
+scenario_runners = {}  # Исполнители сценариев запущенных ботов (для статистики хранилищ контекстов)
+
+# Среда запуска ботов: threads - поток на бота, asyncio - все боты в одном цикле событий
+BOT_RUNTIME = os.getenv("BOT_RUNTIME", "threads").lower()
+if BOT_RUNTIME == "asyncio" and not async_runtime_available():
+    logger.warning("⚠️ Асинхронная среда недоступна (нужен aiohttp), боты запускаются в потоках")
+    BOT_RUNTIME = "threads"
+
+# Получение обновлений: polling или webhook (нужен публичный адрес приложения WEBHOOK_BASE_URL)
+BOT_UPDATE_MODE = os.getenv("BOT_UPDATE_MODE", "polling").lower()
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+if BOT_UPDATE_MODE == "webhook" and not WEBHOOK_BASE_URL:
+    logger.warning("⚠️ WEBHOOK_BASE_URL не задан, боты получают обновления через polling")
+    BOT_UPDATE_MODE = "polling"
+
+# Боты, принимающие обновления через вебхук этого приложения
+webhook_registry = WebhookRegistry()
+
+# Адрес Telegram Bot API (например, локальный сервер Bot API или тестовая заглушка)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL.rstrip('/') + "/bot{0}/{1}"
+    try:
+        from telebot import asyncio_helper
+        asyncio_helper.API_URL = telebot.apihelper.API_URL
+    except ImportError:
+        pass
+
+# Все синхронные клиенты telebot ходят в Bot API через один пул keep-alive соединений
+telegram_session = get_telegram_session()
 
 def load_tokens():
     # Всегда возвращаем пустой словарь, так как токены теперь хранятся в базе данных
@@ -255,46 +307,43 @@ def bot_file(bot_id: str, user_id: Optional[str] = None) -> str:
         print(f"Путь к файлу бота без user_id: {path}")
         return path
 
-def load_scenario(bot_id: str, user_id: Optional[str] = None) -> Scenario:
+def load_cached_scenario(bot_id: str, user_id: Optional[str] = None) -> Optional[CachedScenario]:
+    """Сценарий бота из общего кеша: файл перечитывается, только если он изменился"""
     # Получаем владельца бота для определения правильного пути
     if not user_id:
-        from core.models import UserManager
-        user_manager = UserManager()
-        user_id = user_manager.get_bot_owner(bot_id)
-    
-    # Используем только новый путь с user_id
-    if user_id:
-        file_path = bot_file(bot_id, user_id)
-        print(f"Trying to load scenario from user-specific path: {file_path}")
-        print(f"File exists: {os.path.exists(file_path)}")
-        
-        if os.path.exists(file_path):
-            try:
-                print("Opening scenario file...")
-                with open(file_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    print(f"Data from file: {data}")
-                    print(f"Number of nodes in data: {len(data.get('nodes', []))}")
-                    return Scenario(**data)
-            except Exception as e:
-                logger.error(f"Error loading scenario {bot_id} from user path: {e}")
-                import traceback
-                traceback.print_exc()
-        else:
-            print(f"Scenario file not found: {file_path}")
-    else:
-        print(f"User ID not found for bot {bot_id}")
-    
-    # Return empty scenario if nothing found
-    return Scenario(nodes=[], edges=[])
+        user_id = get_user_manager().get_bot_owner(bot_id)
+    if not user_id:
+        logger.warning(f"⚠️ Владелец бота {bot_id} не найден")
+        return None
 
-def save_scenario(bot_id: str, scenario: Scenario, user_id: Optional[str] = None):
+    file_path = bot_file(bot_id, user_id)
+    # Отложенное автосохранение должно попасть в файл до чтения
+    get_bot_storage().flush(file_path)
+    try:
+        cached = get_scenario_cache().load(user_id, bot_id, file_path, lambda data: Scenario(**data))
+    except Exception as e:
+        logger.error(f"Error loading scenario {bot_id} from user path: {e}")
+        return None
+    if cached is None:
+        logger.warning(f"⚠️ Файл сценария не найден: {file_path}")
+    return cached
+
+def load_scenario(bot_id: str, user_id: Optional[str] = None) -> Scenario:
+    """Сценарий бота (общий объект кеша, изменять его нельзя); пустой, если файла нет"""
+    cached = load_cached_scenario(bot_id, user_id)
+    if cached is None:
+        return Scenario(nodes=[], edges=[])
+    return cached.scenario
+
+def save_scenario(bot_id: str, scenario: Scenario, user_id: Optional[str] = None, coalesce: bool = False):
+    """
+    Сохраняет сценарий атомарно (временный файл, fsync, замена) под блокировкой бота.
+    coalesce - автосохранение редактора: частые сохранения объединяются в одну запись на диск
+    """
     # Если user_id не предоставлен, пытаемся получить его из базы данных
     if not user_id:
         try:
-            from core.models import UserManager
-            user_manager = UserManager()
-            user_id = user_manager.get_bot_owner(bot_id)
+            user_id = get_user_manager().get_bot_owner(bot_id)
         except Exception as e:
             logger.error(f"Ошибка получения владельца бота {bot_id}: {e}")
     
@@ -305,12 +354,21 @@ def save_scenario(bot_id: str, scenario: Scenario, user_id: Optional[str] = None
     
     try:
         file_path = bot_file(bot_id, user_id)
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(scenario.dict(), f, ensure_ascii=False, indent=2)
-        logger.info(f"Сценарий сохранен для бота {bot_id} (пользователь: {user_id})")
+        storage = get_bot_storage()
+        if coalesce:
+            if storage.save_json(file_path, scenario.dict()):
+                logger.info(f"Сценарий сохранен для бота {bot_id} (пользователь: {user_id})")
+            else:
+                logger.info(f"Сценарий бота {bot_id} будет записан вместе со следующими изменениями")
+        else:
+            storage.write_json(file_path, scenario.dict())
+            logger.info(f"Сценарий сохранен для бота {bot_id} (пользователь: {user_id})")
     except Exception as e:
         logger.error(f"Ошибка сохранения сценария {bot_id}: {e}")
         raise
+    finally:
+        # Следующее чтение возьмет новый файл, даже если запись не удалась на середине
+        get_scenario_cache().invalidate(bot_id)
 
 # ========== API ЭНДПОИНТЫ ==========
 @app.get("/")
@@ -346,8 +404,8 @@ def check_token_sync(token: str) -> bool:
             return False
 
         print("Попытка подключения к Telegram API с этим токеном...")
-        test_bot = telebot.TeleBot(token)
-        bot_info = test_bot.get_me()
+        # Результат getMe кешируется: повторные проверки и запуск бота не обращаются к API
+        bot_info = get_bot_identity().get_me(token)
         print(f"Успешное подключение! Информация о боте: {bot_info}")
         return True
     except Exception as e:
@@ -359,43 +417,343 @@ def check_token_sync(token: str) -> bool:
 def check_telegram_connection():
     """Проверяет возможность подключения к Telegram API"""
     try:
-        response = requests.get('https://api.telegram.org', timeout=10)
+        response = telegram_session.session.get('https://api.telegram.org', timeout=10)
         return response.status_code == 200
     except:
         return False
 
-def add_to_chat_history(chat_id: int, node_id: str):
+def get_chat_history(bot_id: str) -> NavigationHistory:
+    """Возвращает историю переходов бота (у каждого бота своя)"""
+    with chat_histories_lock:
+        history = chat_histories.get(bot_id)
+        if history is None:
+            history = chat_histories[bot_id] = NavigationHistory()
+        return history
+
+def add_to_chat_history(bot_id: str, chat_id: int, node_id: str):
     """Добавляет узел в историю чата"""
-    if chat_id not in chat_history:
-        chat_history[chat_id] = []
-    
-    # Ограничиваем размер истории (10 последних шагов)
-    if len(chat_history[chat_id]) >= 10:
-        chat_history[chat_id].pop(0)
-    
-    # Не добавляем одинаковые узлы подряд
-    if not chat_history[chat_id] or chat_history[chat_id][-1] != node_id:
-        chat_history[chat_id].append(node_id)
-        logger.info(f"🗺️ Добавлено в историю {chat_id}: {node_id}")
+    get_chat_history(bot_id).push(chat_id, node_id)
 
-def get_previous_node(chat_id: int) -> Optional[str]:
+def get_previous_node(bot_id: str, chat_id: int) -> Optional[str]:
     """Возвращает предыдущий узел из истории"""
-    if chat_id not in chat_history or len(chat_history[chat_id]) < 2:
-        return None
-    
-    # Удаляем текущий узел и возвращаем предыдущий
-    chat_history[chat_id].pop()  # Удаляем текущий
-    previous_node = chat_history[chat_id][-1]  # Берем предыдущий
-    logger.info(f"↩️ Возврат к узлу {previous_node} для чата {chat_id}")
-    return previous_node
+    return get_chat_history(bot_id).back(chat_id)
 
-def clear_chat_history(chat_id: int):
+def clear_chat_history(bot_id: str, chat_id: int):
     """Очищает историю чата"""
-    if chat_id in chat_history:
-        del chat_history[chat_id]
-        logger.info(f"🧽 Очищена история чата {chat_id}")
+    get_chat_history(bot_id).clear(chat_id)
+
+def build_bot_handlers(bot, bot_id: str, scenario_runner: ScenarioRunner) -> list:
+    """
+    Создает обработчики обновлений бота: список (вид, функция, фильтры register_*_handler)
+    Обработчики синхронные и используются во всех средах запуска ботов
+    """
+    def handle_start(message):
+        try:
+            # Проверяем флаг остановки
+            if bot_stop_flags.get(bot_id, True):
+                logger.info(f"⏹️ Бот {bot_id} остановлен, игнорируем /start")
+                return
+                
+            logger.info(f"👤 /start от {message.chat.id} - {message.from_user.username}")
+            
+            # Очищаем историю и отложенные продолжения при новом старте
+            clear_chat_history(bot_id, message.chat.id)
+            scenario_runner.cancel_delay(message.chat.id)
+            # Имя пользователя доступно шаблонам как {{first_name}}, {{last_name}}, {{username}}
+            scenario_runner.remember_user(message.chat.id, message.from_user)
+            
+            # Стартовый узел определен при компиляции сценария
+            start_node = scenario_runner.get_start_node_id()
+            if start_node:
+                # Выполняем цепочку до первого интерактивного блока, записывая шаги в историю
+                scenario_runner.run_chain(
+                    bot, message.chat.id, start_node,
+                    on_enter=lambda node_id: add_to_chat_history(bot_id, message.chat.id, node_id)
+                )
+            else:
+                bot.send_message(message.chat.id, "🚀 Бот запущен! Напишите что-нибудь.")
+        except Exception as e:
+            logger.error(f"❌ Ошибка в /start: {e}")
+
+    # Обработчик команды "Назад"
+    def handle_back_command(message):
+        try:
+            # Проверяем флаг остановки
+            if bot_stop_flags.get(bot_id, True):
+                logger.info(f"⏹️ Бот {bot_id} остановлен, игнорируем команду Назад")
+                return
+                
+            logger.info(f"↩️ Команда 'Назад' от {message.chat.id}")
+            
+            # Получаем предыдущий узел
+            previous_node_id = get_previous_node(bot_id, message.chat.id)
+            
+            if previous_node_id:
+                logger.info(f"↩️ Возвращаемся к узлу {previous_node_id}")
+                # Обрабатываем предыдущий узел и его цепочку автоперехода
+                scenario_runner.run_chain(
+                    bot, message.chat.id, previous_node_id,
+                    on_enter=lambda node_id: add_to_chat_history(bot_id, message.chat.id, node_id)
+                )
+            else:
+                bot.send_message(message.chat.id, "ℹ️ Нет предыдущих шагов. Используйте /start для начала.")
+                
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки команды Назад: {e}")
+
+    # Обработчик пользовательских команд из меню
+    def handle_menu_commands(message):
+        try:
+            # Проверяем флаг остановки
+            if bot_stop_flags.get(bot_id, True):
+                logger.info(f"⏹️ Бот {bot_id} остановлен, игнорируем команду")
+                return
+                
+            command = message.text.strip()
+            logger.info(f"📋 Команда меню от {message.chat.id}: {command}")
+            
+            # Ищем блок меню с этой командой
+            for node_id, block in scenario_runner.nodes_map.items():
+                if hasattr(block, 'type') and block.type == 'menu':
+                    menu_items = block.node_data.get('data', {}).get('menuItems', [])
+                    for item in menu_items:
+                        item_command = item.get('command', '').strip()
+                        if item_command:
+                            # Приводим к единому формату
+                            if not item_command.startswith('/'):
+                                item_command = f"/{item_command}"
+                            
+                            if item_command == command:
+                                logger.info(f"🎯 Найдена команда {command}, переходим к следующему узлу")
+                                # Находим следующий узел после меню
+                                next_node_id = scenario_runner.get_next_node_id(node_id)
+                                if next_node_id:
+                                    # Выполняем цепочку, добавляя шаги в историю
+                                    scenario_runner.run_chain(
+                                        bot, message.chat.id, next_node_id,
+                                        on_enter=lambda step_id: add_to_chat_history(bot_id, message.chat.id, step_id)
+                                    )
+                                else:
+                                    bot.send_message(message.chat.id, f"Команда {command} выполнена!")
+                                return
+            
+            # Если команда не найдена
+            bot.send_message(message.chat.id, f"❓ Неизвестная команда {command}. Используйте /start для начала.")
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки команды: {e}")
+
+    # Обработчик callback-запросов (inline-кнопки)
+    def handle_callback_query(call):
+        try:
+            # Проверяем флаг остановки
+            if bot_stop_flags.get(bot_id, True):
+                logger.info(f"⏹️ Бот {bot_id} остановлен, игнорируем callback")
+                bot.answer_callback_query(call.id, text="Бот остановлен")
+                return
+                
+            logger.info(f"🔘 Callback от {call.from_user.id}: {call.data}")
+
+            # Находим кнопку по таблице маршрутов за один поиск
+            route = scenario_runner.resolve_callback(call.data)
+            if route:
+                scenario_runner.handle_inline_button_press(bot, call, route[0], call.data)
+                return
+
+            # Кнопки свободного времени блока расписания
+            if scenario_runner.handle_schedule_slot(bot, call):
+                return
+
+            # Если не нашли подходящую кнопку
+            bot.answer_callback_query(call.id, text="Эта кнопка больше не активна")
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки callback: {e}")
+            try:
+                bot.answer_callback_query(call.id, text="Произошла ошибка")
+            except:
+                pass
+
+    def handle_all_messages(message):
+        try:
+            # Проверяем флаг остановки
+            if bot_stop_flags.get(bot_id, True):
+                logger.info(f"⏹️ Бот {bot_id} остановлен, игнорируем сообщение")
+                return
+                
+            logger.info(f"💬 Сообщение от {message.chat.id}: {message.text}")
+
+            # Передаем текст сообщения в сценарий для обработки
+            message_context = {
+                'user_message': message.text,
+                'user_id': message.from_user.id,
+                'username': message.from_user.username
+            }
+
+            # Проверяем ключевые слова всех блоков keyword_processor за один проход
+            if scenario_runner.handle_keyword_message(bot, message.chat.id, message.text, **message_context):
+                return
+
+            # Направляем сообщение узлу, ответа на который ждет чат, затем глобальным обработчикам
+            if scenario_runner.handle_text_message(bot, message, **message_context):
+                return
+
+            # Если не кнопка и нет NLP блока, отправляем стандартный ответ
+            bot.send_message(message.chat.id, "ℹ️ Используйте /start для начала")
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки сообщения: {e}")
+            try:
+                bot.send_message(message.chat.id, "⚠️ Произошла ошибка при обработке сообщения")
+            except:
+                pass
+
+    # Порядок важен: telebot проверяет обработчики в порядке регистрации
+    return [
+        ('message', handle_start, {'commands': ['start', 'help']}),
+        ('message', handle_back_command, {
+            'func': lambda message: message.text and message.text.lower() in ['/назад', '/back', 'назад', 'back']
+        }),
+        ('message', handle_menu_commands, {
+            'func': lambda message: (message.text and message.text.startswith('/')
+                                     and message.text not in ['/start', '/help', '/назад', '/back'])
+        }),
+        ('callback_query', handle_callback_query, {'func': lambda call: True}),
+        ('message', handle_all_messages, {'func': lambda message: True}),
+    ]
 
-def start_telegram_bot(token: str, scenario_data: dict, bot_id: str):
+def dispatch_handler(bot_id: str, callback):
+    """Оборачивает обработчик: выполнение уходит в общий пул, обновления одного чата - по порядку"""
+    dispatcher = get_update_dispatcher()
+
+    def handler(update):
+        dispatcher.submit((bot_id, update_chat_id(update)), callback, update)
+    return handler
+
+def register_bot_handlers(bot, handlers: list, bot_id: str):
+    """Регистрирует обработчики у синхронного telebot.TeleBot (создается с threaded=False)"""
+    for kind, callback, filters in handlers:
+        getattr(bot, f"register_{kind}_handler")(dispatch_handler(bot_id, callback), **filters)
+
+def start_media_warmup(scenario_runner: ScenarioRunner, sender: RateLimitedBot, bot_id: str, scenario_data: dict):
+    """Предзагружает медиа сценария в фоне, чтобы первые пользователи получили их по file_id (MEDIA_WARMUP)"""
+    if not MEDIA_WARMUP:
+        return
+    chat_id = MEDIA_WARMUP_CHAT_ID or scenario_data.get('adminChatId') or scenario_data.get('admin_chat_id')
+    if not chat_id:
+        logger.warning(f"⚠️ Предзагрузка медиа бота {bot_id} пропущена: не задан чат (admin_chat_id или MEDIA_WARMUP_CHAT_ID)")
+        return
+    chat_id = int(chat_id) if str(chat_id).lstrip('-').isdigit() else chat_id
+    threading.Thread(
+        target=scenario_runner.warm_media, args=(sender.with_priority(PRIORITY_BULK), chat_id),
+        name=f"media_warmup_{bot_id}", daemon=True
+    ).start()
+
+def release_bot_instance(bot_id: str, instance) -> bool:
+    """
+    Убирает экземпляр из running_bots, только если зарегистрирован именно он
+    Returns: False, если бот уже перезапущен и записи принадлежат новому экземпляру
+    """
+    key = f"{bot_id}_instance"
+    current = running_bots.get(key)
+    if current is not None and current is not instance:
+        return False
+    running_bots.pop(key, None)
+    return True
+
+def start_async_bot(token: str, scenario_data: dict, bot_id: str, bot_dir: Optional[str] = None,
+                    compiled: Optional[CompiledScenario] = None):
+    """Подключает бота к общей асинхронной среде (без отдельного потока на бота)"""
+    logger.info(f"🔄 Запуск бота {bot_id} в асинхронной среде...")
+    bot_stop_flags[bot_id] = False
+
+    scenario_runner = ScenarioRunner(scenario_data, bot_dir=bot_dir, compiled=compiled)
+    if not scenario_runner.nodes_map:
+        raise HTTPException(status_code=400, detail="Нет доступных блоков в сценарии")
+
+    def setup(async_bot):
+        # Отправки блоков проходят через общую очередь с лимитами Telegram
+        bot = RateLimitedBot(async_bot, bot_id)
+        scenario_runner.start_timers(
+            bot, on_enter=lambda chat_id, node_id: add_to_chat_history(bot_id, chat_id, node_id), bot_id=bot_id
+        )
+        get_broadcast_manager().attach(bot_id, bot, scenario_runner.user_contexts, bot_dir)
+        start_media_warmup(scenario_runner, bot, bot_id, scenario_data)
+        return build_bot_handlers(bot, bot_id, scenario_runner)
+
+    def cleanup(handle):
+        get_broadcast_manager().detach(bot_id, store=scenario_runner.user_contexts)
+        scenario_runner.close()
+        # Завершение приходит в фоне: если бот уже перезапущен, общие записи принадлежат новому экземпляру
+        if release_bot_instance(bot_id, handle):
+            chat_histories.pop(bot_id, None)
+            scenario_runners.pop(bot_id, None)
+            get_outbound_dispatcher().forget_bot(bot_id)
+        logger.info(f"⏹️ Бот {bot_id} остановлен")
+
+    handle = get_async_runtime().add_bot(bot_id, token, setup, on_stop=cleanup)
+    # Экземпляр нужен stop_bot для остановки polling, как и у потоковых ботов
+    running_bots[f"{bot_id}_instance"] = handle
+    scenario_runners[bot_id] = scenario_runner
+    return handle
+
+def start_webhook_bot(token: str, scenario_data: dict, bot_id: str, bot_dir: Optional[str] = None,
+                      compiled: Optional[CompiledScenario] = None):
+    """Регистрирует вебхук бота: обновления приходят на эндпоинт приложения, а не через polling"""
+    logger.info(f"🔄 Запуск бота {bot_id} через вебхук...")
+    bot_stop_flags[bot_id] = False
+
+    scenario_runner = ScenarioRunner(scenario_data, bot_dir=bot_dir, compiled=compiled)
+    if not scenario_runner.nodes_map:
+        raise HTTPException(status_code=400, detail="Нет доступных блоков в сценарии")
+
+    # Обработчики выполняет общий диспетчер обновлений, собственные потоки telebot не нужны
+    bot = telebot.TeleBot(token, threaded=False)
+    # Отправки блоков проходят через общую очередь с лимитами Telegram
+    sender = RateLimitedBot(bot, bot_id)
+    scenario_runner.start_timers(
+        sender, on_enter=lambda chat_id, node_id: add_to_chat_history(bot_id, chat_id, node_id), bot_id=bot_id
+    )
+    register_bot_handlers(bot, build_bot_handlers(sender, bot_id, scenario_runner), bot_id)
+    get_broadcast_manager().attach(bot_id, sender, scenario_runner.user_contexts, bot_dir)
+    start_media_warmup(scenario_runner, sender, bot_id, scenario_data)
+
+    secret = webhook_secret(bot_id)
+    webhook_registry.register(bot_id, bot, secret)
+
+    def cleanup(handle):
+        webhook_registry.unregister(bot_id, bot)
+        current = running_bots.get(f"{bot_id}_instance")
+        # Перезапущенный бот уже зарегистрировал свой вебхук на тот же токен - его не снимаем
+        if current is None or current is handle:
+            try:
+                bot.delete_webhook()
+                logger.info(f"🔌 Вебхук бота {bot_id} снят")
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось снять вебхук бота {bot_id}: {e}")
+        get_broadcast_manager().detach(bot_id, store=scenario_runner.user_contexts)
+        scenario_runner.close()
+        if release_bot_instance(bot_id, handle):
+            chat_histories.pop(bot_id, None)
+            scenario_runners.pop(bot_id, None)
+            get_outbound_dispatcher().forget_bot(bot_id)
+
+    handle = WebhookBotHandle(bot_id, bot, on_stop=cleanup)
+    url = webhook_url(WEBHOOK_BASE_URL, bot_id)
+    try:
+        bot.set_webhook(url=url, secret_token=secret, allowed_updates=['message', 'callback_query'])
+    except Exception:
+        handle.stop_polling()
+        raise
+    logger.info(f"🔗 Вебхук бота {bot_id} зарегистрирован: {url}")
+
+    # Экземпляр нужен stop_bot, чтобы снять вебхук
+    running_bots[f"{bot_id}_instance"] = handle
+    scenario_runners[bot_id] = scenario_runner
+    return handle
+
+def start_telegram_bot(token: str, scenario_data: dict, bot_id: str, bot_dir: Optional[str] = None,
+                       compiled: Optional[CompiledScenario] = None):
     """Запускает телеграм бота в отдельном потоке"""
     logger.info(f"🔄 Запуск бота {bot_id} с токеном: {'*' * 10}...")  # Скрыли отображение токена
 
@@ -411,278 +769,39 @@ def start_telegram_bot(token: str, scenario_data: dict, bot_id: str):
                 logger.info(f"⏹️ Бот {bot_id} остановлен перед запуском")
                 return
 
-            # Проверяем токен
-            test_bot = telebot.TeleBot(token)
-            bot_info = test_bot.get_me()
+            # Проверяем токен (после check_token_sync данные бота уже в кеше)
+            bot_info = get_bot_identity().get_me(token, refresh=attempt > 0)
             logger.info(f"✅ Токен верный. Бот: @{bot_info.username}")
 
             # Создаем исполнитель сценария
-            scenario_runner = ScenarioRunner(scenario_data)
+            scenario_runner = ScenarioRunner(scenario_data, bot_dir=bot_dir, compiled=compiled)
             if not scenario_runner.nodes_map:
                 logger.error("❌ Нет доступных блоков в сценарии!")
                 return
 
-            # Создаем настоящего бота
-            bot = telebot.TeleBot(token)
+            # Создаем настоящего бота (обработчики выполняет общий диспетчер обновлений)
+            bot = telebot.TeleBot(token, threaded=False)
                 
             logger.info(f"🤖 Бот @{bot_info.username} запускается...")
             
             # Сохраняем экземпляр бота для принудительной остановки
             running_bots[f"{bot_id}_instance"] = bot
+            scenario_runners[bot_id] = scenario_runner
 
-            @bot.message_handler(commands=['start', 'help'])
-            def handle_start(message):
-                try:
-                    # Проверяем флаг остановки
-                    if bot_stop_flags.get(bot_id, True):
-                        logger.info(f"⏹️ Бот {bot_id} остановлен, игнорируем /start")
-                        return
-                        
-                    logger.info(f"👤 /start от {message.chat.id} - {message.from_user.username}")
-                    
-                    # Очищаем историю при новом старте
-                    clear_chat_history(message.chat.id)
-                    
-                    # Находим стартовый узел
-                    start_node = next((node_id for node_id, block in scenario_runner.nodes_map.items()
-                                       if hasattr(block, 'type') and block.type == 'start'), None)
-                    if start_node:
-                        # Добавляем стартовый узел в историю
-                        add_to_chat_history(message.chat.id, start_node)
-                        
-                        # Запускаем цепочку обработки
-                        next_node_id = scenario_runner.process_node(bot, message.chat.id, start_node)
-                        while next_node_id:
-                            # Проверяем тип следующего узла
-                            next_block = scenario_runner.nodes_map.get(next_node_id)
-                            if next_block and hasattr(next_block, 'type'):
-                                # Добавляем следующий узел в историю
-                                add_to_chat_history(message.chat.id, next_node_id)
-                                
-                                # Если это интерактивные блоки, останавливаем автоматическое выполнение
-                                if next_block.type in ['button', 'inline_button', 'input', 'menu']:
-                                    # Обрабатываем только этот узел и останавливаемся
-                                    scenario_runner.process_node(bot, message.chat.id, next_node_id)
-                                    break
-                                else:
-                                    # Продолжаем для обычных блоков (message, image, condition, etc.)
-                                    # Выполняем блок и получаем следующий узел
-                                    scenario_runner.process_node(bot, message.chat.id, next_node_id)
-                                    # Ищем следующий узел по связям
-                                    next_node_id = scenario_runner.get_next_node_id(next_node_id)
-                            else:
-                                # Если нет информации о типе, обрабатываем как обычный блок
-                                add_to_chat_history(message.chat.id, next_node_id)
-                                scenario_runner.process_node(bot, message.chat.id, next_node_id)
-                                next_node_id = scenario_runner.get_next_node_id(next_node_id)
-                    else:
-                        bot.send_message(message.chat.id, "🚀 Бот запущен! Напишите что-нибудь.")
-                except Exception as e:
-                    logger.error(f"❌ Ошибка в /start: {e}")
-
-            # Обработчик команды "Назад"
-            @bot.message_handler(func=lambda message: message.text and message.text.lower() in ['/назад', '/back', 'назад', 'back'])
-            def handle_back_command(message):
-                try:
-                    # Проверяем флаг остановки
-                    if bot_stop_flags.get(bot_id, True):
-                        logger.info(f"⏹️ Бот {bot_id} остановлен, игнорируем команду Назад")
-                        return
-                        
-                    logger.info(f"↩️ Команда 'Назад' от {message.chat.id}")
-                    
-                    # Получаем предыдущий узел
-                    previous_node_id = get_previous_node(message.chat.id)
-                    
-                    if previous_node_id:
-                        logger.info(f"↩️ Возвращаемся к узлу {previous_node_id}")
-                        # Обрабатываем предыдущий узел
-                        scenario_runner.process_node(bot, message.chat.id, previous_node_id)
-                    else:
-                        bot.send_message(message.chat.id, "ℹ️ Нет предыдущих шагов. Используйте /start для начала.")
-                        
-                except Exception as e:
-                    logger.error(f"❌ Ошибка обработки команды Назад: {e}")
-
-            # Обработчик пользовательских команд из меню
-            @bot.message_handler(func=lambda message: message.text and message.text.startswith('/') and message.text not in ['/start', '/help', '/назад', '/back'])
-            def handle_menu_commands(message):
-                try:
-                    # Проверяем флаг остановки
-                    if bot_stop_flags.get(bot_id, True):
-                        logger.info(f"⏹️ Бот {bot_id} остановлен, игнорируем команду")
-                        return
-                        
-                    command = message.text.strip()
-                    logger.info(f"📋 Команда меню от {message.chat.id}: {command}")
-                    
-                    # Ищем блок меню с этой командой
-                    for node_id, block in scenario_runner.nodes_map.items():
-                        if hasattr(block, 'type') and block.type == 'menu':
-                            menu_items = block.node_data.get('data', {}).get('menuItems', [])
-                            for item in menu_items:
-                                item_command = item.get('command', '').strip()
-                                if item_command:
-                                    # Приводим к единому формату
-                                    if not item_command.startswith('/'):
-                                        item_command = f"/{item_command}"
-                                    
-                                    if item_command == command:
-                                        logger.info(f"🎯 Найдена команда {command}, переходим к следующему узлу")
-                                        # Находим следующий узел после меню
-                                        next_node_id = scenario_runner.get_next_node_id(node_id)
-                                        if next_node_id:
-                                            # Добавляем в историю
-                                            add_to_chat_history(message.chat.id, next_node_id)
-                                            scenario_runner.process_node(bot, message.chat.id, next_node_id)
-                                        else:
-                                            bot.send_message(message.chat.id, f"Команда {command} выполнена!")
-                                        return
-                    
-                    # Если команда не найдена
-                    bot.send_message(message.chat.id, f"❓ Неизвестная команда {command}. Используйте /start для начала.")
-                    
-                except Exception as e:
-                    logger.error(f"❌ Ошибка обработки команды: {e}")
-
-            # Обработчик callback-запросов (inline-кнопки)
-            @bot.callback_query_handler(func=lambda call: True)
-            def handle_callback_query(call):
-                try:
-                    # Проверяем флаг остановки
-                    if bot_stop_flags.get(bot_id, True):
-                        logger.info(f"⏹️ Бот {bot_id} остановлен, игнорируем callback")
-                        bot.answer_callback_query(call.id, text="Бот остановлен")
-                        return
-                        
-                    logger.info(f"🔘 Callback от {call.from_user.id}: {call.data}")
-
-                    # Ищем блок с inline-кнопками, который соответствует callback_data
-                    for node_id, block in scenario_runner.nodes_map.items():
-                        if hasattr(block, 'type') and block.type == 'inline_button':
-                            buttons = block.node_data.get('data', {}).get('buttons', [])
-                            for button in buttons:
-                                callback_data = button.get('callbackData',
-                                                           f"btn_{hash(button.get('label', '')) % 10000}")
-                                if callback_data == call.data:
-                                    scenario_runner.handle_inline_button_press(bot, call, node_id, call.data)
-                                    return
-
-                    # Если не нашли подходящую кнопку
-                    bot.answer_callback_query(call.id, text="Эта кнопка больше не активна")
+            # Отправки блоков проходят через общую очередь с лимитами Telegram
+            sender = RateLimitedBot(bot, bot_id)
 
-                except Exception as e:
-                    logger.error(f"❌ Ошибка обработки callback: {e}")
-                    try:
-                        bot.answer_callback_query(call.id, text="Произошла ошибка")
-                    except:
-                        pass
-
-            @bot.message_handler(func=lambda message: True)
-            def handle_all_messages(message):
-                try:
-                    # Проверяем флаг остановки
-                    if bot_stop_flags.get(bot_id, True):
-                        logger.info(f"⏹️ Бот {bot_id} остановлен, игнорируем сообщение")
-                        return
-                        
-                    logger.info(f"💬 Сообщение от {message.chat.id}: {message.text}")
-
-                    # Передаем текст сообщения в сценарий для обработки
-                    message_context = {
-                        'user_message': message.text,
-                        'user_id': message.from_user.id,
-                        'username': message.from_user.username
-                    }
-
-                    # Проверяем блок обработки ключевых слов
-                    keyword_processed = False
-                    for node_id, block in scenario_runner.nodes_map.items():
-                        if hasattr(block, 'type') and block.type == 'keyword_processor':
-                            logger.info(f"🔍 Обработка сообщения с помощью keyword_processor: {message.text}")
-                            # Выполняем блок keyword_processor с контекстом сообщения
-                            success = block.process(bot, message.chat.id, message.text)
-                            if success:
-                                keyword_processed = True
-                                # Если ключевое слово найдено, продолжаем выполнение сценария
-                                # Ищем следующий узел по основной связи
-                                next_node_id = scenario_runner.get_next_node_id(node_id)
-                                if next_node_id:
-                                    scenario_runner.process_node(bot, message.chat.id, next_node_id, **message_context)
-                                break  # Прекращаем дальнейшую обработку
-
-                    # Если сообщение было обработано блоком keyword_processor, прекращаем обработку
-                    if keyword_processed:
-                        return
-
-                    # Проверяем, является ли сообщение нажатием на кнопку
-                    for node_id, block in scenario_runner.nodes_map.items():
-                        if hasattr(block, 'type') and block.type == 'button':
-                            buttons = block.node_data.get('data', {}).get('buttons', [])
-                            hide_keyboard = block.node_data.get('data', {}).get('hideKeyboard', False)
-                            
-                            # Если клавиатура скрыта, проверяем цифровые ответы
-                            if hide_keyboard and message.text.isdigit():
-                                button_index = int(message.text) - 1  # Пользователь вводит 1-based индекс
-
-                                if 0 <= button_index < len(buttons):
-                                    logger.info(f"🔘 Выбран вариант {message.text} (индекс {button_index})")
-                                    result = scenario_runner.handle_button_press(bot, message.chat.id, node_id, button_index)
-                                    if result:
-                                        return
-                            
-                            # Обычная проверка по тексту кнопки (для не скрытых кнопок)
-                            for index, button in enumerate(buttons):
-                                if button.get('label') == message.text:
-                                    logger.info(f"🔘 Нажата кнопка: {message.text}")
-                                    result = scenario_runner.handle_button_press(bot, message.chat.id, node_id, index)
-                                    if result:
-                                        return
-                        
-                        # Проверяем inline-кнопки с скрытой клавиатурой
-                        elif hasattr(block, 'type') and block.type == 'inline_button':
-                            buttons = block.node_data.get('data', {}).get('buttons', [])
-                            hide_keyboard = block.node_data.get('data', {}).get('hideKeyboard', False)
-                            
-                            # Если клавиатура скрыта, проверяем цифровые ответы
-                            if hide_keyboard and message.text.isdigit():
-                                button_index = int(message.text) - 1  # Пользователь вводит 1-based индекс
-                                if 0 <= button_index < len(buttons):
-                                    logger.info(f"🔘 Выбран inline-вариант {message.text} (индекс {button_index})")
-                                    # Для inline-кнопок используем имитацию callback_data
-                                    callback_data = f"btn_{button_index}"
-                                    result = scenario_runner.handle_inline_button_press(bot, message, node_id, callback_data)
-                                    if result:
-                                        return
-
-                        # Проверяем блок обработки естественного языка
-                        elif hasattr(block, 'type') and block.type == 'nlp_response':
-                            logger.info(f"🧠 Обработка сообщения с помощью NLP: {message.text}")
-                            # Выполняем блок NLP с контекстом сообщения
-                            result = scenario_runner.process_node(bot, message.chat.id, node_id, **message_context)
-                            if result:
-                                return
-
-                        # Проверяем блок расписания
-                        elif hasattr(block, 'type') and block.type == 'schedule':
-                            logger.info(f"📅 Обработка ответа для блока расписания: {message.text}")
-                            # Обрабатываем ответ пользователя для блока расписания
-                            result = scenario_runner.handle_schedule_response(bot, message.chat.id, node_id, message.text)
-                            # Если handle_schedule_response вернул значение (не None), это означает, 
-                            # что нужно продолжить выполнение сценария
-                            # Если вернул None, это может означать успешное завершение блока расписания
-                            # В любом случае, прекращаем дальнейшую обработку сообщения
-                            return  # This should prevent the default message from being sent
+            # Отложенные продолжения (блоки задержки) выполняются планировщиком, а не спящим потоком
+            scenario_runner.start_timers(
+                sender, on_enter=lambda chat_id, node_id: add_to_chat_history(bot_id, chat_id, node_id),
+                bot_id=bot_id
+            )
 
-                    # Если не кнопка и нет NLP блока, отправляем стандартный ответ
-                    bot.send_message(message.chat.id, "ℹ️ Используйте /start для начала")
+            register_bot_handlers(bot, build_bot_handlers(sender, bot_id, scenario_runner), bot_id)
 
-                except Exception as e:
-                    logger.error(f"❌ Ошибка обработки сообщения: {e}")
-                    try:
-                        bot.send_message(message.chat.id, "⚠️ Произошла ошибка при обработке сообщения")
-                    except:
-                        pass
+            # Незавершенные рассылки продолжаются с сохраненного места
+            get_broadcast_manager().attach(bot_id, sender, scenario_runner.user_contexts, bot_dir)
+            start_media_warmup(scenario_runner, sender, bot_id, scenario_data)
 
             # Запускаем polling с проверкой флага остановки
             logger.info("📡 Запускаем polling...")
@@ -717,17 +836,23 @@ def start_telegram_bot(token: str, scenario_data: dict, bot_id: str):
                         time.sleep(3)
 
             logger.info(f"⏹️ Бот {bot_id} остановлен")
-            
-            # Очищаем экземпляр бота
-            bot_instance_key = f"{bot_id}_instance"
-            if bot_instance_key in running_bots:
-                del running_bots[bot_instance_key]
+
+            # Останавливаем рассылки и сбрасываем контексты пользователей на диск
+            get_broadcast_manager().detach(bot_id, store=scenario_runner.user_contexts)
+            scenario_runner.close()
+
+            # Очищаем экземпляр бота, если его не заменил уже перезапущенный
+            if release_bot_instance(bot_id, bot):
+                chat_histories.pop(bot_id, None)
+                scenario_runners.pop(bot_id, None)
+                get_outbound_dispatcher().forget_bot(bot_id)
                 logger.info(f"🗑️ Экземпляр бота {bot_id} очищен")
             
             break
 
         except Exception as e:
-            if "Unauthorized" in str(e):
+            if isinstance(e, InvalidToken) or "Unauthorized" in str(e):
+                get_bot_identity().invalidate(token)
                 logger.error("🚫 Неверный токен! Остановка бота.")
                 break
             logger.error(f"❌ Ошибка Telegram API: {e}")
@@ -798,6 +923,10 @@ def delete_bot(bot_id: str, deleted_by_user_id: Optional[str] = None):
         print(f"Attempting to delete bot file: {file_path}")
         print(f"File exists: {os.path.exists(file_path)}")
         
+        # Отложенная запись не должна восстановить удаленный сценарий
+        get_bot_storage().discard(os.path.dirname(file_path))
+        discard_booking_store(os.path.dirname(file_path))
+
         if os.path.exists(file_path):
             # Получаем директорию бота и удаляем всю директорию
             bot_dir = os.path.dirname(file_path)
@@ -808,6 +937,7 @@ def delete_bot(bot_id: str, deleted_by_user_id: Optional[str] = None):
             else:
                 # Если директория не существует, удаляем только файл сценария
                 os.remove(file_path)
+            get_scenario_cache().invalidate(bot_id)
             
             # Удаляем токен из базы данных
             try:
@@ -894,8 +1024,7 @@ def import_bot(import_data: BotImportData, user_id: Optional[str] = None):
         
         # Проверяем, что токен работает
         try:
-            test_bot = telebot.TeleBot(token)
-            bot_info = test_bot.get_me()
+            bot_info = get_bot_identity().get_me(token)
             logger.info(f"✅ Токен для импорта верный. Бот: @{bot_info.username}")
         except Exception as e:
             return {"status": "error", "message": f"Токен недействителен: {str(e)}"}
@@ -1177,8 +1306,8 @@ def run_bot():
             with open(scenario_path, "r", encoding="utf-8") as f:
                 scenario_data = json.load(f)
             
-            # Создаем исполнитель сценария
-            scenario_runner = ScenarioRunner(scenario_data)
+            # Создаем исполнитель сценария (контексты пользователей хранятся рядом с ботом)
+            scenario_runner = ScenarioRunner(scenario_data, bot_dir=os.path.dirname(os.path.abspath(__file__)))
             if not scenario_runner.nodes_map:
                 logger.error("Нет доступных блоков в сценарии!")
                 return
@@ -1187,33 +1316,20 @@ def run_bot():
             bot = telebot.TeleBot(bot_token)
             bot_info = bot.get_me()
             logger.info(f"✅ Бот запущен: @{{bot_info.username}}")
+
+            # Планировщик блоков задержки
+            scenario_runner.start_timers(bot)
             
             @bot.message_handler(commands=['start', 'help'])
             def handle_start(message):
                 try:
                     logger.info(f"👤 /start от {{message.chat.id}} - {{message.from_user.username}}")
                     
-                    # Находим стартовый узел
-                    start_node = next((node_id for node_id, block in scenario_runner.nodes_map.items()
-                                       if hasattr(block, 'type') and block.type == 'start'), None)
+                    # Стартовый узел определен при компиляции сценария
+                    start_node = scenario_runner.get_start_node_id()
                     if start_node:
-                        # Запускаем цепочку обработки
-                        next_node_id = scenario_runner.process_node(bot, message.chat.id, start_node)
-                        while next_node_id:
-                            # Проверяем тип следующего узла
-                            next_block = scenario_runner.nodes_map.get(next_node_id)
-                            if next_block and hasattr(next_block, 'type'):
-                                # Если это интерактивные блоки, останавливаем автоматическое выполнение
-                                if next_block.type in ['button', 'inline_button', 'input', 'menu']:
-                                    scenario_runner.process_node(bot, message.chat.id, next_node_id)
-                                    break
-                                else:
-                                    # Продолжаем для обычных блоков
-                                    scenario_runner.process_node(bot, message.chat.id, next_node_id)
-                                    next_node_id = scenario_runner.get_next_node_id(next_node_id)
-                            else:
-                                scenario_runner.process_node(bot, message.chat.id, next_node_id)
-                                next_node_id = scenario_runner.get_next_node_id(next_node_id)
+                        # Выполняем цепочку до первого интерактивного блока
+                        scenario_runner.run_chain(bot, message.chat.id, start_node)
                     else:
                         bot.send_message(message.chat.id, "🚀 Бот запущен! Напишите что-нибудь.")
                 except Exception as e:
@@ -1239,6 +1355,8 @@ def run_bot():
                     logger.info("Перезапуск бота после обновления...")
                     bot.stop_polling()
                     break
+
+            scenario_runner.close()
             
         except Exception as e:
             logger.error(f"❌ Ошибка запуска бота: {{e}}")
@@ -1262,6 +1380,7 @@ def create_requirements_txt(bot_dir: str):
     """Создает файл зависимостей"""
     requirements_content = '''pyTelegramBotAPI>=4.0.0
 requests>=2.25.0
+numpy>=1.21.0
 '''
     
     req_path = os.path.join(bot_dir, "requirements.txt")
@@ -1434,6 +1553,23 @@ def stop_bot(bot_id: str):
         logger.error(f"❌ Ошибка остановки бота {bot_id}: {e}")
         return {"status": "error", "message": f"Ошибка остановки: {str(e)}"}
 
+@app.post("/api/validate_tokens/")
+def validate_tokens_endpoint(request: TokensValidationRequest):
+    """Проверяет несколько токенов (ограниченным числом параллельных запросов); результат в порядке токенов"""
+    tokens = [token.strip() for token in request.tokens]
+    well_formed = [token for token in tokens if validate_telegram_token(token)]
+    checked = dict(zip(well_formed, get_bot_identity().validate_many(well_formed)))
+
+    results = []
+    for token in tokens:
+        valid, bot_info = checked.get(token, (False, None))
+        results.append({
+            "valid": valid,
+            "username": bot_info.username if bot_info else None,
+            "telegram_id": bot_info.id if bot_info else None,
+        })
+    return {"results": results}
+
 @app.post("/api/run_bot/{bot_id}/")
 def run_bot_endpoint(bot_id: str, token_data: TokenData):
     """Запускает бота с указанным токеном"""
@@ -1453,19 +1589,38 @@ def run_bot_endpoint(bot_id: str, token_data: TokenData):
             logger.info(f"🛑 Бот {bot_id} уже запущен, останавливаем перед перезапуском")
             stop_bot(bot_id)
         
-        # Загружаем сценарий
-        scenario = load_scenario(bot_id)
-        if not scenario.nodes:
+        # Директория бота нужна блокам для данных бота (например, intents.json для NLP)
+        owner_id = None
+        bot_dir = None
+        try:
+            owner_id = get_user_manager().get_bot_owner(bot_id)
+            if owner_id:
+                bot_dir = get_bot_directory(owner_id, bot_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось определить директорию бота {bot_id}: {e}")
+
+        # Загружаем сценарий: при перезапуске без изменений блоки и план берутся из кеша
+        cached = load_cached_scenario(bot_id, owner_id) if owner_id else None
+        if cached is None or not cached.scenario.nodes:
             raise HTTPException(status_code=400, detail="Сценарий бота пуст")
-        
-        # Запускаем бота в отдельном потоке
-        bot_thread = threading.Thread(
-            target=start_telegram_bot,
-            args=(token, scenario.dict(), bot_id),
-            name=f"bot_{bot_id}_{bot_restart_counter.get(bot_id, 0)}"
-        )
-        bot_thread.daemon = True
-        bot_thread.start()
+        scenario_data = cached.scenario_data
+        compiled = cached.compiled(bot_dir)
+
+        if BOT_UPDATE_MODE == "webhook":
+            # Обновления приходят на эндпоинт вебхука, отдельный поток не нужен
+            bot_thread = start_webhook_bot(token, scenario_data, bot_id, bot_dir, compiled)
+        elif BOT_RUNTIME == "asyncio":
+            # Все боты в одном цикле событий
+            bot_thread = start_async_bot(token, scenario_data, bot_id, bot_dir, compiled)
+        else:
+            # Запускаем бота в отдельном потоке
+            bot_thread = threading.Thread(
+                target=start_telegram_bot,
+                args=(token, scenario_data, bot_id, bot_dir, compiled),
+                name=f"bot_{bot_id}_{bot_restart_counter.get(bot_id, 0)}"
+            )
+            bot_thread.daemon = True
+            bot_thread.start()
         
         # Сохраняем ссылку на поток
         running_bots[bot_id] = bot_thread
@@ -1482,12 +1637,73 @@ def run_bot_endpoint(bot_id: str, token_data: TokenData):
         logger.error(f"❌ Ошибка запуска бота {bot_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка запуска бота: {str(e)}")
 
+@app.post("/api/broadcast/{bot_id}/")
+def start_broadcast(bot_id: str, request: BroadcastRequest):
+    """Запускает рассылку сообщения всем известным пользователям запущенного бота"""
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Текст рассылки пуст")
+    try:
+        broadcast = get_broadcast_manager().start(bot_id, request.text, request.parse_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "broadcast": broadcast.progress()}
+
+@app.get("/api/broadcast/{bot_id}/")
+def list_broadcasts(bot_id: str):
+    """Рассылки запущенного бота с прогрессом"""
+    return {"broadcasts": [broadcast.progress() for broadcast in get_broadcast_manager().list(bot_id)]}
+
+@app.get("/api/broadcast/{bot_id}/{broadcast_id}/")
+def get_broadcast(bot_id: str, broadcast_id: str):
+    """Прогресс рассылки: отправлено, ошибки, заблокировавшие бота"""
+    broadcast = get_broadcast_manager().get(bot_id, broadcast_id)
+    if broadcast is None:
+        raise HTTPException(status_code=404, detail="Рассылка не найдена")
+    return broadcast.progress()
+
+@app.post("/api/broadcast/{bot_id}/{broadcast_id}/cancel/")
+def cancel_broadcast(bot_id: str, broadcast_id: str):
+    """Отменяет рассылку"""
+    broadcast = get_broadcast_manager().cancel(bot_id, broadcast_id)
+    if broadcast is None:
+        raise HTTPException(status_code=404, detail="Рассылка не найдена")
+    return {"status": "success", "broadcast": broadcast.progress()}
+
+@app.post("/api/webhook/{bot_id}/")
+def telegram_webhook(bot_id: str, payload: Dict, request: Request):
+    """Принимает обновления Telegram для бота, запущенного в режиме вебхука"""
+    bot = webhook_registry.get(bot_id, request.headers.get(SECRET_HEADER))
+    if bot is None:
+        raise HTTPException(status_code=403, detail="Неизвестный бот или неверный секрет")
+
+    try:
+        update = telebot.types.Update.de_json(payload)
+    except Exception as e:
+        logger.warning(f"⚠️ Некорректное обновление для бота {bot_id}: {e}")
+        raise HTTPException(status_code=400, detail="Некорректное обновление")
+
+    # Обработчики только ставятся в очередь диспетчера (при переполнении ждем в пуле FastAPI)
+    bot.process_new_updates([update])
+    return {"ok": True}
+
 @app.get("/api/health/")
 def health_check():
     return {
         "status": "healthy",
         "network": "ok" if check_telegram_connection() else "error",
         "active_bots": len(running_bots),
+        "bot_runtime": BOT_RUNTIME,
+        "update_mode": BOT_UPDATE_MODE,
+        "webhook_bots": len(webhook_registry),
+        "update_dispatcher": get_update_dispatcher().stats(),
+        "outbound": get_outbound_dispatcher().stats(),
+        "telegram_http": telegram_session.stats(),
+        "bot_identity": get_bot_identity().stats(),
+        "crm": get_crm_client().stats(),
+        "scenarios": get_scenario_cache().stats(),
+        "storage": get_bot_storage().stats(),
+        "chat_history": {bot_id: history.memory_report() for bot_id, history in list(chat_histories.items())},
+        "sessions": {bot_id: runner.session_stats() for bot_id, runner in list(scenario_runners.items())},
         "timestamp": time.time(),
         "message": "Server is running and accepting requests"
     }
@@ -1775,11 +1991,14 @@ def rename_bot(old_bot_id: str, new_bot_id: str):
         
         # Проверяем, что бот с старым ID существует
         old_file_path = bot_file(old_bot_id)
+        get_bot_storage().flush(old_file_path)
         if not os.path.exists(old_file_path):
             raise HTTPException(status_code=404, detail=f"Бот '{old_bot_id}' не найден")
         
         # Переименовываем файл сценария
         os.rename(old_file_path, new_file_path)
+        get_scenario_cache().invalidate(old_bot_id)
+        get_scenario_cache().invalidate(new_bot_id)
         
         # Обновляем токен в базе данных (если есть)
         try:
@@ -1799,6 +2018,8 @@ def rename_bot(old_bot_id: str, new_bot_id: str):
                 
                 # Обновляем право собственности
                 user_manager.register_bot_ownership(owner_id, new_bot_id)
+                # Журнал записей старого имени больше не используется
+                discard_booking_store(get_bot_directory(owner_id, old_bot_id))
         except Exception as e:
             logger.error(f"Ошибка обновления токена при переименовании бота: {e}")
         
@@ -1926,8 +2147,8 @@ def save_scenario_endpoint(bot_id: str, scenario: Scenario, user_id: Optional[st
     try:
         logger.info(f"Сохранение сценария для бота: {bot_id}")
         
-        # Сохраняем сценарий
-        save_scenario(bot_id, scenario, user_id)
+        # Сохраняем сценарий (автосохранения редактора объединяются)
+        save_scenario(bot_id, scenario, user_id, coalesce=True)
         
         logger.info(f"✅ Сценарий успешно сохранен для бота {bot_id}")
         return {"status": "success", "message": "Сценарий успешно сохранен"}